@@ -22,6 +22,10 @@ class AccessArguments(metaclass=ABCMeta):
     def add_run_arguments(self, parser):
         pass
 
+    @abstractmethod
+    def add_xfer_arguments(self, parser):
+        pass
+
     @abstractmethod
     def add_pin_argument(self, parser, name, default=None, required=False):
         pass
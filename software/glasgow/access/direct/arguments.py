@@ -38,6 +38,22 @@ class DirectArguments(AccessArguments):
             "--keep-voltage", action="store_true", default=False,
             help="do not change I/O port voltage")
 
+    def _positive_int(self, arg):
+        if not re.match(r"^[0-9]+$", arg) or int(arg) == 0:
+            self._arg_error("{} is not a positive integer", arg)
+        return int(arg)
+
+    def _add_xfer_arguments(self, parser):
+        parser.add_argument(
+            "--xfer-packets", metavar="COUNT", type=self._positive_int,
+            help="(advanced) submit USB transfers of COUNT packets")
+        parser.add_argument(
+            "--xfer-queue", metavar="COUNT", type=self._positive_int,
+            help="(advanced) keep up to COUNT USB transfers in flight in each direction")
+        parser.add_argument(
+            "--xfer-adaptive", default=False, action="store_true",
+            help="(advanced) adjust the size of IN transfers to the rate of incoming data")
+
     def _mandatory_pin_number(self, arg):
         if not re.match(r"^[0-9]+$", arg):
             self._arg_error("{} is not a valid pin number", arg)
@@ -131,3 +147,7 @@ class DirectArguments(AccessArguments):
 
     def add_run_arguments(self, parser):
         self._add_port_voltage_arguments(parser, default=None)
+        self._add_xfer_arguments(parser)
+
+    def add_xfer_arguments(self, parser):
+        self._add_xfer_arguments(parser)
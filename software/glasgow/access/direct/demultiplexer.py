@@ -50,8 +50,9 @@ _max_packets_per_ep = 1024
 # a read of dozens of megabytes, this can take seconds.
 #
 # To try and balance these effects, we choose a medium buffer size that should work well with most
-# applications. It's possible that this will need to become customizable later, but for now
-# a single fixed value works.
+# applications. Applets (and users, via the command line) can override it per interface; they can
+# also request the size of IN transfers to be adapted to the amount of data the device actually
+# returns, which suits applets whose traffic alternates between bursts and idle periods.
 _packets_per_xfer = 32
 
 # Queue as many transfers as we can, but no more than 16, as the returns beyond that point
@@ -83,6 +84,14 @@ class DirectDemultiplexer(AccessDemultiplexer):
         assert mux_interface._pipe_num not in self._claimed
         self._claimed.add(mux_interface._pipe_num)
 
+        # Transfer parameters specified on the command line override those requested by applets.
+        if getattr(args, "xfer_packets", None) is not None:
+            kwargs["packets_per_xfer"] = args.xfer_packets
+        if getattr(args, "xfer_queue", None) is not None:
+            kwargs["xfers_per_queue"] = args.xfer_queue
+        if getattr(args, "xfer_adaptive", False):
+            kwargs["adaptive_xfers"] = True
+
         iface = DirectDemultiplexerInterface(self.device, applet, mux_interface, **kwargs)
         self._interfaces.append(iface)
 
@@ -140,7 +149,8 @@ class DirectDemultiplexer(AccessDemultiplexer):
 
 class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
     def __init__(self, device, applet, mux_interface,
-                 read_buffer_size=None, write_buffer_size=None):
+                 read_buffer_size=None, write_buffer_size=None,
+                 packets_per_xfer=None, xfers_per_queue=None, adaptive_xfers=False):
         super().__init__(device, applet)
 
         self._write_buffer_size = write_buffer_size
@@ -148,6 +158,24 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
         self._in_pushback  = asyncio.Condition()
         self._out_inflight = 0
 
+        if packets_per_xfer is None:
+            packets_per_xfer = _packets_per_xfer
+        packets_per_xfer = max(1, min(packets_per_xfer, _max_packets_per_ep))
+        if xfers_per_queue is None:
+            xfers_per_queue = min(_xfers_per_queue, _max_packets_per_ep // packets_per_xfer)
+        elif packets_per_xfer * xfers_per_queue > _max_packets_per_ep:
+            self.logger.warning("FIFO: reducing transfer queue depth from %d to %d to stay "
+                                "within usbfs limits",
+                                xfers_per_queue, _max_packets_per_ep // packets_per_xfer)
+            xfers_per_queue = _max_packets_per_ep // packets_per_xfer
+        self._packets_per_xfer = packets_per_xfer
+        self._xfers_per_queue  = max(1, xfers_per_queue)
+        self._adaptive_xfers   = adaptive_xfers
+        # With adaptive transfers, the size of IN transfers varies between one packet and
+        # as many packets as would keep the entire queue within usbfs limits.
+        self._in_packets_per_xfer     = self._packets_per_xfer
+        self._max_in_packets_per_xfer = _max_packets_per_ep // self._xfers_per_queue
+
         self._pipe_num   = mux_interface._pipe_num
         self._addr_reset = mux_interface._addr_reset
 
@@ -203,7 +231,7 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
         # streaming data, there are no overflows. (This is perhaps not the best way to implement
         # an applet, but we can support it easily enough, and it avoids surprise overflows.)
         self.logger.trace("FIFO: pipelining reads")
-        for _ in range(_xfers_per_queue):
+        for _ in range(self._xfers_per_queue):
             self._in_tasks.submit(self._in_task())
         # Give the IN tasks a chance to submit their transfers before deasserting reset.
         await asyncio.sleep(0)
@@ -218,12 +246,29 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
                     self.logger.trace("FIFO: read pushback")
                     await self._in_pushback.wait()
 
-        size = self._in_packet_size * _packets_per_xfer
+        size = self._in_packet_size * self._in_packets_per_xfer
         data = await self.device.bulk_read(self._endpoint_in, size)
         self._in_buffer.write(data)
+        if self._adaptive_xfers:
+            self._adapt_in_xfer_size(len(data), size)
 
         self._in_tasks.submit(self._in_task())
 
+    def _adapt_in_xfer_size(self, length, size):
+        # A full transfer means that the device had at least as much data ready as was requested,
+        # so larger transfers would reduce CPU load without adding latency. A mostly empty
+        # transfer means that the device is producing data slowly, so smaller transfers would
+        # return it sooner.
+        if length == size and self._in_packets_per_xfer < self._max_in_packets_per_xfer:
+            self._in_packets_per_xfer = min(self._in_packets_per_xfer * 2,
+                                            self._max_in_packets_per_xfer)
+            self.logger.trace("FIFO: growing IN transfers to %d packets",
+                              self._in_packets_per_xfer)
+        elif length < size // 4 and self._in_packets_per_xfer > 1:
+            self._in_packets_per_xfer //= 2
+            self.logger.trace("FIFO: shrinking IN transfers to %d packets",
+                              self._in_packets_per_xfer)
+
     async def read(self, length=None, *, flush=True):
         if flush and len(self._out_buffer) > 0:
             # Flush the buffer, so that everything written before the read reaches the device.
@@ -266,7 +311,7 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
 
     def _out_slice(self):
         # Fast path: read as much contiguous data as possible, up to our transfer size.
-        size = self._out_packet_size * _packets_per_xfer
+        size = self._out_packet_size * self._packets_per_xfer
         data = self._out_buffer.read(size)
 
         if len(data) < self._out_packet_size:
@@ -282,7 +327,7 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
 
     @property
     def _out_threshold(self):
-        out_xfer_size = self._out_packet_size * _packets_per_xfer
+        out_xfer_size = self._out_packet_size * self._packets_per_xfer
         if self._write_buffer_size is None:
             return out_xfer_size
         else:
@@ -337,7 +382,7 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
         # This provides predictable write behavior; only _packets_per_xfer packet writes are
         # automatically submitted, and only the minimum necessary number of tasks are scheduled on
         # calls to `write`.
-        while len(self._out_tasks) < _xfers_per_queue and \
+        while len(self._out_tasks) < self._xfers_per_queue and \
                     len(self._out_buffer) >= self._out_threshold:
             self._out_tasks.submit(self._out_task(self._out_slice()))
 
@@ -346,16 +391,16 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
 
         # First, we ensure we can submit one more task. (There can be more tasks than
         # _xfers_per_queue because a task may spawn another one just before it terminates.)
-        if len(self._out_tasks) >= _xfers_per_queue:
+        if len(self._out_tasks) >= self._xfers_per_queue:
             self._out_stalls += 1
-        while len(self._out_tasks) >= _xfers_per_queue:
+        while len(self._out_tasks) >= self._xfers_per_queue:
             await self._out_tasks.wait_one()
 
         # At this point, the buffer can contain at most _packets_per_xfer packets worth
         # of data, as anything beyond that crosses the threshold of automatic submission.
         # So, we can simply submit the rest of data, which by definition fits into a single
         # transfer.
-        assert len(self._out_buffer) <= self._out_packet_size * _packets_per_xfer
+        assert len(self._out_buffer) <= self._out_packet_size * self._packets_per_xfer
         if self._out_buffer:
             data = bytearray()
             while self._out_buffer:
@@ -388,3 +433,94 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
                          self._in_tasks.total_wait_count)
         self.logger.info("  write wakeups : %d",
                          self._out_tasks.total_wait_count)
+        self.logger.info("  xfer size     : %d/%d packets (IN/OUT)",
+                         self._in_packets_per_xfer, self._packets_per_xfer)
+        self.logger.info("  xfer queue    : %d",
+                         self._xfers_per_queue)
+
+# -------------------------------------------------------------------------------------------------
+
+import logging
+import unittest
+
+
+class DirectDemultiplexerInterfaceTestCase(unittest.TestCase):
+    class MockUSBEndpoint:
+        def __init__(self, address):
+            self._address = address
+
+        def getAddress(self):
+            return self._address
+
+        def getMaxPacketSize(self):
+            return 512
+
+    class MockUSBDevice:
+        # Models just enough of a libusb device with a single pipe to construct an interface.
+        def __init__(self):
+            self.usb_handle = self
+
+        def getDevice(self):
+            return self
+
+        def getConfiguration(self):
+            return 1
+
+        def iterConfigurations(self):
+            return [self]
+
+        def getConfigurationValue(self):
+            return 1
+
+        def iterInterfaces(self):
+            return [self]
+
+        def iterSettings(self):
+            return [None, self]
+
+        def iterEndpoints(self):
+            return [DirectDemultiplexerInterfaceTestCase.MockUSBEndpoint(0x82),
+                    DirectDemultiplexerInterfaceTestCase.MockUSBEndpoint(0x02)]
+
+        def claimInterface(self, pipe_num):
+            return None
+
+    class MockApplet:
+        logger = logging.getLogger(__name__)
+
+    class MockMuxInterface:
+        _pipe_num   = 0
+        _addr_reset = 0
+
+    def make_iface(self, **kwargs):
+        return DirectDemultiplexerInterface(self.MockUSBDevice(), self.MockApplet(),
+                                            self.MockMuxInterface(), **kwargs)
+
+    def test_queue_limit(self):
+        with self.assertLogs(__name__, level="WARNING"):
+            iface = self.make_iface(packets_per_xfer=128, xfers_per_queue=16)
+        self.assertEqual(iface._packets_per_xfer, 128)
+        self.assertEqual(iface._xfers_per_queue, 8)
+
+    def test_adapt_grow(self):
+        iface = self.make_iface(packets_per_xfer=32, xfers_per_queue=16, adaptive_xfers=True)
+        self.assertEqual(iface._max_in_packets_per_xfer, 64)
+        iface._adapt_in_xfer_size(512 * 32, 512 * 32)
+        self.assertEqual(iface._in_packets_per_xfer, 64)
+        iface._adapt_in_xfer_size(512 * 64, 512 * 64)
+        self.assertEqual(iface._in_packets_per_xfer, 64)
+
+    def test_adapt_shrink(self):
+        iface = self.make_iface(packets_per_xfer=4, adaptive_xfers=True)
+        iface._adapt_in_xfer_size(511, 512 * 4)
+        self.assertEqual(iface._in_packets_per_xfer, 2)
+        iface._adapt_in_xfer_size(0, 512 * 2)
+        self.assertEqual(iface._in_packets_per_xfer, 1)
+        iface._adapt_in_xfer_size(0, 512 * 1)
+        self.assertEqual(iface._in_packets_per_xfer, 1)
+
+    def test_adapt_steady(self):
+        iface = self.make_iface(packets_per_xfer=32, adaptive_xfers=True)
+        iface._adapt_in_xfer_size(512 * 8, 512 * 32)
+        iface._adapt_in_xfer_size(512 * 31, 512 * 32)
+        self.assertEqual(iface._in_packets_per_xfer, 32)
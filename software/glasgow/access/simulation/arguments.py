@@ -65,3 +65,6 @@ class SimulationArguments(AccessArguments):
 
     def add_run_arguments(self, parser):
         pass
+
+    def add_xfer_arguments(self, parser):
+        pass
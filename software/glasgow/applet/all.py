@@ -1,54 +1,181 @@
-from .internal.selftest import SelfTestApplet
-from .internal.benchmark import BenchmarkApplet
-
-from .interface.analyzer import AnalyzerApplet
-from .interface.uart import UARTApplet
-from .interface.spi_controller import SPIControllerApplet
-from .interface.i2c_initiator import I2CInitiatorApplet
-from .interface.i2c_target import I2CTargetApplet
-from .interface.jtag_pinout import JTAGPinoutApplet
-from .interface.jtag_probe import JTAGProbeApplet
-from .interface.jtag_openocd import JTAGOpenOCDApplet
-from .interface.jtag_svf import JTAGSVFApplet
-from .interface.ps2_host import PS2HostApplet
-from .interface.sbw_probe import SpyBiWireProbeApplet
-
-from .memory._24x import Memory24xApplet
-from .memory._25x import Memory25xApplet
-from .memory.onfi import MemoryONFIApplet
-from .memory.prom import MemoryPROMApplet
-from .memory.floppy import MemoryFloppyApplet
-
-from .debug.arc import DebugARCApplet
-from .debug.arm.jtag import DebugARMJTAGApplet
-from .debug.mips import DebugMIPSApplet
-
-from .program.avr.spi import ProgramAVRSPIApplet
-from .program.ice40_flash import ProgramICE40FlashApplet
-from .program.ice40_sram import ProgramICE40SRAMApplet
-from .program.m16c import ProgramM16CApplet
-from .program.mec16xx import ProgramMEC16xxApplet
-from .program.nrf24lx1 import ProgramNRF24Lx1Applet
-from .program.xc6s import ProgramXC6SApplet
-from .program.xc9500xl import ProgramXC9500XLApplet
-
-from .control.tps6598x import ControlTPS6598xApplet
-
-from .sensor.bmx280 import SensorBMx280Applet
-from .sensor.hx711 import SensorHX711Applet
-from .sensor.ina260 import SensorINA260Applet
-from .sensor.mouse_ps2 import SensorMousePS2Applet
-from .sensor.pmsx003 import SensorPMSx003Applet
-from .sensor.scd30 import SensorSCD30Applet
-
-from .display.hd44780 import DisplayHD44780Applet
-from .display.pdi import DisplayPDIApplet
-
-from .audio.dac import AudioDACApplet
-from .audio.yamaha_opx import AudioYamahaOPxApplet
-
-from .video.rgb_input import VideoRGBInputApplet
-from .video.vga_output import VGAOutputApplet
-from .video.ws2812_output import VideoWS2812OutputApplet
-
-from .radio.nrf24l01 import RadioNRF24L01Applet
+import importlib
+from collections import namedtuple
+
+
+__all__ = ["GlasgowAppletManifest", "applets"]
+
+
+class GlasgowAppletManifest(namedtuple("GlasgowAppletManifest", (
+        "name", "module", "class_name", "help", "preview", "required_revision", "tool_help"),
+        defaults=(False, "A0", None))):
+    """
+    A static description of an applet.
+
+    The manifest contains everything that is necessary to list an applet on the command line,
+    so that the applet module (which imports nMigen and often a number of protocol and database
+    modules) is only imported once the applet is actually used.
+    """
+    def load(self):
+        """Import the applet module and return the applet class."""
+        module = importlib.import_module(self.module, __package__)
+        return getattr(module, self.class_name)
+
+
+applets = {manifest.name: manifest for manifest in [
+    GlasgowAppletManifest("selftest", ".internal.selftest", "SelfTestApplet",
+        help="diagnose hardware faults"),
+    GlasgowAppletManifest("benchmark", ".internal.benchmark", "BenchmarkApplet",
+        help="evaluate communication performance"),
+
+    GlasgowAppletManifest("analyzer", ".interface.analyzer", "AnalyzerApplet",
+        help="capture logic waveforms", tool_help="convert analyzer captures"),
+    GlasgowAppletManifest("uart", ".interface.uart", "UARTApplet",
+        help="communicate via UART"),
+    GlasgowAppletManifest("spi-controller", ".interface.spi_controller", "SPIControllerApplet",
+        help="initiate SPI transactions"),
+    GlasgowAppletManifest("i2c-initiator", ".interface.i2c_initiator", "I2CInitiatorApplet",
+        help="initiate I²C transactions", required_revision="C0"),
+    GlasgowAppletManifest("i2c-target", ".interface.i2c_target", "I2CTargetApplet",
+        help="accept I²C transactions", required_revision="C0"),
+    GlasgowAppletManifest("jtag-pinout", ".interface.jtag_pinout", "JTAGPinoutApplet",
+        help="automatically determine JTAG pinout"),
+    GlasgowAppletManifest("jtag-probe", ".interface.jtag_probe", "JTAGProbeApplet",
+        help="test integrated circuits via IEEE 1149.1 JTAG"),
+    GlasgowAppletManifest("jtag-openocd", ".interface.jtag_openocd", "JTAGOpenOCDApplet",
+        help="expose JTAG via OpenOCD remote bitbang interface"),
+    GlasgowAppletManifest("jtag-svf", ".interface.jtag_svf", "JTAGSVFApplet",
+        help="play SVF test vectors via JTAG"),
+    GlasgowAppletManifest("ps2-host", ".interface.ps2_host", "PS2HostApplet",
+        help="communicate with IBM PS/2 peripherals", required_revision="C0"),
+    GlasgowAppletManifest("sbw-probe", ".interface.sbw_probe", "SpyBiWireProbeApplet",
+        help="probe microcontrollers via TI Spy-Bi-Wire", required_revision="C0"),
+
+    GlasgowAppletManifest("memory-24x", ".memory._24x", "Memory24xApplet",
+        help="read and write 24-series I²C EEPROM memories", required_revision="C0"),
+    GlasgowAppletManifest("memory-25x", ".memory._25x", "Memory25xApplet",
+        help="read and write 25-series SPI Flash memories"),
+    GlasgowAppletManifest("memory-onfi", ".memory.onfi", "MemoryONFIApplet",
+        help="read and write ONFI-like NAND Flash memories", preview=True),
+    GlasgowAppletManifest("memory-prom", ".memory.prom", "MemoryPROMApplet",
+        help="read and rescue parallel EPROMs, EEPROMs, and Flash memories",
+        tool_help="display statistics of parallel EPROMs, EEPROMs, and Flash memories"),
+    GlasgowAppletManifest("memory-floppy", ".memory.floppy", "MemoryFloppyApplet",
+        help="read and write disks using IBM/Shugart floppy drives", preview=True,
+        required_revision="C0",
+        tool_help="manipulate raw disk images captured from IBM/Shugart floppy drives"),
+
+    GlasgowAppletManifest("debug-arc", ".debug.arc", "DebugARCApplet",
+        help="debug ARC processors via JTAG"),
+    GlasgowAppletManifest("debug-arm-jtag", ".debug.arm.jtag", "DebugARMJTAGApplet",
+        help="debug ARM processors via JTAG", preview=True),
+    GlasgowAppletManifest("debug-mips", ".debug.mips", "DebugMIPSApplet",
+        help="debug MIPS processors via EJTAG", preview=True),
+
+    GlasgowAppletManifest("program-avr-spi", ".program.avr.spi", "ProgramAVRSPIApplet",
+        help="program Microchip (Atmel) AVR microcontrollers via SPI"),
+    GlasgowAppletManifest("program-ice40-flash", ".program.ice40_flash", "ProgramICE40FlashApplet",
+        help="program 25-series Flash memories used with iCE40 FPGAs"),
+    GlasgowAppletManifest("program-ice40-sram", ".program.ice40_sram", "ProgramICE40SRAMApplet",
+        help="program SRAM of iCE40 FPGAs"),
+    GlasgowAppletManifest("program-m16c", ".program.m16c", "ProgramM16CApplet",
+        help="program Renesas M16C microcomputers via UART"),
+    GlasgowAppletManifest("program-mec16xx", ".program.mec16xx", "ProgramMEC16xxApplet",
+        help="program Microchip MEC16xx embedded controller via JTAG"),
+    GlasgowAppletManifest("program-nrf24lx1", ".program.nrf24lx1", "ProgramNRF24Lx1Applet",
+        help="program nRF24LE1 and nRF24LU1+ RF microcontrollers"),
+    GlasgowAppletManifest("program-xc6s", ".program.xc6s", "ProgramXC6SApplet",
+        help="program Xilinx Spartan-6 FPGAs via JTAG", preview=True),
+    GlasgowAppletManifest("program-xc9500xl", ".program.xc9500xl", "ProgramXC9500XLApplet",
+        help="program Xilinx XC9500XL CPLDs via JTAG",
+        tool_help="manipulate Xilinx XC9500XL CPLD bitstreams"),
+
+    GlasgowAppletManifest("control-tps6598x", ".control.tps6598x", "ControlTPS6598xApplet",
+        help="configure TPS6598x USB PD controllers", required_revision="C0"),
+
+    GlasgowAppletManifest("sensor-bmx280", ".sensor.bmx280", "SensorBMx280Applet",
+        help="measure temperature, pressure, and humidity with Bosch BMx280 sensors",
+        required_revision="C0"),
+    GlasgowAppletManifest("sensor-hx711", ".sensor.hx711", "SensorHX711Applet",
+        help="measure voltage with AVIA Semiconductor HX711"),
+    GlasgowAppletManifest("sensor-ina260", ".sensor.ina260", "SensorINA260Applet",
+        help="measure voltage, current and power with TI INA260 sensors", required_revision="C0"),
+    GlasgowAppletManifest("sensor-mouse-ps2", ".sensor.mouse_ps2", "SensorMousePS2Applet",
+        help="receive axis and button information from PS/2 mice", required_revision="C0"),
+    GlasgowAppletManifest("sensor-pmsx003", ".sensor.pmsx003", "SensorPMSx003Applet",
+        help="measure air quality with Plantower PMx003 sensors"),
+    GlasgowAppletManifest("sensor-scd30", ".sensor.scd30", "SensorSCD30Applet",
+        help="measure CO₂, humidity, and temperature with Sensirion SCD30 sensors",
+        required_revision="C0"),
+
+    GlasgowAppletManifest("display-hd44780", ".display.hd44780", "DisplayHD44780Applet",
+        help="display characters on HD44780-compatible LCDs", preview=True, required_revision="C0"),
+    GlasgowAppletManifest("display-pdi", ".display.pdi", "DisplayPDIApplet",
+        help="display images on Pervasive Display Inc EPD panels"),
+
+    GlasgowAppletManifest("audio-dac", ".audio.dac", "AudioDACApplet",
+        help="play sound using a ΣΔ-DAC"),
+    GlasgowAppletManifest("audio-yamaha-opx", ".audio.yamaha_opx", "AudioYamahaOPxApplet",
+        help="drive and record Yamaha OP* FM synthesizers"),
+
+    GlasgowAppletManifest("video-rgb-input", ".video.rgb_input", "VideoRGBInputApplet",
+        help="capture video stream from RGB555 LCD bus", preview=True),
+    GlasgowAppletManifest("video-vga-output", ".video.vga_output", "VGAOutputApplet",
+        help="display video via VGA"),
+    GlasgowAppletManifest("video-ws2812-output", ".video.ws2812_output", "VideoWS2812OutputApplet",
+        help="display video via WS2812 LEDs"),
+
+    GlasgowAppletManifest("radio-nrf24l01", ".radio.nrf24l01", "RadioNRF24L01Applet",
+        help="transmit and receive using nRF24L01(+) RF PHY"),
+
+]}
+
+# -------------------------------------------------------------------------------------------------
+
+import unittest
+
+
+class GlasgowAppletManifestTestCase(unittest.TestCase):
+    def test_manifest(self):
+        for name, manifest in applets.items():
+            with self.subTest(applet=name):
+                applet = manifest.load()
+                self.assertEqual(applet.name, manifest.name)
+                self.assertEqual(applet.help, manifest.help)
+                self.assertEqual(applet.preview, manifest.preview)
+                self.assertEqual(applet.required_revision, manifest.required_revision)
+                if hasattr(applet, "tool_cls"):
+                    self.assertEqual(applet.tool_cls.help, manifest.tool_help)
+                else:
+                    self.assertIsNone(manifest.tool_help)
+
+    def test_complete(self):
+        from . import GlasgowApplet
+        for manifest in applets.values():
+            manifest.load()
+        self.assertEqual(set(GlasgowApplet.all_applets), set(applets))
+
+
+class GlasgowCLIStartupTestCase(unittest.TestCase):
+    # Generous enough to never fail on a loaded CI machine, yet well under the time it takes
+    # to import every applet module.
+    STARTUP_BUDGET = 3.0
+
+    def test_startup(self):
+        import sys
+        import json
+        import subprocess
+        code = (
+            "import sys, json, time\n"
+            "started_at = time.perf_counter()\n"
+            "from glasgow.cli import get_argparser\n"
+            "get_argparser().parse_args(['list'])\n"
+            "print(json.dumps({'elapsed': time.perf_counter() - started_at,\n"
+            "                  'modules': sorted(sys.modules)}))\n"
+        )
+        output = subprocess.check_output([sys.executable, "-c", code])
+        result = json.loads(output)
+        applet_modules = [module for module in result["modules"]
+                          if any(module == "{}.{}".format(__package__, manifest.module[1:])
+                                 for manifest in applets.values())]
+        self.assertEqual(applet_modules, [])
+        self.assertLess(result["elapsed"], self.STARTUP_BUDGET)
@@ -135,7 +135,7 @@
 #     Good general-purpose OPL3 test.
 
 from abc import ABCMeta, abstractmethod, abstractproperty
-import os.path
+import os
 import logging
 import argparse
 import struct
@@ -144,12 +144,17 @@ import aiohttp, aiohttp.web
 import hashlib
 import gzip
 import io
+import json
+import time
+from collections import OrderedDict, deque
 from nmigen.compat import *
 from nmigen.compat.genlib.cdc import MultiReg
 
 from ....gateware.pads import *
 from ....gateware.clockgen import *
 from ....protocol.vgm import *
+from ....protocol.vgm import SAMPLE_RATE as VGM_SAMPLE_RATE
+from ....target.cache import GlasgowFileCache, default_cache_dir
 from ... import *
 
 
@@ -386,6 +391,9 @@ class YamahaOPxInterface(metaclass=ABCMeta):
         self._instant_writes = instant_writes
         self._phase_accum    = 0
 
+        # When not None, commands are appended here instead of being sent to the device.
+        self._compiled = None
+
         self.filter = filter
 
         self._feature_level  = 1
@@ -442,6 +450,32 @@ class YamahaOPxInterface(metaclass=ABCMeta):
         for addr in self._registers:
             await self.write_register(addr, 0x00, check_feature=False)
 
+    async def _write_commands(self, commands):
+        if self._compiled is not None:
+            self._compiled.extend(commands)
+        else:
+            await self.lower.write(commands)
+
+    async def compile(self, issue_commands):
+        """
+        Run the coroutine function ``issue_commands``, which issues register writes and waits
+        through this interface, and return the resulting device command stream instead of
+        sending it. The stream can be sent later with :meth:`write_compiled`.
+        """
+        assert self._compiled is None
+        self._compiled = bytearray()
+        try:
+            await issue_commands()
+            return bytes(self._compiled)
+        finally:
+            self._compiled = None
+
+    async def write_compiled(self, commands, chunk_size=4096):
+        self._log("write %d compiled command bytes", len(commands))
+        commands = memoryview(commands)
+        for offset in range(0, len(commands), chunk_size):
+            await self.lower.write(commands[offset:offset + chunk_size])
+
     async def enable(self):
         self._log("enable")
         await self.lower.write([OP_ENABLE|1])
@@ -498,7 +532,7 @@ class YamahaOPxInterface(metaclass=ABCMeta):
                       address, data)
         addr_high = (address >> 8) << 1
         addr_low  = address & 0xff
-        await self.lower.write([OP_WRITE|addr_high|0, addr_low, OP_WRITE|1, data])
+        await self._write_commands([OP_WRITE|addr_high|0, addr_low, OP_WRITE|1, data])
 
     async def wait_clocks(self, count):
         if self.filter is not None:
@@ -525,9 +559,9 @@ class YamahaOPxInterface(metaclass=ABCMeta):
             self._log("wait %d clocks",
                       count)
         while count > 65535:
-            await self.lower.write([OP_WAIT, *struct.pack(">H", 65535)])
+            await self._write_commands([OP_WAIT, *struct.pack(">H", 65535)])
             count -= 65535
-        await self.lower.write([OP_WAIT, *struct.pack(">H", count)])
+        await self._write_commands([OP_WAIT, *struct.pack(">H", count)])
 
     async def read_samples(self, count):
         self._log("read %d samples", count)
@@ -728,20 +762,80 @@ class YamahaOPMInterface(YamahaOPxInterface):
             await self.write_register(address, 0xC0) # RL enable
 
 
+class YamahaVGMStreamCache:
+    """
+    An in-memory cache of compiled VGM command streams, keyed by the digest of the VGM file,
+    the synthesizer, the clock rate, and the interface state that the waits in the stream depend
+    on. The least recently used streams are evicted once the total size of the cache exceeds
+    ``max_size`` bytes.
+    """
+    def __init__(self, max_size=64 * 1024 * 1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._size    = 0
+
+    def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, commands, phase_accum):
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key)[0])
+        self._entries[key] = (commands, phase_accum)
+        self._size += len(commands)
+        while self._size > self.max_size:
+            _, (commands, _) = self._entries.popitem(last=False)
+            self._size -= len(commands)
+
+
 class YamahaVGMStreamPlayer(VGMStreamPlayer):
-    def __init__(self, reader, opx_iface, clock_rate):
+    def __init__(self, reader, opx_iface, clock_rate, *, digest=None, cache=None):
         self._reader     = reader
         self._opx_iface  = opx_iface
+        self._digest     = digest
+        self._cache      = cache
 
         self.clock_rate  = clock_rate
         self.sample_time = opx_iface.sample_clocks / self.clock_rate
 
+    async def _issue_commands(self):
+        # Flush out the state after reset.
+        await self._opx_iface.wait_clocks(self._opx_iface.sample_clocks * 1024)
+        await self._reader.parse_data(self)
+
+    async def compile(self):
+        """
+        Convert the VGM command stream into a device command stream. If a cache and a digest of
+        the VGM file were provided, the compiled stream is looked up in and added to the cache.
+        A command filter may be stateful, so streams are never cached if one is used.
+        """
+        opx_iface = self._opx_iface
+        if self._cache is None or self._digest is None or opx_iface.filter is not None:
+            key = None
+        else:
+            # The compiled waits depend on the phase accumulator at the start of compilation,
+            # which is not cleared by reset().
+            key = (self._digest, type(opx_iface).__name__, self.clock_rate,
+                   opx_iface._instant_writes, opx_iface._phase_accum)
+
+        if key is not None:
+            cached = self._cache.get(key)
+            if cached is not None:
+                opx_iface._log("using cached command stream")
+                commands, opx_iface._phase_accum = cached
+                return commands
+
+        commands = await opx_iface.compile(self._issue_commands)
+        if key is not None:
+            self._cache.put(key, commands, opx_iface._phase_accum)
+        return commands
+
     async def play(self):
         try:
+            commands = await self.compile()
             await self._opx_iface.enable()
-            # Flush out the state after reset.
-            await self._opx_iface.wait_clocks(self._opx_iface.sample_clocks * 1024)
-            await self._reader.parse_data(self)
+            await self._opx_iface.write_compiled(commands)
         finally:
             # Various parts of our stack are not completely synchronized to each other, resulting
             # in small mismatches in calculated and produced sample counts. Pad the trailing end
@@ -778,12 +872,148 @@ class YamahaVGMStreamPlayer(VGMStreamPlayer):
     async def wait_seconds(self, delay):
         await self._opx_iface.wait_clocks(int(delay * self.clock_rate))
 
+    async def wait_samples(self, count):
+        await self._opx_iface.wait_clocks(count * self.clock_rate // VGM_SAMPLE_RATE)
+
+
+class YamahaOPxRenderCache(GlasgowFileCache):
+    """
+    An on-disk cache of recorded sample streams, addressed by a digest of everything that affects
+    the recording. Entries are stored as ``<digest>.pcm`` files.
+    """
+    suffix = ".pcm"
+
+    def __init__(self, cache_dir=None, *, max_size=1024 * 1024 * 1024):
+        super().__init__(cache_dir or default_cache_dir("yamaha-opx"), max_size=max_size)
+
+    @staticmethod
+    def key(vgm_digest, device, chip, voltage, filter_id):
+        params = [vgm_digest.hex(), device, chip, "{:.2f}".format(voltage), filter_id]
+        return hashlib.sha256(json.dumps(params).encode()).hexdigest()
+
+
+class YamahaOPxJobQueue:
+    """
+    A queue granting exclusive use of the synthesizer to one job at a time. Jobs are granted
+    round-robin between clients, so a client submitting many jobs cannot starve the others.
+    """
+    class _Job:
+        def __init__(self, client):
+            self.client   = client
+            self.position = None
+            self.granted  = asyncio.Future()
+            self.changed  = asyncio.Event()
+
+    def __init__(self):
+        self._clients = OrderedDict()
+        self._busy    = False
+
+    def __len__(self):
+        return sum(len(jobs) for jobs in self._clients.values())
+
+    def _update(self):
+        if not self._busy and self._clients:
+            client, jobs = next(iter(self._clients.items()))
+            job = jobs.popleft()
+            del self._clients[client]
+            if jobs:
+                self._clients[client] = jobs # move to the back
+            self._busy = True
+            job.granted.set_result(None)
+
+        # Position is 1-based among the waiting jobs, with clients interleaved.
+        queues = [list(jobs) for jobs in self._clients.values()]
+        position = 1
+        for index in range(max(map(len, queues), default=0)):
+            for jobs in queues:
+                if index < len(jobs):
+                    if jobs[index].position != position:
+                        jobs[index].position = position
+                        jobs[index].changed.set()
+                    position += 1
+
+    def _remove(self, job):
+        jobs = self._clients[job.client]
+        jobs.remove(job)
+        if not jobs:
+            del self._clients[job.client]
+        self._update()
+
+    async def acquire(self, client, report=None):
+        """
+        Wait until the synthesizer is granted to a job of ``client``. While waiting,
+        ``await report(position)`` is called whenever the job moves in the queue.
+        """
+        job = self._Job(client)
+        self._clients.setdefault(client, deque()).append(job)
+        self._update()
+        try:
+            while not job.granted.done():
+                if report is not None:
+                    await report(job.position)
+                job.changed.clear()
+                changed = asyncio.ensure_future(job.changed.wait())
+                try:
+                    await asyncio.wait([job.granted, changed],
+                                       return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    changed.cancel()
+        except:
+            if job.granted.done():
+                self.release()
+            else:
+                self._remove(job)
+            raise
+
+    def release(self):
+        assert self._busy
+        self._busy = False
+        self._update()
+
+
+class YamahaOPxWebMetrics:
+    def __init__(self):
+        self.requests         = 0
+        self.cache_hits       = 0
+        self.cache_misses     = 0
+        self.queue_wait_count = 0
+        self.queue_wait_sum   = 0.0
+        self.queue_wait_max   = 0.0
+
+    @property
+    def hit_rate(self):
+        if self.cache_hits + self.cache_misses == 0:
+            return 0.0
+        return self.cache_hits / (self.cache_hits + self.cache_misses)
+
+    def add_queue_wait(self, seconds):
+        self.queue_wait_count += 1
+        self.queue_wait_sum   += seconds
+        self.queue_wait_max    = max(self.queue_wait_max, seconds)
+
+    def format(self, queue_length):
+        return "".join("glasgow_opx_{} {}\n".format(name, value) for name, value in [
+            ("requests_total",           self.requests),
+            ("cache_hits_total",         self.cache_hits),
+            ("cache_misses_total",       self.cache_misses),
+            ("cache_hit_rate",           self.hit_rate),
+            ("queue_length",             queue_length),
+            ("queue_wait_seconds_count", self.queue_wait_count),
+            ("queue_wait_seconds_sum",   self.queue_wait_sum),
+            ("queue_wait_seconds_max",   self.queue_wait_max),
+        ])
+
 
 class YamahaOPxWebInterface:
-    def __init__(self, logger, opx_iface, set_voltage):
+    def __init__(self, logger, opx_iface, set_voltage, *, render_cache=None, filter_id=None):
         self._logger    = logger
         self._opx_iface = opx_iface
-        self._lock      = asyncio.Lock()
+        self._queue     = YamahaOPxJobQueue()
+        self._metrics   = YamahaOPxWebMetrics()
+        self._vgm_cache = YamahaVGMStreamCache()
+
+        self._render_cache = render_cache
+        self._filter_id    = filter_id
 
         self._set_voltage = set_voltage
 
@@ -830,7 +1060,8 @@ class YamahaOPxWebInterface:
             self._logger.warning("web: broken upload: %s", vgm_msg.data)
             return sock
 
-        digest = hashlib.sha256(vgm_data).hexdigest()[:16]
+        vgm_digest = hashlib.sha256(vgm_data).digest()
+        digest = vgm_digest.hex()[:16]
         self._logger.info("web: %s: submitted by %s",
                           digest, request.remote)
 
@@ -865,7 +1096,8 @@ class YamahaOPxWebInterface:
             self._logger.info("web: %s: VGM is looped for %.2f/%.2f s",
                               digest, vgm_reader.loop_seconds, vgm_reader.total_seconds)
 
-            vgm_player = YamahaVGMStreamPlayer(vgm_reader, self._opx_iface, clock_rate)
+            vgm_player = YamahaVGMStreamPlayer(vgm_reader, self._opx_iface, clock_rate,
+                                               digest=vgm_digest, cache=self._vgm_cache)
         except ValueError as e:
             self._logger.warning("web: %s: broken upload: %s",
                                  digest, str(e))
@@ -875,9 +1107,67 @@ class YamahaOPxWebInterface:
         sample_rate = 1 / vgm_player.sample_time
         self._logger.info("web: %s: sample rate %d", digest, sample_rate)
 
-        async with self._lock:
+        try:
+            voltage = float(headers["Voltage"])
+        except Exception as error:
+            await sock.close(code=2000, message=str(error))
+            return sock
+
+        total_samples = int(vgm_reader.total_seconds * sample_rate)
+        if vgm_reader.loop_samples in (0, vgm_reader.total_samples):
+            # Either 0 or the entire VGM here means we'll loop the complete track.
+            loop_skip_to = 0
+        else:
+            loop_skip_to = int((vgm_reader.total_seconds - vgm_reader.loop_seconds)
+                               * sample_rate)
+        stream_headers = {
+            "Chip": vgm_reader.chips()[0],
+            "Channel-Count": self._opx_iface.channel_count,
+            "Sample-Rate": sample_rate,
+            "Total-Samples": total_samples,
+            "Loop-Skip-To": loop_skip_to,
+        }
+
+        self._metrics.requests += 1
+        if self._render_cache is None:
+            render_key = None
+        else:
+            # The recording depends both on the synthesizer that is attached and on the chip
+            # the VGM file was written for, which could be e.g. an OPL2 played on an OPL3.
+            render_key = self._render_cache.key(vgm_digest, type(self._opx_iface).__name__,
+                                                stream_headers["Chip"], voltage,
+                                                self._filter_id)
+
+        async def stream_cached():
+            # A request may be streamed from the cache either before or after waiting in
+            # the queue (if the same file was rendered meanwhile), but is a cache hit only once.
+            if render_key is None or \
+                    not await self._stream_cached(sock, digest, render_key, stream_headers):
+                return False
+            self._metrics.cache_hits += 1
+            self._logger.info("web: %s: streamed from cache (hit rate %.0f%%)",
+                              digest, self._metrics.hit_rate * 100)
+            return True
+
+        if await stream_cached():
+            return sock
+
+        async def report_position(position):
+            self._logger.info("web: %s: queued at position %d", digest, position)
+            await sock.send_json({"Queue-Position": position})
+
+        queued_at = time.monotonic()
+        await self._queue.acquire(request.remote, report_position)
+        try:
+            self._metrics.add_queue_wait(time.monotonic() - queued_at)
+
+            # The same file could have been rendered while this request was in the queue.
+            if await stream_cached():
+                return sock
+            if render_key is not None:
+                self._metrics.cache_misses += 1
+
             try:
-                voltage = float(headers["Voltage"])
                 self._logger.info("web: %s: setting voltage to %.2f V", digest, voltage)
                 await self._set_voltage(voltage)
 
@@ -899,21 +1189,9 @@ class YamahaOPxWebInterface:
             play_fut   = asyncio.ensure_future(vgm_player.play())
 
             try:
-                total_samples = int(vgm_reader.total_seconds * sample_rate)
-                if vgm_reader.loop_samples in (0, vgm_reader.total_samples):
-                    # Either 0 or the entire VGM here means we'll loop the complete track.
-                    loop_skip_to = 0
-                else:
-                    loop_skip_to = int((vgm_reader.total_seconds - vgm_reader.loop_seconds)
-                                       * sample_rate)
-                await sock.send_json({
-                    "Chip": vgm_reader.chips()[0],
-                    "Channel-Count": self._opx_iface.channel_count,
-                    "Sample-Rate": sample_rate,
-                    "Total-Samples": total_samples,
-                    "Loop-Skip-To": loop_skip_to,
-                })
+                await sock.send_json(stream_headers)
 
+                recorded = []
                 while True:
                     if play_fut.done() and play_fut.exception():
                         break
@@ -922,6 +1200,7 @@ class YamahaOPxWebInterface:
                     if not samples:
                         break
                     await sock.send_bytes(samples)
+                    recorded.append(samples)
 
                 for fut in [play_fut, record_fut]:
                     try:
@@ -936,6 +1215,9 @@ class YamahaOPxWebInterface:
                                   digest)
                 await sock.close()
 
+                if render_key is not None:
+                    self._render_cache.put(render_key, b"".join(recorded))
+
             except asyncio.TimeoutError:
                 self._logger.info("web: %s: timeout streaming",
                                   digest)
@@ -956,11 +1238,37 @@ class YamahaOPxWebInterface:
 
             return sock
 
+        finally:
+            self._queue.release()
+
+    async def _stream_cached(self, sock, digest, render_key, stream_headers,
+                             chunk_size=16384):
+        file = self._render_cache.open(render_key)
+        if file is None:
+            return False
+
+        self._logger.info("web: %s: streaming from cache", digest)
+        with file:
+            await sock.send_json(stream_headers)
+            chunk_size *= self._opx_iface.channel_count * 2
+            while True:
+                samples = file.read(chunk_size)
+                if not samples:
+                    break
+                await sock.send_bytes(samples)
+        await sock.close()
+        return True
+
+    async def serve_metrics(self, request):
+        return aiohttp.web.Response(text=self._metrics.format(len(self._queue)),
+                                    content_type="text/plain")
+
     async def serve(self, endpoint):
         app = aiohttp.web.Application()
         app.add_routes([
             aiohttp.web.get("/",    self.serve_index),
             aiohttp.web.get("/vgm", self.serve_vgm),
+            aiohttp.web.get("/metrics", self.serve_metrics),
         ])
 
         try:
@@ -1097,9 +1405,12 @@ class AudioYamahaOPxApplet(GlasgowApplet, name="audio-yamaha-opx"):
 
         if args.filter_script_file is None:
             filter = None
+            self._filter_id = None
         else:
+            filter_source = args.filter_script_file.read()
+            self._filter_id = hashlib.sha256(filter_source).hexdigest()
             filter_context = dict(YamahaOPxCommandFilter=YamahaOPxCommandFilter)
-            exec(compile(args.filter_script_file.read(), args.filter_script_file.name,
+            exec(compile(filter_source, args.filter_script_file.name,
                          mode="exec"), filter_context)
             filter_cls = filter_context.get("CommandFilter", None)
             if not filter_cls:
@@ -1127,6 +1438,13 @@ class AudioYamahaOPxApplet(GlasgowApplet, name="audio-yamaha-opx"):
 
         p_web = p_operation.add_parser(
             "web", help="expose Yamaha hardware via a web interface")
+        p_web.add_argument(
+            "--cache-dir", metavar="DIR", type=str, default=None,
+            help="cache recorded samples in DIR (default: per-user cache directory)")
+        p_web.add_argument(
+            "--cache-size", metavar="MIB", type=int, default=1024,
+            help="keep at most MIB mebibytes of recorded samples; 0 disables the cache "
+                 "(default: %(default)s)")
         p_web.add_argument(
             "endpoint", metavar="ENDPOINT", type=str, default="localhost:8080",
             help="listen for requests on ENDPOINT (default: %(default)s)")
@@ -1181,7 +1499,14 @@ class AudioYamahaOPxApplet(GlasgowApplet, name="audio-yamaha-opx"):
         if args.operation == "web":
             async def set_voltage(voltage):
                 await device.set_voltage(args.port_spec, voltage)
-            web_iface = YamahaOPxWebInterface(self.logger, opx_iface, set_voltage=set_voltage)
+            if args.cache_size > 0:
+                render_cache = YamahaOPxRenderCache(args.cache_dir,
+                                                    max_size=args.cache_size * 1024 * 1024)
+            else:
+                render_cache = None
+            web_iface = YamahaOPxWebInterface(self.logger, opx_iface, set_voltage=set_voltage,
+                                              render_cache=render_cache,
+                                              filter_id=self._filter_id)
             await web_iface.serve(args.endpoint)
 
         if args.operation == "run":
@@ -1204,6 +1529,11 @@ class AudioYamahaOPxApplet(GlasgowApplet, name="audio-yamaha-opx"):
 
 # -------------------------------------------------------------------------------------------------
 
+import tempfile
+import unittest
+from fractions import Fraction
+
+
 class AudioYamahaOPxAppletTestCase(GlasgowAppletTestCase, applet=AudioYamahaOPxApplet):
     @synthesis_test
     def test_build_opl2(self):
@@ -1216,3 +1546,170 @@ class AudioYamahaOPxAppletTestCase(GlasgowAppletTestCase, applet=AudioYamahaOPxA
     @synthesis_test
     def test_build_opm(self):
         self.assertBuilds(args=["--device", "OPM"])
+
+
+class YamahaVGMStreamPlayerTestCase(unittest.TestCase):
+    class MockLower:
+        def __init__(self):
+            self.data = bytearray()
+
+        async def write(self, data):
+            self.data.extend(data)
+
+        async def flush(self):
+            pass
+
+    def setUp(self):
+        self.header = bytearray(0x100)
+        self.header[0x00:0x04] = b"Vgm "
+        self.header[0x08:0x0c] = struct.pack("<L", 0x151)
+        self.header[0x34:0x38] = struct.pack("<L", 0x100 - 0x34)
+        self.header[0x5c:0x60] = struct.pack("<L", 14318180)
+        self.commands = bytes([
+            0x5f, 0x05, 0x01,
+            0x5e, 0x20, 0x01,
+            0x61, 0x10, 0x00,
+            0x5e, 0xb0, 0x32,
+            0x62,
+            0x73,
+            0x66,
+        ])
+
+    def make_player(self, **kwargs):
+        opx_iface = YamahaOPL3Interface(self.MockLower(), logging.getLogger(__name__))
+        vgm_reader = VGMStreamReader(io.BytesIO(self.header + self.commands))
+        clock_rate, _ = opx_iface.get_vgm_clock_rate(vgm_reader)
+        return YamahaVGMStreamPlayer(vgm_reader, opx_iface, clock_rate, **kwargs)
+
+    async def play_uncompiled(self, player):
+        await player._issue_commands()
+        return bytes(player._opx_iface.lower.data)
+
+    def test_compile(self):
+        loop = asyncio.get_event_loop()
+        player = self.make_player()
+        commands = loop.run_until_complete(player.compile())
+        self.assertEqual(player._opx_iface.lower.data, b"")
+        self.assertEqual(commands, loop.run_until_complete(
+            self.play_uncompiled(self.make_player())))
+
+    def test_wait_samples(self):
+        player = self.make_player()
+        for count in (1, 735, 882, 0xffff):
+            self.assertEqual(count * player.clock_rate // VGM_SAMPLE_RATE,
+                             int(Fraction(count, VGM_SAMPLE_RATE) * player.clock_rate))
+
+    def test_cache(self):
+        loop = asyncio.get_event_loop()
+        cache = YamahaVGMStreamCache()
+        player_1 = self.make_player(digest=b"\x01", cache=cache)
+        commands_1 = loop.run_until_complete(player_1.compile())
+        player_2 = self.make_player(digest=b"\x01", cache=cache)
+        player_2._reader = None
+        commands_2 = loop.run_until_complete(player_2.compile())
+        self.assertIs(commands_1, commands_2)
+        self.assertEqual(player_1._opx_iface._phase_accum, player_2._opx_iface._phase_accum)
+
+    def test_cache_phase_accum(self):
+        loop = asyncio.get_event_loop()
+        cache = YamahaVGMStreamCache()
+        player_1 = self.make_player(digest=b"\x01", cache=cache)
+        commands_1 = loop.run_until_complete(player_1.compile())
+        player_2 = self.make_player(digest=b"\x01", cache=cache)
+        player_2._opx_iface._phase_accum = 1000
+        commands_2 = loop.run_until_complete(player_2.compile())
+        self.assertNotEqual(commands_1, commands_2)
+        player_3 = self.make_player()
+        player_3._opx_iface._phase_accum = 1000
+        self.assertEqual(commands_2, loop.run_until_complete(player_3.compile()))
+        self.assertEqual(player_2._opx_iface._phase_accum, player_3._opx_iface._phase_accum)
+
+    def test_cache_evict(self):
+        cache = YamahaVGMStreamCache(max_size=4)
+        cache.put(1, b"ab", 0)
+        cache.put(2, b"cd", 0)
+        cache.get(1)
+        cache.put(3, b"ef", 0)
+        self.assertIsNotNone(cache.get(1))
+        self.assertIsNone(cache.get(2))
+        self.assertIsNotNone(cache.get(3))
+
+
+class YamahaOPxRenderCacheTestCase(unittest.TestCase):
+    def test_key(self):
+        key = YamahaOPxRenderCache.key(b"\x01", "YamahaOPL3Interface", "YM3812", 5.0, None)
+        self.assertEqual(key,
+            YamahaOPxRenderCache.key(b"\x01", "YamahaOPL3Interface", "YM3812", 5.0, None))
+        self.assertNotEqual(key,
+            YamahaOPxRenderCache.key(b"\x01", "YamahaOPL2Interface", "YM3812", 5.0, None))
+        self.assertNotEqual(key,
+            YamahaOPxRenderCache.key(b"\x01", "YamahaOPL3Interface", "YMF262", 5.0, None))
+        self.assertNotEqual(key,
+            YamahaOPxRenderCache.key(b"\x01", "YamahaOPL3Interface", "YM3812", 3.3, None))
+        self.assertNotEqual(key,
+            YamahaOPxRenderCache.key(b"\x01", "YamahaOPL3Interface", "YM3812", 5.0, "filter"))
+
+    def test_entries(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = YamahaOPxRenderCache(cache_dir)
+            cache.put("a", b"abcd")
+            self.assertEqual(os.listdir(cache_dir), ["a.pcm"])
+
+
+class YamahaOPxJobQueueTestCase(unittest.TestCase):
+    def test_round_robin(self):
+        async def run():
+            queue   = YamahaOPxJobQueue()
+            order   = []
+            reports = []
+            release = asyncio.Event()
+
+            async def job(client, name):
+                async def report(position):
+                    reports.append((name, position))
+                await queue.acquire(client, report)
+                try:
+                    order.append(name)
+                    await release.wait()
+                finally:
+                    queue.release()
+
+            futs = [asyncio.ensure_future(job(client, name))
+                    for client, name in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1")]]
+            await asyncio.sleep(0)
+            self.assertEqual(len(queue), 3)
+            self.assertIn(("b1", 2), reports)
+            release.set()
+            await asyncio.gather(*futs)
+            self.assertEqual(order, ["a1", "a2", "b1", "a3"])
+            self.assertEqual(len(queue), 0)
+
+        asyncio.get_event_loop().run_until_complete(run())
+
+    def test_cancel(self):
+        async def run():
+            queue = YamahaOPxJobQueue()
+            await queue.acquire("a")
+            waiting = asyncio.ensure_future(queue.acquire("b"))
+            await asyncio.sleep(0)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            self.assertEqual(len(queue), 0)
+            queue.release()
+            await queue.acquire("c")
+
+        asyncio.get_event_loop().run_until_complete(run())
+
+
+class YamahaOPxWebMetricsTestCase(unittest.TestCase):
+    def test_format(self):
+        metrics = YamahaOPxWebMetrics()
+        metrics.cache_hits   = 1
+        metrics.cache_misses = 3
+        metrics.add_queue_wait(2.0)
+        metrics.add_queue_wait(1.0)
+        text = metrics.format(queue_length=2)
+        self.assertIn("glasgow_opx_cache_hit_rate 0.25\n", text)
+        self.assertIn("glasgow_opx_queue_length 2\n", text)
+        self.assertIn("glasgow_opx_queue_wait_seconds_max 2.0\n", text)
@@ -2,6 +2,7 @@
 # Document Number: IHI0031C
 # Accession: G00027
 
+import struct
 from abc import ABCMeta, abstractmethod
 
 from ....database.jedec import *
@@ -77,6 +78,76 @@ class ARMDPInterface(metaclass=ABCMeta):
         else:
             raise ARMDPError("cannot %s system power".format("enable" if enabled else "disable"))
 
+    # MEM-AP interface
+
+    # TAR auto-increment is only guaranteed to work within a 1 KiB aligned region; the behavior
+    # when crossing it is IMPLEMENTATION DEFINED, so TAR is rewritten at every such boundary.
+    _MEM_AP_AUTOINC_SIZE = 0x400
+
+    async def _read_mem_ap_block(self, index, address, count):
+        """Read ``count`` words at ``address`` via MEM-AP ``index``, without crossing
+        an auto-increment boundary.
+
+        Data link layers override this to pipeline DRW accesses."""
+        await self.write_ap_reg(index, AP_TAR_addr, address)
+        return [await self.read_ap_reg(index, AP_DRW_addr) for _ in range(count)]
+
+    async def _write_mem_ap_block(self, index, address, words):
+        """Write ``words`` at ``address`` via MEM-AP ``index``, without crossing
+        an auto-increment boundary.
+
+        Data link layers override this to pipeline DRW accesses."""
+        await self.write_ap_reg(index, AP_TAR_addr, address)
+        for word in words:
+            await self.write_ap_reg(index, AP_DRW_addr, word)
+
+    async def _prepare_mem_ap(self, index):
+        ap_csw = AP_CSW.from_int(await self.read_ap_reg(index, AP_CSW_addr))
+        if ap_csw.Size != AP_CSW_SIZE.WORD or ap_csw.AddrInc != AP_CSW_ADDRINC.SINGLE:
+            ap_csw.Size    = AP_CSW_SIZE.WORD
+            ap_csw.AddrInc = AP_CSW_ADDRINC.SINGLE
+            await self.write_ap_reg(index, AP_CSW_addr, ap_csw.to_int())
+
+    def _iter_mem_ap_blocks(self, address, count):
+        while count > 0:
+            block_count = min(count,
+                (self._MEM_AP_AUTOINC_SIZE - address % self._MEM_AP_AUTOINC_SIZE) // 4)
+            yield address, block_count
+            address += block_count * 4
+            count   -= block_count
+
+    async def read_memory(self, index, address, length):
+        """Read ``length`` bytes starting at ``address`` via MEM-AP ``index``.
+
+        Memory is accessed with word transfers; unaligned ranges are widened to word boundaries
+        and trimmed afterwards."""
+        assert address in range(1 << 32) and address + length <= 1 << 32
+        start = address & ~3
+        end   = (address + length + 3) & ~3
+        await self._prepare_mem_ap(index)
+        self._log("mem read id=%d addr=%#010x len=%d", index, address, length)
+        data = bytearray()
+        for block_address, block_count in self._iter_mem_ap_blocks(start, (end - start) // 4):
+            words = await self._read_mem_ap_block(index, block_address, block_count)
+            data += struct.pack("<{}L".format(len(words)), *words)
+        return bytes(data[address - start:address - start + length])
+
+    async def write_memory(self, index, address, data):
+        """Write ``data`` starting at ``address`` via MEM-AP ``index``.
+
+        Memory is accessed with word transfers; ``address`` and the length of ``data`` must be
+        word aligned."""
+        assert address % 4 == 0 and len(data) % 4 == 0, "Unaligned memory write"
+        assert address + len(data) <= 1 << 32
+        words = struct.unpack("<{}L".format(len(data) // 4), data)
+        await self._prepare_mem_ap(index)
+        self._log("mem write id=%d addr=%#010x len=%d", index, address, len(data))
+        offset = 0
+        for block_address, block_count in self._iter_mem_ap_blocks(address, len(words)):
+            await self._write_mem_ap_block(index, block_address,
+                                           words[offset:offset + block_count])
+            offset += block_count
+
 
 class DebugARMAppletMixin:
     @classmethod
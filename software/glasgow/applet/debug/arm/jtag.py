@@ -9,6 +9,7 @@ from ....support.aobject import *
 from ....arch.jtag import *
 from ....arch.arm.jtag import *
 from ....arch.arm.dap.dp import *
+from ....arch.arm.dap.ap import *
 from ...interface.jtag_probe import JTAGProbeApplet
 from . import *
 
@@ -26,6 +27,9 @@ class ARMJTAGDPInterface(ARMDPInterface, aobject):
         self._logger = logger
         self._level  = logging.DEBUG if self._logger.name == __name__ else logging.TRACE
         self._select = DP_SELECT()
+        # Run-Test/Idle cycles inserted after each pipelined APACC scan; grown whenever the AP
+        # responds with WAIT, so that a slow memory system settles on a rate it can sustain.
+        self._idle_cycles = 0
 
         await self.reset()
 
@@ -168,6 +172,61 @@ class ARMJTAGDPInterface(ARMDPInterface, aobject):
         self._log("ap read data=%#010x", value)
         return value
 
+    # Pipelined MEM-AP operations
+
+    _MAX_IDLE_CYCLES = 256
+
+    async def _exchange_apacc_block(self, index, address, transfers):
+        """Write ``address`` to TAR of MEM-AP ``index``, then issue ``transfers`` (a list of DRW
+        write values, or ``None`` for DRW reads) back to back without waiting for the AP.
+
+        The read result of each APACC scan is captured by the following scan, and the last one is
+        captured by the CTRL/STAT poll, which also checks the sticky error flags for the entire
+        block at once. If the AP responds with WAIT to any scan, the block is retried from TAR
+        with more idle cycles between scans. Returns the read result of every transfer."""
+        await self._prepare_ap_reg(index, AP_DRW_addr) # TAR and DRW are in the same bank
+        while True:
+            await self.lower.write_ir(IR_APACC)
+            dr_captures = []
+            dr_update = DR_xPACC_update(RnW=0, A=AP_TAR_addr >> 2, DATAIN=address)
+            dr_captures.append(await self.lower.exchange_dr(dr_update.to_bits(), defer=True))
+            read_bits = DR_xPACC_update(RnW=1, A=AP_DRW_addr >> 2).to_bits()
+            for value in transfers:
+                if self._idle_cycles:
+                    await self.lower.run_test_idle(self._idle_cycles)
+                if value is None:
+                    dr_update_bits = read_bits
+                else:
+                    dr_update_bits = DR_xPACC_update(
+                        RnW=0, A=AP_DRW_addr >> 2, DATAIN=value).to_bits()
+                dr_captures.append(await self.lower.exchange_dr(dr_update_bits, defer=True))
+            last_result = await self._poll_apacc()
+
+            dr_captures = [DR_xPACC_capture.from_bits(dr_capture.result())
+                           for dr_capture in dr_captures]
+            if all(dr_capture.ACK == DR_xPACC_ACK.OK_FAULT for dr_capture in dr_captures):
+                break
+
+            # A scan answered with WAIT was discarded by the DP, so the position of TAR and
+            # the correspondence of read results to transfers are both lost; start over.
+            assert all(dr_capture.ACK in (DR_xPACC_ACK.OK_FAULT, DR_xPACC_ACK.WAIT)
+                       for dr_capture in dr_captures)
+            if self._idle_cycles >= self._MAX_IDLE_CYCLES:
+                raise ARMAPTransactionError("AP transaction timeout")
+            self._idle_cycles = max(1, self._idle_cycles * 2)
+            self._log("ap wait (retrying block with %d idle cycles)", self._idle_cycles)
+
+        # The first capture holds the (meaningless) result of the TAR write.
+        return [dr_capture.ReadResult for dr_capture in dr_captures[2:]] + [last_result]
+
+    async def _read_mem_ap_block(self, index, address, count):
+        self._log("ap read block id=%d addr=%#010x count=%d", index, address, count)
+        return await self._exchange_apacc_block(index, address, [None] * count)
+
+    async def _write_mem_ap_block(self, index, address, words):
+        self._log("ap write block id=%d addr=%#010x count=%d", index, address, len(words))
+        await self._exchange_apacc_block(index, address, list(words))
+
 
 class DebugARMJTAGApplet(DebugARMAppletMixin, JTAGProbeApplet, name="debug-arm-jtag"):
     preview = True
@@ -185,3 +244,143 @@ class DebugARMJTAGApplet(DebugARMAppletMixin, JTAGProbeApplet, name="debug-arm-j
     async def run(self, device, args):
         tap_iface = await self.run_tap(DebugARMJTAGApplet, device, args)
         return await ARMJTAGDPInterface(tap_iface, self.logger)
+
+# -------------------------------------------------------------------------------------------------
+
+import asyncio
+import unittest
+
+
+class ARMJTAGDPInterfaceTestCase(unittest.TestCase):
+    class MockTAP:
+        """A JTAG-DP with a single MEM-AP, modelling the one scan delay of read results."""
+        class Result:
+            def __init__(self, data):
+                self._data = data
+
+            def result(self):
+                return self._data
+
+        def __init__(self, memory_size=0x1000):
+            self.memory     = bytearray(memory_size)
+            self.wait_scans = set()
+            self.ir         = None
+            self.select     = DP_SELECT()
+            self.ctrl_stat  = DP_CTRL_STAT()
+            self.csw        = AP_CSW()
+            self.tar        = 0
+            self.capture    = DR_xPACC_capture(ACK=DR_xPACC_ACK.OK_FAULT)
+            self.ap_scans   = 0
+
+        async def test_reset(self):
+            pass
+
+        async def run_test_idle(self, count):
+            pass
+
+        async def write_ir(self, data, *, elide=True):
+            self.ir = data
+
+        async def sync(self):
+            pass
+
+        def _access_dp(self, update):
+            if update.RnW:
+                return {1: self.ctrl_stat.to_int(), 3: self.capture.ReadResult}.get(update.A, 0)
+            if update.A == DP_SELECT_addr >> 2:
+                self.select = DP_SELECT.from_int(update.DATAIN)
+            elif update.A == DP_CTRL_STAT_addr >> 2:
+                ctrl_stat = DP_CTRL_STAT.from_int(update.DATAIN)
+                if ctrl_stat.STICKYERR:
+                    self.ctrl_stat.STICKYERR = 0
+                self.ctrl_stat.CDBGPWRUPREQ = self.ctrl_stat.CDBGPWRUPACK = ctrl_stat.CDBGPWRUPREQ
+            return 0
+
+        def _access_ap(self, update):
+            addr = (self.select.APBANKSEL << 4) | (update.A << 2)
+            if addr == AP_CSW_addr:
+                if update.RnW:
+                    return self.csw.to_int()
+                self.csw = AP_CSW.from_int(update.DATAIN)
+            elif addr == AP_TAR_addr:
+                if update.RnW:
+                    return self.tar
+                self.tar = update.DATAIN
+            elif addr == AP_DRW_addr:
+                assert self.csw.Size == AP_CSW_SIZE.WORD
+                result = 0
+                if self.tar + 4 > len(self.memory):
+                    self.ctrl_stat.STICKYERR = 1
+                elif update.RnW:
+                    result = int.from_bytes(self.memory[self.tar:self.tar + 4], "little")
+                else:
+                    self.memory[self.tar:self.tar + 4] = update.DATAIN.to_bytes(4, "little")
+                if self.csw.AddrInc == AP_CSW_ADDRINC.SINGLE:
+                    # Model the smallest allowed auto-increment range.
+                    self.tar = (self.tar & ~0x3ff) | ((self.tar + 4) & 0x3ff)
+                return result
+            elif addr == AP_IDR_addr:
+                return AP_IDR(CLASS=AP_IDR_CLASS.MEM_AP).to_int()
+            return 0
+
+        async def exchange_dr(self, data, *, defer=False):
+            capture = self.capture
+            update  = DR_xPACC_update.from_bits(data)
+            if self.ir == IR_APACC:
+                self.ap_scans += 1
+            if self.ir == IR_APACC and self.ap_scans in self.wait_scans:
+                # The request is discarded, and the previous result stays pending.
+                capture = DR_xPACC_capture(ACK=DR_xPACC_ACK.WAIT, ReadResult=0xdeadbeef)
+            elif self.ir == IR_APACC:
+                self.capture = DR_xPACC_capture(ACK=DR_xPACC_ACK.OK_FAULT,
+                                                ReadResult=self._access_ap(update))
+            else:
+                self.capture = DR_xPACC_capture(ACK=DR_xPACC_ACK.OK_FAULT,
+                                                ReadResult=self._access_dp(update))
+            if defer:
+                return self.Result(capture.to_bits())
+            return capture.to_bits()
+
+    def setUp(self):
+        self.lower = self.MockTAP()
+        self.lower.memory[:] = bytes(range(256)) * (len(self.lower.memory) // 256)
+        self.iface = self.run_coro(ARMJTAGDPInterface(self.lower, logging.getLogger(__name__)))
+
+    def run_coro(self, coro):
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+    def test_read_memory(self):
+        self.assertEqual(self.run_coro(self.iface.read_memory(0, 0x100, 16)),
+                         self.lower.memory[0x100:0x110])
+        self.assertEqual(self.run_coro(self.iface.read_memory(0, 0x3f6, 0x20e)),
+                         self.lower.memory[0x3f6:0x604])
+        self.assertEqual(self.run_coro(self.iface.read_memory(0, 0x000, 0x1000)),
+                         self.lower.memory)
+
+    def test_read_memory_pipelined(self):
+        self.run_coro(self.iface.read_memory(0, 0x000, 0x400))
+        self.lower.ap_scans = 0
+        self.run_coro(self.iface.read_memory(0, 0x000, 0x400))
+        # One CSW read, one TAR write, and one scan per word.
+        self.assertEqual(self.lower.ap_scans, 1 + 1 + 0x100)
+
+    def test_write_memory(self):
+        data = bytes(range(255, -1, -1)) * 4
+        self.run_coro(self.iface.write_memory(0, 0x3f0, data[:0x20]))
+        self.assertEqual(self.lower.memory[0x3f0:0x410], data[:0x20])
+        self.run_coro(self.iface.write_memory(0, 0x800, data))
+        self.assertEqual(self.lower.memory[0x800:0xc00], data)
+        self.assertEqual(self.run_coro(self.iface.read_memory(0, 0x800, 0x400)), data)
+
+    def test_wait(self):
+        self.run_coro(self.iface.read_memory(0, 0x000, 4))
+        self.lower.wait_scans = {self.lower.ap_scans + 3 + 10}
+        self.assertEqual(self.run_coro(self.iface.read_memory(0, 0x200, 0x100)),
+                         self.lower.memory[0x200:0x300])
+        self.assertEqual(self.iface._idle_cycles, 1)
+
+    def test_error(self):
+        with self.assertRaises(ARMAPTransactionError):
+            self.run_coro(self.iface.read_memory(0, 0xff0, 0x20))
+        self.assertEqual(self.run_coro(self.iface.read_memory(0, 0xff0, 0x10)),
+                         self.lower.memory[0xff0:])
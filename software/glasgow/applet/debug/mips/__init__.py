@@ -5,6 +5,7 @@
 import struct
 import logging
 import asyncio
+import argparse
 
 from ....support.aobject import *
 from ....support.endpoint import *
@@ -21,7 +22,7 @@ class EJTAGError(GlasgowAppletError):
 
 
 class EJTAGDebugInterface(aobject, GDBRemote):
-    async def __init__(self, interface, logger):
+    async def __init__(self, interface, logger, fastdata_area=None):
         self.lower   = interface
         self._logger = logger
         self._level  = logging.DEBUG if self._logger.name == __name__ else logging.TRACE
@@ -37,6 +38,9 @@ class EJTAGDebugInterface(aobject, GDBRemote):
         self._instr_brkpts = []
         self._softw_brkpts = {}
 
+        self._fastdata_area   = fastdata_area
+        self._fastdata_backup = None
+
     def _log(self, message, *args):
         self._logger.log(self._level, "EJTAG: " + message, *args)
 
@@ -248,6 +252,8 @@ class EJTAGDebugInterface(aobject, GDBRemote):
         temp_end = temp_beg   + len(temp) * 4
         data_beg = (DMSEG_addr + 0x1200)  & self._mask
         data_end = data_beg   + len(data) * 4
+        fast_beg = DMSEG_FASTDATA_addr & self._mask
+        fast_end = fast_beg   + DMSEG_FASTDATA_size
 
         for step in range(max_steps):
             for _ in range(3):
@@ -268,6 +274,10 @@ class EJTAGDebugInterface(aobject, GDBRemote):
                 self._log("Exec_PrAcc: debug suspend")
                 self._change_state(suspend_state)
                 break
+            if step > 0 and address in range(fast_beg, fast_end):
+                self._log("Exec_PrAcc: FASTDATA suspend")
+                self._change_state("FastData")
+                break
 
             if address in range(code_beg, code_end):
                 area, area_beg, area_wr, area_name = code, code_beg, False, "code"
@@ -327,6 +337,7 @@ class EJTAGDebugInterface(aobject, GDBRemote):
         await self._pracc_probe()
 
     async def _pracc_debug_return(self):
+        await self._fastdata_uninstall()
         self._log("PrAcc: debug return")
 
         Rdata, *_ = range(1, 32)
@@ -339,6 +350,7 @@ class EJTAGDebugInterface(aobject, GDBRemote):
         ], suspend_state="Interrupted")
 
     async def _pracc_single_step(self):
+        await self._fastdata_uninstall()
         self._log("PrAcc: single step")
 
         Racc, *_ = range(1, 32)
@@ -549,13 +561,16 @@ class EJTAGDebugInterface(aobject, GDBRemote):
         self._log("PrAcc: write [%#.*x] = %#.*x", self._prec, address, self._prec, value)
         await self._pracc_copy_word(address, value, is_read=False)
 
-    async def _pracc_copy_memory(self, address, length, data, is_read):
-        assert length <= 0x200
+    async def _pracc_copy_memory(self, address, length, data, is_read, size=1):
+        assert length <= 0x200 and size in (1, 4)
 
-        # This really isn't efficient at all, but unaligned accesses to dmseg are currently
-        # not handled correctly, and endianness is a nightmare. This should instead use
-        # word-size transfers, and ideally also the FASTDATA channel, but the implementation
-        # below works as a proof of concept.
+        # Unaligned accesses to dmseg are currently not handled correctly, so bytes are
+        # transferred one per dmseg word. Word transfers (size=4) do not have this problem, but
+        # are only usable for aligned memory; bulk transfers should use FASTDATA instead.
+        if size == 1:
+            memory_load, memory_store = LBU, SB
+        else:
+            memory_load, memory_store = LW,  SW
         Rdata, Rdst, Rsrc, Rlen, Racc, *_ = range(1, 32)
         return await self._exec_pracc(code=[
             SW   (Rdst, self._ws * -1, Rdata),
@@ -567,10 +582,10 @@ class EJTAGDebugInterface(aobject, GDBRemote):
             OR   (Rdst, 0, Rdata if is_read else Racc),
             OR   (Rsrc, 0, Racc  if is_read else Rdata),
             ORI  (Rlen, 0, length),
-            LBU  (Racc, 0, Rsrc) if is_read else LW   (Racc, 0, Rsrc),
-            ADDI (Rsrc, Rsrc,  1 if is_read else 4),
-            SW   (Racc, 0, Rdst) if is_read else SB   (Racc, 0, Rdst),
-            ADDI (Rdst, Rdst,  4 if is_read else 1),
+            memory_load(Racc, 0, Rsrc) if is_read else LW(Racc, 0, Rsrc),
+            ADDI (Rsrc, Rsrc,  size if is_read else 4),
+            SW(Racc, 0, Rdst) if is_read else memory_store(Racc, 0, Rdst),
+            ADDI (Rdst, Rdst,  4 if is_read else size),
             ADDI (Rlen, Rlen, -1),
             BGTZ (Rlen, -6),
             NOP  (),
@@ -588,6 +603,204 @@ class EJTAGDebugInterface(aobject, GDBRemote):
     async def _pracc_write_memory(self, address, data):
         await self._pracc_copy_memory(address, len(data), [*data], is_read=False)
 
+    async def _pracc_read_words(self, address, count):
+        words = []
+        for offset in range(0, count, 0x200):
+            chunk_count = min(count - offset, 0x200)
+            words += await self._pracc_copy_memory(address + offset * 4, chunk_count,
+                                                   data=[0] * chunk_count, is_read=True, size=4)
+        return words
+
+    async def _pracc_write_words(self, address, words):
+        for offset in range(0, len(words), 0x200):
+            chunk = words[offset:offset + 0x200]
+            await self._pracc_copy_memory(address + offset * 4, len(chunk), [*chunk],
+                                          is_read=False, size=4)
+
+    # FASTDATA memory read/write
+
+    # The FASTDATA handler runs from the work area in target memory, since instruction fetches
+    # from dmseg would each require a PrAcc round trip. The CPU stalls on every access to the
+    # fastdata area until the probe completes it with a FASTDATA scan; as the handler loop is
+    # much faster than a scan, these scans can be issued back to back, and their SPrAcc bits
+    # are only checked after each batch.
+    _FASTDATA_BATCH_WORDS = 1024
+    _FASTDATA_MIN_WORDS   = 16
+
+    def _fastdata_handler(self):
+        Rdata, Rfast, Raddr, Rend, Racc, *_ = range(1, 32)
+        return [
+            # +0x00: read loop
+            LW   (Racc,  0, Raddr),
+            SW   (Racc,  0, Rfast),
+            BNE  (Raddr, Rend, -3),
+            ADDIU(Raddr, Raddr, 4),
+            B    (5),
+            NOP  (),
+            # +0x18: write loop
+            LW   (Racc,  0, Rfast),
+            SW   (Racc,  0, Raddr),
+            BNE  (Raddr, Rend, -3),
+            ADDIU(Raddr, Raddr, 4),
+            # +0x28: return to dmseg
+            LUI  (Raddr, DMSEG_TRAP_addr >> 16),
+            ORI  (Raddr, Raddr, DMSEG_TRAP_addr),
+            JR   (Raddr),
+            NOP  (),
+        ]
+
+    def _fastdata_overlaps(self, address, length):
+        if self._fastdata_area is None:
+            return False
+        area_beg = self._fastdata_area
+        area_end = area_beg + len(self._fastdata_handler()) * 4
+        return address < area_end and address + length > area_beg
+
+    def _fastdata_usable(self, address, count):
+        return (self._fastdata_area is not None and self.bits == 32 and
+                count >= self._FASTDATA_MIN_WORDS and
+                not self._fastdata_overlaps(address, count * 4))
+
+    async def _fastdata_install(self):
+        if self._fastdata_backup is not None:
+            return
+
+        self._log("FASTDATA: install handler at %#0.*x", self._prec, self._fastdata_area)
+        handler = self._fastdata_handler()
+        backup  = []
+        for index, instr in enumerate(handler):
+            backup.append(await self._pracc_read_word(self._fastdata_area + index * 4))
+        for index, instr in enumerate(handler):
+            await self._pracc_write_word(self._fastdata_area + index * 4, instr)
+            await self._pracc_sync_icache(self._fastdata_area + index * 4)
+        self._fastdata_backup = backup
+
+    async def _fastdata_uninstall(self):
+        if self._fastdata_backup is None:
+            return
+
+        self._log("FASTDATA: uninstall handler at %#0.*x", self._prec, self._fastdata_area)
+        for index, word in enumerate(self._fastdata_backup):
+            await self._pracc_write_word(self._fastdata_area + index * 4, word)
+            await self._pracc_sync_icache(self._fastdata_area + index * 4)
+        self._fastdata_backup = None
+
+    async def _fastdata_exchange(self, words):
+        await self.lower.write_ir(IR_FASTDATA)
+        results = []
+        for offset in range(0, len(words), self._FASTDATA_BATCH_WORDS):
+            scans = []
+            for word in words[offset:offset + self._FASTDATA_BATCH_WORDS]:
+                # Shifting in SPrAcc=0 completes the pending access; the captured SPrAcc shows
+                # whether there was one.
+                scans.append(await self.lower.exchange_dr(bits(word << 1, 1 + self.bits),
+                                                          defer=True))
+            await self.lower.sync()
+            for index, scan in enumerate(scans):
+                fastdata_bits = scan.result()
+                if not fastdata_bits[0]:
+                    raise EJTAGError("FASTDATA: no pending access at word %d" %
+                                     (offset + index))
+                results.append(int(fastdata_bits) >> 1)
+        return results
+
+    async def _fastdata_copy_words(self, address, words, is_read):
+        await self._fastdata_install()
+        self._log("FASTDATA: %s address=%#0.*x count=%d",
+                  "read" if is_read else "write", self._prec, address, len(words))
+
+        entry = self._fastdata_area + (0x00 if is_read else 0x18)
+        last  = address + (len(words) - 1) * 4
+        Rdata, Rfast, Raddr, Rend, Racc, *_ = range(1, 32)
+        saved = await self._exec_pracc_bare(code=[
+            SW   (Rfast, self._ws * 0, Rdata),
+            SW   (Raddr, self._ws * 1, Rdata),
+            SW   (Rend,  self._ws * 2, Rdata),
+            SW   (Racc,  self._ws * 3, Rdata),
+            LUI  (Rfast, DMSEG_FASTDATA_addr >> 16),
+            LUI  (Raddr, address >> 16),
+            ORI  (Raddr, Raddr, address),
+            LUI  (Rend,  last >> 16),
+            ORI  (Rend,  Rend, last),
+            LUI  (Racc,  entry >> 16),
+            ORI  (Racc,  Racc, entry),
+            JR   (Racc),
+            NOP  (),
+        ], data=[0] * 4)
+        if self._state != "FastData":
+            raise EJTAGError("FASTDATA: handler did not start")
+
+        try:
+            words = await self._fastdata_exchange(words)
+        except EJTAGError as error:
+            # The handler is still running from target RAM with its registers clobbered. Let it
+            # run to completion, so that it returns to dmseg and the registers can be restored;
+            # if that is not possible, the target has to be reset.
+            self._log("FASTDATA: %s; draining handler", error)
+            try:
+                await self._fastdata_drain(max_steps=len(words) + 16)
+            except EJTAGError as drain_error:
+                self._change_state("Unusable")
+                raise EJTAGError("FASTDATA: transfer failed and the target cannot be recovered "
+                                 "(%s); reset the target" % drain_error) from error
+            await self._fastdata_restore(saved)
+            raise
+
+        await self._fastdata_restore(saved)
+        return words
+
+    async def _fastdata_drain(self, max_steps):
+        # Complete the accesses to the fastdata area that the handler still issues through PrAcc,
+        # discarding the data, until the handler returns to dmseg.
+        fast_beg = DMSEG_FASTDATA_addr & self._mask
+        fast_end = fast_beg + DMSEG_FASTDATA_size
+        for step in range(max_steps):
+            for _ in range(3):
+                control = await self._exchange_control()
+                if not control.DM:
+                    raise EJTAGError("FASTDATA: debug mode exited")
+                elif control.PrAcc:
+                    break
+            else:
+                raise EJTAGError("FASTDATA: PrAcc stuck low")
+
+            address = await self._read_address()
+            if address not in range(fast_beg, fast_end):
+                # Leave the access pending; it is completed by the next PrAcc execution.
+                self._log("FASTDATA: handler returned after %d drained accesses", step)
+                return
+            if not control.PRnW:
+                await self._write_data(0)
+            await self._exchange_control(PrAcc=0)
+        else:
+            raise EJTAGError("FASTDATA: handler did not return")
+
+    async def _fastdata_restore(self, saved):
+        Rdata, Rfast, Raddr, Rend, Racc, *_ = range(1, 32)
+        await self._exec_pracc(code=[
+            LW   (Rfast, self._ws * 0, Rdata),
+            LW   (Raddr, self._ws * 1, Rdata),
+            LW   (Rend,  self._ws * 2, Rdata),
+            LW   (Racc,  self._ws * 3, Rdata),
+            NOP  (),
+        ], data=saved, entry_state="FastData")
+
+    async def _read_words(self, address, count):
+        if self._fastdata_usable(address, count):
+            return await self._fastdata_copy_words(address, [0] * count, is_read=True)
+        elif count == 1:
+            return [await self._pracc_read_word(address)]
+        else:
+            return await self._pracc_read_words(address, count)
+
+    async def _write_words(self, address, words):
+        if self._fastdata_usable(address, len(words)):
+            await self._fastdata_copy_words(address, words, is_read=False)
+        elif len(words) == 1:
+            await self._pracc_write_word(address, words[0])
+        else:
+            await self._pracc_write_words(address, words)
+
     # PrAcc cache operations
 
     async def _pracc_sync_icache_r1(self, address):
@@ -674,6 +887,15 @@ class EJTAGDebugInterface(aobject, GDBRemote):
     def target_running(self):
         return self._state == "Running"
 
+    def target_uncacheable_regions(self):
+        # KSEG1 is the uncached segment, where MMIO is usually accessed; dmseg and drseg are
+        # debug registers.
+        return [
+            range(KSEG1_addr & self._mask, (KSEG1_addr & self._mask) + 0x2000_0000),
+            range(DMSEG_addr & self._mask, (DMSEG_addr & self._mask) + 0x0020_0000),
+            range(DRSEG_addr & self._mask, (DRSEG_addr & self._mask) + 0x0010_0000),
+        ]
+
     def target_attached(self):
         return not self.target_running() or any(self._instr_brkpts) or self._softw_brkpts
 
@@ -786,19 +1008,41 @@ class EJTAGDebugInterface(aobject, GDBRemote):
         else:
             raise EJTAGError("setting register %d not supported" % number)
 
+    def _word_format(self, count):
+        return "{}{}L".format(">" if self.target_endianness() == "big" else "<", count)
+
     async def target_read_memory(self, address, length):
         self._check_state("read memory", "Stopped")
-        if address % self._ws == 0 and length == self._ws:
-            return struct.pack("<L", await self._pracc_read_word(address))
-        else:
-            return await self._pracc_read_memory(address, length)
+        if self._fastdata_overlaps(address, length):
+            await self._fastdata_uninstall()
+        # Unaligned head and tail are transferred bytewise, and the aligned body wordwise.
+        body_beg = min((address + 3) & ~3, address + length)
+        body_end = max((address + length) & ~3, body_beg)
+        data = bytearray()
+        if address < body_beg:
+            data += await self._pracc_read_memory(address, body_beg - address)
+        if body_beg < body_end:
+            count = (body_end - body_beg) // 4
+            data += struct.pack(self._word_format(count),
+                                *await self._read_words(body_beg, count))
+        if body_end < address + length:
+            data += await self._pracc_read_memory(body_end, address + length - body_end)
+        return bytes(data)
 
     async def target_write_memory(self, address, data):
         self._check_state("write memory", "Stopped")
-        if address % self._ws == 0 and len(data) == self._ws:
-            await self._pracc_write_word(address, *struct.unpack("<L", data))
-        else:
-            await self._pracc_write_memory(address, data)
+        if self._fastdata_overlaps(address, len(data)):
+            await self._fastdata_uninstall()
+        body_beg = min((address + 3) & ~3, address + len(data))
+        body_end = max((address + len(data)) & ~3, body_beg)
+        if address < body_beg:
+            await self._pracc_write_memory(address, data[:body_beg - address])
+        if body_beg < body_end:
+            body = data[body_beg - address:body_end - address]
+            await self._write_words(body_beg,
+                                    list(struct.unpack(self._word_format(len(body) // 4), body)))
+        if body_end < address + len(data):
+            await self._pracc_write_memory(body_end, data[body_end - address:])
 
 
 class DebugMIPSApplet(JTAGProbeApplet, name="debug-mips"):
@@ -829,6 +1073,11 @@ class DebugMIPSApplet(JTAGProbeApplet, name="debug-mips"):
 
     Other configurations might or might not work. In particular, it certainly does not currently
     work on little-endian CPUs. Sorry about that.
+
+    Memory is transferred through dmseg one word at a time by default. If a small area of target
+    RAM is provided with `--fastdata-area`, bulk transfers (such as GDB `load`) instead run
+    a handler from that area and move data through the EJTAG FASTDATA register, which is limited
+    only by the JTAG clock. This is only supported on 32-bit CPUs.
     """
 
     @classmethod
@@ -836,9 +1085,21 @@ class DebugMIPSApplet(JTAGProbeApplet, name="debug-mips"):
         super().add_run_arguments(parser, access)
         super().add_run_tap_arguments(parser)
 
+        def word_address(arg):
+            address = int(arg, 0)
+            if address % 4 != 0:
+                raise argparse.ArgumentTypeError("{:#x} is not word aligned".format(address))
+            return address
+
+        parser.add_argument(
+            "--fastdata-area", type=word_address, metavar="ADDRESS", default=None,
+            help="use 56 bytes of target memory at ADDRESS for FASTDATA bulk memory transfers; "
+                 "the original contents are restored before the target resumes")
+
     async def run(self, device, args):
         tap_iface = await self.run_tap(DebugMIPSApplet, device, args)
-        return await EJTAGDebugInterface(tap_iface, self.logger)
+        return await EJTAGDebugInterface(tap_iface, self.logger,
+                                         fastdata_area=args.fastdata_area)
 
     @classmethod
     def add_interact_arguments(cls, parser):
@@ -852,6 +1113,16 @@ class DebugMIPSApplet(JTAGProbeApplet, name="debug-mips"):
         p_gdb.add_argument(
             "-1", "--once", default=False, action="store_true",
             help="exit when the remote client disconnects")
+
+        def memory_range(arg):
+            start, end = arg.split(":")
+            return range(int(start, 0), int(end, 0))
+
+        p_gdb.add_argument(
+            "--uncacheable", metavar="START:END", type=memory_range,
+            default=[], action="append",
+            help="never cache memory in the range from START to END (e.g. for MMIO "
+                 "outside of KSEG1); may be specified multiple times")
         ServerEndpoint.add_argument(p_gdb, "gdb_endpoint", default="tcp::1234")
 
         p_repl = p_operation.add_parser(
@@ -870,7 +1141,7 @@ class DebugMIPSApplet(JTAGProbeApplet, name="debug-mips"):
         if args.operation == "gdb":
             endpoint = await ServerEndpoint("GDB socket", self.logger, args.gdb_endpoint)
             while not args.once:
-                await ejtag_iface.gdb_run(endpoint)
+                await ejtag_iface.gdb_run(endpoint, uncacheable_regions=args.uncacheable)
 
                 # Unless we detach from the target here, we might not be able to re-enter
                 # the debug mode, because EJTAG TAP reset appears to irreversibly destroy
@@ -884,3 +1155,147 @@ class DebugMIPSApplet(JTAGProbeApplet, name="debug-mips"):
         # Same reason as above.
         if ejtag_iface.target_attached():
             await ejtag_iface.target_detach()
+
+# -------------------------------------------------------------------------------------------------
+
+import unittest
+
+
+class EJTAGDebugInterfaceTestCase(unittest.TestCase):
+    class MockTAP:
+        class Result:
+            def __init__(self, data):
+                self._data = data
+
+            def result(self):
+                return self._data
+
+        def __init__(self, pending):
+            self.pending = pending
+            self.ir      = None
+            self.words   = []
+
+        async def write_ir(self, data):
+            self.ir = data
+
+        async def exchange_dr(self, data, *, defer=False):
+            assert self.ir == IR_FASTDATA and defer and not data[0]
+            self.words.append(int(data) >> 1)
+            return self.Result(bits((0x1000 + len(self.words)) << 1 | self.pending.pop(0), 33))
+
+        async def sync(self):
+            pass
+
+    def setUp(self):
+        # Bypass probing the target; only the memory transfer layer is exercised here.
+        self.iface = object.__new__(EJTAGDebugInterface)
+        self.iface._logger = logging.getLogger(__name__)
+        self.iface._level  = logging.DEBUG
+        self.iface._state  = "Stopped"
+        self.iface.bits    = 32
+        self.iface._fastdata_area   = 0x80001000
+        self.iface._fastdata_backup = None
+
+    def run_coro(self, coro):
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+    def test_fastdata_exchange(self):
+        self.iface.lower = self.MockTAP([1] * 3)
+        self.assertEqual(self.run_coro(self.iface._fastdata_exchange([1, 2, 3])),
+                         [0x1001, 0x1002, 0x1003])
+        self.assertEqual(self.iface.lower.words, [1, 2, 3])
+
+    def test_fastdata_exchange_no_access(self):
+        self.iface.lower = self.MockTAP([1, 0, 1])
+        with self.assertRaisesRegex(EJTAGError, r"no pending access at word 1"):
+            self.run_coro(self.iface._fastdata_exchange([1, 2, 3]))
+
+    def mock_fastdata_copy(self, accesses):
+        calls = []
+        async def fastdata_install():
+            pass
+        async def exec_pracc_bare(code, data):
+            self.iface._change_state("FastData")
+            return [0x11, 0x22, 0x33, 0x44]
+        async def exec_pracc(code, data, entry_state):
+            calls.append(("restore", data))
+        async def exchange_control(PrAcc=None):
+            if PrAcc is not None:
+                calls.append(("complete",))
+                return
+            control, address = accesses[0]
+            if control is None:
+                return DR_CONTROL(DM=0)
+            return DR_CONTROL(DM=1, PrAcc=1, PRnW=control == "write")
+        async def read_address():
+            control, address = accesses.pop(0)
+            return address
+        async def write_data(data):
+            calls.append(("read", data))
+        self.iface._prec = 8
+        self.iface._ws   = 4
+        self.iface._mask = 0xffffffff
+        self.iface._fastdata_install = fastdata_install
+        self.iface._exec_pracc_bare  = exec_pracc_bare
+        self.iface._exec_pracc       = exec_pracc
+        self.iface._exchange_control = exchange_control
+        self.iface._read_address     = read_address
+        self.iface._write_data       = write_data
+        return calls
+
+    def test_fastdata_copy_recover(self):
+        self.iface.lower = self.MockTAP([1, 0, 1])
+        calls = self.mock_fastdata_copy([
+            ("read",  DMSEG_FASTDATA_addr & 0xffffffff),
+            ("read",  DMSEG_FASTDATA_addr & 0xffffffff),
+            ("read",  DMSEG_TRAP_addr & 0xffffffff),
+        ])
+        with self.assertRaisesRegex(EJTAGError, r"no pending access at word 1"):
+            self.run_coro(self.iface._fastdata_copy_words(0x80000000, [1, 2, 3], is_read=False))
+        self.assertEqual(calls, [
+            ("read", 0), ("complete",),
+            ("read", 0), ("complete",),
+            ("restore", [0x11, 0x22, 0x33, 0x44]),
+        ])
+
+    def test_fastdata_copy_unrecoverable(self):
+        self.iface.lower = self.MockTAP([1, 0, 1])
+        calls = self.mock_fastdata_copy([
+            ("read", DMSEG_FASTDATA_addr & 0xffffffff),
+            (None,   None),
+        ])
+        with self.assertRaisesRegex(EJTAGError, r"cannot be recovered \(FASTDATA: debug mode "
+                                                r"exited\); reset the target"):
+            self.run_coro(self.iface._fastdata_copy_words(0x80000000, [1, 2, 3], is_read=False))
+        self.assertEqual(self.iface._state, "Unusable")
+        self.assertNotIn(("restore", [0x11, 0x22, 0x33, 0x44]), calls)
+
+    def test_fastdata_usable(self):
+        self.assertTrue(self.iface._fastdata_usable(0x80000000, 0x400))
+        self.assertFalse(self.iface._fastdata_usable(0x80000000, 0x401))
+        self.assertFalse(self.iface._fastdata_usable(0x80001038, 1))
+        self.assertTrue(self.iface._fastdata_usable(0x80001038, 16))
+        self.iface.bits = 64
+        self.assertFalse(self.iface._fastdata_usable(0x80000000, 0x400))
+
+    def test_read_memory_split(self):
+        calls = []
+        async def read_bytes(address, length):
+            calls.append(("bytes", address, length))
+            return bytes(range(address & 0xff, (address & 0xff) + length))
+        async def read_words(address, count):
+            calls.append(("words", address, count))
+            # Big endian, like the CPU.
+            return [int.from_bytes(bytes(range((address & 0xff) + n * 4,
+                                               (address & 0xff) + n * 4 + 4)), "big")
+                    for n in range(count)]
+        self.iface._pracc_read_memory = read_bytes
+        self.iface._read_words = read_words
+        self.assertEqual(self.run_coro(self.iface.target_read_memory(0x80000002, 11)),
+                         bytes([2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]))
+        self.assertEqual(calls, [("bytes", 0x80000002, 2), ("words", 0x80000004, 2),
+                                 ("bytes", 0x8000000c, 1)])
+        calls.clear()
+        self.assertEqual(self.run_coro(self.iface.target_read_memory(0x80000001, 2)),
+                         bytes([1, 2]))
+        self.assertEqual(calls, [("bytes", 0x80000001, 2)])
@@ -219,12 +219,14 @@ class DisplayHD44780Applet(GlasgowApplet, name="display-hd44780"):
 
     @classmethod
     def add_run_arguments(cls, parser, access):
+        access.add_xfer_arguments(parser)
+
         parser.add_argument(
             "--reset", default=False, action="store_true",
             help="power-cycle the port on startup")
 
     async def run(self, device, args):
-        iface = await device.demultiplexer.claim_interface(self, self.mux_interface, args=None)
+        iface = await device.demultiplexer.claim_interface(self, self.mux_interface, args)
 
         if args.reset:
             await device.set_voltage(args.port_spec, 0.0)
@@ -1,3 +1,4 @@
+import io
 import logging
 import argparse
 from vcd import VCDWriter
@@ -34,6 +35,60 @@ class AnalyzerSubtarget(Elaboratable):
         return m
 
 
+class AnalyzerVCDWriter:
+    """
+    Writes the timeline of the ``pin`` event source as VCD waveforms, with one variable per pin.
+    Used both while capturing and when converting undecoded captures, so that the two produce
+    identical files.
+    """
+    def __init__(self, file, width, sample_freq, comment=""):
+        self.sample_freq = sample_freq
+
+        self._vcd_writer = VCDWriter(file, timescale="1 ns", check_values=False,
+                                     comment=comment)
+        self._signals = []
+        for index in range(width):
+            self._signals.append(self._vcd_writer.register_var(scope="",
+                name="pin[{}]".format(index), var_type="wire", size=1, init=0))
+        self._value     = 0
+        self._timestamp = 0
+
+    def write(self, columns):
+        """
+        Write the events from ``columns``, a :class:`TraceColumns`. Returns ``True`` if the trace
+        ends with an overrun (after marking every pin as undefined), ``False`` otherwise.
+        """
+        timestamps  = columns.timestamps
+        sample_freq = self.sample_freq
+        change      = self._vcd_writer.change
+        signals     = self._signals
+        value       = self._value
+        if "pin" in columns.columns: # could be also "throttle"
+            indexes, values = columns.columns["pin"]
+            for index, new_value in zip(indexes, values):
+                changed = value ^ new_value
+                if not changed:
+                    continue
+                timestamp = timestamps[index] * 1_000_000_000 // sample_freq
+                for bit, signal in enumerate(signals):
+                    if (changed >> bit) & 1:
+                        change(signal, timestamp, (new_value >> bit) & 1)
+                value = new_value
+        self._value = value
+        if timestamps:
+            self._timestamp = timestamps[-1] * 1_000_000_000 // sample_freq
+
+        if columns.overrun is not None:
+            self._timestamp = columns.overrun * 1_000_000_000 // sample_freq
+            for signal in signals:
+                change(signal, self._timestamp, "x")
+            return True
+        return False
+
+    def close(self):
+        self._vcd_writer.close(self._timestamp)
+
+
 class AnalyzerInterface:
     def __init__(self, interface, event_sources):
         self.lower   = interface
@@ -41,7 +96,10 @@ class AnalyzerInterface:
 
     async def read(self):
         self.decoder.process(await self.lower.read())
-        return self.decoder.flush()
+        return self.decoder.flush_columns()
+
+    async def read_raw(self):
+        return await self.lower.read()
 
 
 class AnalyzerApplet(GlasgowApplet, name="analyzer"):
@@ -49,6 +107,10 @@ class AnalyzerApplet(GlasgowApplet, name="analyzer"):
     help = "capture logic waveforms"
     description = """
     Capture waveforms, similar to a logic analyzer.
+
+    If the waveforms change too quickly to be converted to VCD in real time, use `--raw` to save
+    the undecoded capture instead, and convert it to VCD afterwards using
+    `glasgow tool analyzer convert`.
     """
 
     @classmethod
@@ -93,37 +155,97 @@ class AnalyzerApplet(GlasgowApplet, name="analyzer"):
     @classmethod
     def add_interact_arguments(cls, parser):
         parser.add_argument(
-            "file", metavar="VCD-FILE", type=argparse.FileType("w"),
-            help="write VCD waveforms to VCD-FILE")
+            "--raw", default=False, action="store_true",
+            help="write undecoded capture instead of VCD waveforms")
+        parser.add_argument(
+            "file", metavar="FILE", type=argparse.FileType("wb"),
+            help="write VCD waveforms (or undecoded capture) to FILE")
 
     async def interact(self, device, args, iface):
-        vcd_writer = VCDWriter(args.file, timescale="1 ns", check_values=False)
-        signals = []
-        for index in range(self._event_sources[0].width):
-            signals.append(vcd_writer.register_var(scope="", name="pin[{}]".format(index),
-                var_type="wire", size=1, init=0))
+        if args.raw:
+            await self._interact_raw(device, args, iface)
+        else:
+            with io.TextIOWrapper(args.file, encoding="ascii") as vcd_file:
+                await self._interact_vcd(device, args, iface, vcd_file)
+
+    async def _interact_raw(self, device, args, iface):
+        capture = TraceCaptureWriter(args.file, self._event_sources, self._sample_freq,
+                                     await device.bitstream_id(), applet=self.name)
+        try:
+            while True:
+                capture.write(await iface.read_raw())
+        finally:
+            capture.flush()
 
+    async def _interact_vcd(self, device, args, iface, vcd_file):
+        vcd_writer = AnalyzerVCDWriter(vcd_file, self._event_sources[0].width, self._sample_freq,
+            comment="Generated by Glasgow for bitstream ID {}"
+                    .format((await device.bitstream_id()).hex()))
         try:
-            overrun = False
-            timestamp = 0
-            while not overrun:
-                for cycle, events in await iface.read():
-                    timestamp = cycle * 1_000_000_000 // self._sample_freq
-
-                    if events == "overrun":
-                        self.logger.error("FIFO overrun, shutting down")
-                        for signal in signals:
-                            vcd_writer.change(signal, timestamp, "x")
-                        overrun = True
-                        break
+            while True:
+                if vcd_writer.write(await iface.read()):
+                    self.logger.error("FIFO overrun, shutting down")
+                    break
+        finally:
+            vcd_writer.close()
 
-                    if "pin" in events: # could be also "throttle"
-                        value = events["pin"]
-                        for bit, signal in enumerate(signals):
-                            vcd_writer.change(signal, timestamp, (value >> bit) & 1)
 
-        finally:
-            vcd_writer.close(timestamp)
+class AnalyzerAppletTool(GlasgowAppletTool, applet=AnalyzerApplet):
+    help = "convert analyzer captures"
+    description = """
+    Convert undecoded captures saved with `glasgow run analyzer --raw` or
+    `glasgow run --trace-raw` to VCD waveforms.
+    """
+
+    @classmethod
+    def add_arguments(cls, parser):
+        p_operation = parser.add_subparsers(dest="operation", metavar="OPERATION", required=True)
+
+        p_convert = p_operation.add_parser(
+            "convert", help="convert undecoded capture to VCD")
+        p_convert.add_argument(
+            "capture_file", metavar="CAPTURE-FILE", type=argparse.FileType("rb"),
+            help="read undecoded capture from CAPTURE-FILE")
+        p_convert.add_argument(
+            "vcd_file", metavar="VCD-FILE", type=argparse.FileType("w"),
+            help="write VCD waveforms to VCD-FILE")
+
+    async def run(self, args):
+        if args.operation == "convert":
+            try:
+                capture = TraceCaptureReader(args.capture_file)
+            except TraceCaptureError as e:
+                raise GlasgowAppletError(e)
+
+            if capture.bitstream_id is None:
+                comment = "Generated by Glasgow"
+            else:
+                comment = "Generated by Glasgow for bitstream ID {}" \
+                          .format(capture.bitstream_id.hex())
+            decoder = TraceDecoder(capture.event_sources)
+            if capture.applet == self.applet_cls.name:
+                # Saved with `glasgow run analyzer --raw`; write the same waveforms as
+                # `glasgow run analyzer` would.
+                vcd_writer = AnalyzerVCDWriter(args.vcd_file, capture.event_sources[0].width,
+                                               capture.sample_freq, comment=comment)
+            else:
+                vcd_writer = TraceVCDWriter(args.vcd_file, decoder, capture.sample_freq,
+                                            comment=comment)
+            try:
+                for data in capture:
+                    try:
+                        decoder.process(data)
+                    except TraceDecodingError as e:
+                        raise GlasgowAppletError(e)
+                    if vcd_writer.write(decoder.flush_columns()):
+                        self.logger.error("capture ends with a FIFO overrun")
+                        break
+                    if decoder.is_done():
+                        break
+                else:
+                    vcd_writer.write(decoder.flush_columns(pending=True))
+            finally:
+                vcd_writer.close()
 
 # -------------------------------------------------------------------------------------------------
 
@@ -276,6 +276,37 @@ class JTAGProbeStateTransitionError(JTAGProbeError):
         self.new_state = new_state
 
 
+class JTAGProbeDeferredResult:
+    """
+    The result of a deferred shift operation.
+
+    Awaiting a deferred result reads the responses to every deferred operation queued so far
+    with a single read, and then returns the result of this operation.
+    """
+    def __init__(self, iface, byte_count, convert):
+        self._iface      = iface
+        self._byte_count = byte_count
+        self._convert    = convert
+        self._done       = False
+        self._result     = None
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        assert self._done
+        return self._result
+
+    def _resolve(self, data):
+        self._result = self._convert(data)
+        self._done   = True
+
+    def __await__(self):
+        if not self._done:
+            yield from self._iface._read_deferred().__await__()
+        return self._result
+
+
 class JTAGProbeInterface:
     scan_ir_max_length = 128
     scan_dr_max_length = 1024
@@ -289,6 +320,8 @@ class JTAGProbeInterface:
         self._state      = "Unknown"
         self._current_ir = None
 
+        self._deferred   = []
+
     def _log_l(self, message, *args):
         self._logger.log(self._level, "JTAG-L: " + message, *args)
 
@@ -301,6 +334,36 @@ class JTAGProbeInterface:
         self._log_l("flush")
         await self.lower.flush()
 
+    # Responses from the probe arrive in the same order as the commands that request them, so
+    # commands that return data are queued together with a result object, and the responses
+    # to every command queued so far are retrieved at once by the first read that needs any
+    # of them.
+
+    def _defer_read(self, byte_count, convert):
+        result = JTAGProbeDeferredResult(self, byte_count, convert)
+        self._deferred.append(result)
+        return result
+
+    async def _read_deferred(self):
+        deferred, self._deferred = self._deferred, []
+        if not deferred:
+            return
+        self._log_l("read deferred count=%d", len(deferred))
+        data   = memoryview(await self.lower.read(sum(d._byte_count for d in deferred)))
+        offset = 0
+        for result in deferred:
+            result._resolve(data[offset:offset + result._byte_count])
+            offset += result._byte_count
+
+    async def _read(self, byte_count, convert):
+        result = self._defer_read(byte_count, convert)
+        await self._read_deferred()
+        return result.result()
+
+    async def sync(self):
+        """Wait until the results of all deferred operations are available."""
+        await self._read_deferred()
+
     async def set_aux(self, value):
         self._log_l("set aux=%s", format(value, "08b"))
         await self.lower.write(struct.pack("<BB",
@@ -309,7 +372,7 @@ class JTAGProbeInterface:
     async def get_aux(self):
         await self.lower.write(struct.pack("<B",
             CMD_GET_AUX))
-        value, = await self.lower.read(1)
+        value = await self._read(1, lambda data: data[0])
         self._log_l("get aux=%s", format(value, "08b"))
         return value
 
@@ -339,8 +402,11 @@ class JTAGProbeInterface:
                 self._log_l("state Shift-DR → Exit1-DR")
                 self._state = "Exit1-DR"
 
+    # Only the last chunk of a shift is not a multiple of 8 bits long, so that the responses to
+    # all chunks form a contiguous bit sequence.
+
     @staticmethod
-    def _chunk_count(count, last, chunk_size=0xffff):
+    def _chunk_count(count, last, chunk_size=0xfff8):
         assert count >= 0
         while count > chunk_size:
             yield chunk_size, False
@@ -348,7 +414,7 @@ class JTAGProbeInterface:
         yield count, last
 
     @staticmethod
-    def _chunk_bits(bits, last, chunk_size=0xffff):
+    def _chunk_bits(bits, last, chunk_size=0xfff8):
         offset = 0
         while len(bits) - offset > chunk_size:
             yield bits[offset:offset + chunk_size], False
@@ -360,24 +426,36 @@ class JTAGProbeInterface:
             await self.lower.write(struct.pack("<BH",
                 CMD_SHIFT_TDIO|(BIT_LAST if chunk_last else 0), count))
 
-    async def shift_tdio(self, tdi_bits, *, prefix=0, suffix=0, last=True):
+    def _defer_tdo(self, count, prefix, suffix, message):
+        def convert(tdo_bytes):
+            tdo_bits = bits(tdo_bytes, count)
+            self._log_l(message, prefix, dump_bin(tdo_bits), suffix)
+            return tdo_bits
+        return self._defer_read((count + 7) // 8, convert)
+
+    async def shift_tdio(self, tdi_bits, *, prefix=0, suffix=0, last=True, defer=False):
+        """
+        Shift ``tdi_bits`` into TDI while capturing TDO.
+
+        If ``defer`` is true, returns a :class:`JTAGProbeDeferredResult` instead of waiting for
+        the captured bits; any number of deferred operations can be queued before awaiting their
+        results.
+        """
         assert self._state in ("Shift-IR", "Shift-DR")
         tdi_bits = bits(tdi_bits)
-        tdo_bits = bits()
         self._log_l("shift tdio-i=%d,<%s>,%d", prefix, dump_bin(tdi_bits), suffix)
         await self._shift_dummy(prefix)
-        for tdi_bits, chunk_last in self._chunk_bits(tdi_bits, last and suffix == 0):
+        for chunk_bits, chunk_last in self._chunk_bits(tdi_bits, last and suffix == 0):
             await self.lower.write(struct.pack("<BH",
                 CMD_SHIFT_TDIO|BIT_DATA_IN|BIT_DATA_OUT|(BIT_LAST if chunk_last else 0),
-                len(tdi_bits)))
-            tdi_bytes = bytes(tdi_bits)
-            await self.lower.write(tdi_bytes)
-            tdo_bytes = await self.lower.read(len(tdi_bytes))
-            tdo_bits += bits(tdo_bytes, len(tdi_bits))
+                len(chunk_bits)))
+            await self.lower.write(bytes(chunk_bits))
+        result = self._defer_tdo(len(tdi_bits), prefix, suffix, "shift tdio-o=%d,<%s>,%d")
         await self._shift_dummy(suffix, last)
-        self._log_l("shift tdio-o=%d,<%s>,%d", prefix, dump_bin(tdo_bits), suffix)
         self._shift_last(last)
-        return tdo_bits
+        if defer:
+            return result
+        return await result
 
     async def shift_tdi(self, tdi_bits, *, prefix=0, suffix=0, last=True):
         assert self._state in ("Shift-IR", "Shift-DR")
@@ -393,20 +471,24 @@ class JTAGProbeInterface:
         await self._shift_dummy(suffix, last)
         self._shift_last(last)
 
-    async def shift_tdo(self, count, *, prefix=0, suffix=0, last=True):
+    async def shift_tdo(self, count, *, prefix=0, suffix=0, last=True, defer=False):
+        """
+        Capture ``count`` bits from TDO.
+
+        If ``defer`` is true, returns a :class:`JTAGProbeDeferredResult`; see :meth:`shift_tdio`.
+        """
         assert self._state in ("Shift-IR", "Shift-DR")
-        tdo_bits = bits()
         await self._shift_dummy(prefix)
-        for count, chunk_last in self._chunk_count(count, last and suffix == 0):
+        for chunk_count, chunk_last in self._chunk_count(count, last and suffix == 0):
             await self.lower.write(struct.pack("<BH",
                 CMD_SHIFT_TDIO|BIT_DATA_IN|(BIT_LAST if chunk_last else 0),
-                count))
-            tdo_bytes = await self.lower.read((count + 7) // 8)
-            tdo_bits += bits(tdo_bytes, count)
+                chunk_count))
+        result = self._defer_tdo(count, prefix, suffix, "shift tdo=%d,<%s>,%d")
         await self._shift_dummy(suffix, last)
-        self._log_l("shift tdo=%d,<%s>,%d", prefix, dump_bin(tdo_bits), suffix)
         self._shift_last(last)
-        return tdo_bits
+        if defer:
+            return result
+        return await result
 
     async def pulse_tck(self, count):
         assert self._state in ("Run-Test/Idle", "Pause-IR", "Pause-DR")
@@ -546,21 +628,27 @@ class JTAGProbeInterface:
         await self.enter_run_test_idle()
         await self.pulse_tck(count)
 
-    async def exchange_ir(self, data, *, prefix=0, suffix=0):
+    async def exchange_ir(self, data, *, prefix=0, suffix=0, defer=False):
         data = bits(data)
         self._current_ir = (prefix, data, suffix)
         self._log_h("exchange ir-i=%d,<%s>,%d", prefix, dump_bin(data), suffix)
         await self.enter_shift_ir()
-        data = await self.shift_tdio(data, prefix=prefix, suffix=suffix)
+        result = await self.shift_tdio(data, prefix=prefix, suffix=suffix, defer=True)
         await self.enter_update_ir()
+        if defer:
+            return result
+        data = await result
         self._log_h("exchange ir-o=%d,<%s>,%d", prefix, dump_bin(data), suffix)
         return data
 
-    async def read_ir(self, count, *, prefix=0, suffix=0):
+    async def read_ir(self, count, *, prefix=0, suffix=0, defer=False):
         self._current_ir = (prefix, bits((1,)) * count, suffix)
         await self.enter_shift_ir()
-        data = await self.shift_tdo(count, prefix=prefix, suffix=suffix)
+        result = await self.shift_tdo(count, prefix=prefix, suffix=suffix, defer=True)
         await self.enter_update_ir()
+        if defer:
+            return result
+        data = await result
         self._log_h("read ir=%d,<%s>,%d", prefix, dump_bin(data), suffix)
         return data
 
@@ -575,18 +663,24 @@ class JTAGProbeInterface:
         await self.shift_tdi(data, prefix=prefix, suffix=suffix)
         await self.enter_update_ir()
 
-    async def exchange_dr(self, data, *, prefix=0, suffix=0):
+    async def exchange_dr(self, data, *, prefix=0, suffix=0, defer=False):
         self._log_h("exchange dr-i=%d,<%s>,%d", prefix, dump_bin(data), suffix)
         await self.enter_shift_dr()
-        data = await self.shift_tdio(data, prefix=prefix, suffix=suffix)
+        result = await self.shift_tdio(data, prefix=prefix, suffix=suffix, defer=True)
         await self.enter_update_dr()
+        if defer:
+            return result
+        data = await result
         self._log_h("exchange dr-o=%d,<%s>,%d", prefix, dump_bin(data), suffix)
         return data
 
-    async def read_dr(self, count, *, prefix=0, suffix=0):
+    async def read_dr(self, count, *, prefix=0, suffix=0, defer=False):
         await self.enter_shift_dr()
-        data = await self.shift_tdo(count, prefix=prefix, suffix=suffix)
+        result = await self.shift_tdo(count, prefix=prefix, suffix=suffix, defer=True)
         await self.enter_update_dr()
+        if defer:
+            return result
+        data = await result
         self._log_h("read dr=%d,<%s>,%d", prefix, dump_bin(data), suffix)
         return data
 
@@ -825,14 +919,14 @@ class TAPInterface:
     async def run_test_idle(self, count):
         await self.lower.run_test_idle(count)
 
-    async def exchange_ir(self, data):
+    async def exchange_ir(self, data, *, defer=False):
         data = bits(data)
         assert len(data) == self.ir_length
-        return await self.lower.exchange_ir(data,
+        return await self.lower.exchange_ir(data, defer=defer,
             prefix=self._ir_prefix, suffix=self._ir_suffix)
 
-    async def read_ir(self):
-        return await self.lower.read_ir(self.ir_length,
+    async def read_ir(self, *, defer=False):
+        return await self.lower.read_ir(self.ir_length, defer=defer,
             prefix=self._ir_prefix, suffix=self._ir_suffix)
 
     async def write_ir(self, data, *, elide=True):
@@ -841,14 +935,17 @@ class TAPInterface:
         await self.lower.write_ir(data, elide=elide,
             prefix=self._ir_prefix, suffix=self._ir_suffix)
 
-    async def exchange_dr(self, data):
-        return await self.lower.exchange_dr(data,
+    async def exchange_dr(self, data, *, defer=False):
+        return await self.lower.exchange_dr(data, defer=defer,
             prefix=self._dr_prefix, suffix=self._dr_suffix)
 
-    async def read_dr(self, length):
-        return await self.lower.read_dr(length,
+    async def read_dr(self, length, *, defer=False):
+        return await self.lower.read_dr(length, defer=defer,
             prefix=self._dr_prefix, suffix=self._dr_suffix)
 
+    async def sync(self):
+        await self.lower.sync()
+
     async def write_dr(self, data):
         await self.lower.write_dr(data,
             prefix=self._dr_prefix, suffix=self._dr_suffix)
@@ -877,6 +974,126 @@ class TAPInterface:
         return length - self._dr_prefix - self._dr_suffix
 
 
+class MultiTAPInterface:
+    """
+    Several TAPs of a chain operated in lockstep, with the rest of the chain in BYPASS.
+
+    Every IR and DR operation takes (or returns) a list with one value per selected TAP, in
+    the order of their indexes, and performs a single scan through all of them. This makes it
+    possible to drive several identical devices at the cost of driving one.
+    """
+    @classmethod
+    def from_layout(cls, lower, ir_layout, *, indexes):
+        indexes = sorted(set(indexes))
+        if not indexes:
+            raise JTAGProbeError("no TAPs selected")
+        for index in indexes:
+            if index not in range(len(ir_layout)):
+                raise JTAGProbeError("TAP #{:d} is not a part of {:d}-TAP chain"
+                                     .format(index, len(ir_layout)))
+
+        # TAPs before the first and after the last selected one are covered by prefix and
+        # suffix bits, and TAPs in between them by explicitly shifted BYPASS bits.
+        first, last = indexes[0], indexes[-1]
+        return cls(lower, indexes=indexes,
+            span=[(index in indexes, ir_layout[index]) for index in range(first, last + 1)],
+            ir_prefix=sum(ir_layout[:first]), ir_suffix=sum(ir_layout[last + 1:]),
+            dr_prefix=first, dr_suffix=len(ir_layout) - last - 1)
+
+    @classmethod
+    def from_tap(cls, tap_iface, *, index=0):
+        """
+        Operate on the single TAP of ``tap_iface``, so that code written for several TAPs can
+        be used with one as well.
+        """
+        return cls(tap_iface.lower, indexes=[index], span=[(True, tap_iface.ir_length)],
+            ir_prefix=tap_iface._ir_prefix, ir_suffix=tap_iface._ir_suffix,
+            dr_prefix=tap_iface._dr_prefix, dr_suffix=tap_iface._dr_suffix)
+
+    def __init__(self, lower, *, indexes, span, ir_prefix=0, ir_suffix=0, dr_prefix=0,
+                 dr_suffix=0):
+        self.lower      = lower
+        self.indexes    = list(indexes)
+        self.ir_lengths = [ir_length for selected, ir_length in span if selected]
+        self._span      = span
+        self._ir_prefix = ir_prefix
+        self._ir_suffix = ir_suffix
+        self._dr_prefix = dr_prefix
+        self._dr_suffix = dr_suffix
+
+    def _join(self, values, bypass):
+        assert len(values) == len(self.indexes)
+        values = iter(values)
+        data = bits()
+        for selected, ir_length in self._span:
+            data += bits(next(values)) if selected else bypass(ir_length)
+        return data
+
+    def _split(self, data, lengths, bypass_length):
+        lengths = iter(lengths)
+        values  = []
+        offset  = 0
+        for selected, ir_length in self._span:
+            length = next(lengths) if selected else bypass_length(ir_length)
+            if selected:
+                values.append(data[offset:offset + length])
+            offset += length
+        return values
+
+    def _join_ir(self, data):
+        data = [bits(value) for value in data]
+        assert [len(value) for value in data] == self.ir_lengths
+        return self._join(data, lambda ir_length: bits((1 << ir_length) - 1, ir_length))
+
+    def _split_ir(self, data):
+        return self._split(data, self.ir_lengths, lambda ir_length: ir_length)
+
+    def _join_dr(self, data):
+        return self._join(data, lambda ir_length: bits(0, 1))
+
+    def _split_dr(self, data, lengths):
+        return self._split(data, lengths, lambda ir_length: 1)
+
+    async def test_reset(self):
+        await self.lower.test_reset()
+
+    async def run_test_idle(self, count):
+        await self.lower.run_test_idle(count)
+
+    async def sync(self):
+        await self.lower.sync()
+
+    async def exchange_ir(self, data):
+        data = await self.lower.exchange_ir(self._join_ir(data),
+            prefix=self._ir_prefix, suffix=self._ir_suffix)
+        return self._split_ir(data)
+
+    async def read_ir(self):
+        data = await self.lower.read_ir(sum(ir_length for _, ir_length in self._span),
+            prefix=self._ir_prefix, suffix=self._ir_suffix)
+        return self._split_ir(data)
+
+    async def write_ir(self, data, *, elide=True):
+        await self.lower.write_ir(self._join_ir(data), elide=elide,
+            prefix=self._ir_prefix, suffix=self._ir_suffix)
+
+    async def exchange_dr(self, data):
+        data = [bits(value) for value in data]
+        result = await self.lower.exchange_dr(self._join_dr(data),
+            prefix=self._dr_prefix, suffix=self._dr_suffix)
+        return self._split_dr(result, [len(value) for value in data])
+
+    async def read_dr(self, length):
+        count = len(self.indexes)
+        data = await self.lower.read_dr(length * count + len(self._span) - count,
+            prefix=self._dr_prefix, suffix=self._dr_suffix)
+        return self._split_dr(data, [length] * count)
+
+    async def write_dr(self, data):
+        await self.lower.write_dr(self._join_dr(data),
+            prefix=self._dr_prefix, suffix=self._dr_suffix)
+
+
 class JTAGProbeApplet(GlasgowApplet, name="jtag-probe"):
     logger = logging.getLogger(__name__)
     help = "test integrated circuits via IEEE 1149.1 JTAG"
@@ -1225,6 +1442,141 @@ class JTAGInterrogationTestCase(unittest.TestCase):
                          [3, 5])
 
 
+class JTAGProbeShiftTestCase(unittest.TestCase):
+    class MockProbe:
+        # Interprets the probe command stream, looping TDI back to TDO, and returning ones
+        # when TDI is not driven.
+        def __init__(self):
+            self.out_buffer = bytearray()
+            self.in_buffer  = bytearray()
+            self.reads      = []
+
+        async def write(self, data):
+            self.out_buffer += bytes(data)
+
+        async def flush(self):
+            pass
+
+        async def read(self, length):
+            while self.out_buffer:
+                cmd = self.out_buffer.pop(0)
+                if cmd & CMD_MASK == CMD_GET_AUX:
+                    self.in_buffer.append(0)
+                    continue
+                if cmd & CMD_MASK == CMD_SET_AUX:
+                    del self.out_buffer[:1]
+                    continue
+                count = int.from_bytes(self.out_buffer[:2], "little")
+                del self.out_buffer[:2]
+                if cmd & BIT_DATA_OUT:
+                    data = bytes(self.out_buffer[:(count + 7) // 8])
+                    del self.out_buffer[:(count + 7) // 8]
+                else:
+                    data = bytes([0xff]) * ((count + 7) // 8)
+                if cmd & CMD_MASK == CMD_SHIFT_TDIO and cmd & BIT_DATA_IN:
+                    self.in_buffer += bytes(bits(data, count))
+            self.reads.append(length)
+            data = bytes(self.in_buffer[:length])
+            del self.in_buffer[:length]
+            return data
+
+    def setUp(self):
+        self.lower = self.MockProbe()
+        self.iface = JTAGProbeInterface(self.lower, logging.getLogger(__name__))
+
+    def run_iface(self, coro):
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+    def test_shift_long(self):
+        async def case():
+            await self.iface.test_reset()
+            data = bits(0x123456789abcdef << 100000, 200000)
+            return await self.iface.exchange_dr(data)
+        self.assertEqual(self.run_iface(case()), bits(0x123456789abcdef << 100000, 200000))
+        self.assertEqual(self.lower.reads, [25000])
+
+    def test_deferred(self):
+        async def case():
+            await self.iface.test_reset()
+            results = [
+                await self.iface.exchange_ir("10101", defer=True),
+                await self.iface.exchange_dr("110", defer=True),
+                await self.iface.read_dr(12, defer=True),
+            ]
+            aux = await self.iface.get_aux()
+            self.assertTrue(all(result.done() for result in results))
+            results.append(await self.iface.exchange_dr("0111", defer=True))
+            self.assertFalse(results[-1].done())
+            return [await result for result in results], aux
+        results, aux = self.run_iface(case())
+        self.assertEqual(results, [bits("10101"), bits("110"), bits("111111111111"),
+                                   bits("0111")])
+        self.assertEqual(aux, 0)
+        self.assertEqual(self.lower.reads, [1 + 1 + 2 + 1, 1])
+
+
+class MultiTAPInterfaceTestCase(unittest.TestCase):
+    class MockJTAGProbe:
+        # Records the scans, looping DR data back.
+        def __init__(self):
+            self.scans = []
+
+        async def write_ir(self, data, *, prefix, suffix, elide):
+            self.scans.append(("ir", data, prefix, suffix))
+
+        async def exchange_dr(self, data, *, prefix, suffix):
+            self.scans.append(("dr", data, prefix, suffix))
+            return data
+
+        async def read_dr(self, count, *, prefix, suffix):
+            self.scans.append(("dr", count, prefix, suffix))
+            return bits((1 << count) - 1, count)
+
+    def setUp(self):
+        self.lower = self.MockJTAGProbe()
+        self.iface = MultiTAPInterface.from_layout(self.lower, [4, 8, 6, 8, 5], indexes=[3, 1])
+
+    def run_iface(self, coro):
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+    def test_from_layout(self):
+        self.assertEqual(self.iface.indexes, [1, 3])
+        self.assertEqual(self.iface.ir_lengths, [8, 8])
+        with self.assertRaises(JTAGProbeError):
+            MultiTAPInterface.from_layout(self.lower, [4, 8], indexes=[1, 2])
+        with self.assertRaises(JTAGProbeError):
+            MultiTAPInterface.from_layout(self.lower, [4, 8], indexes=[])
+
+    def test_write_ir(self):
+        self.run_iface(self.iface.write_ir([bits("10101010"), bits("11001100")]))
+        self.assertEqual(self.lower.scans, [
+            ("ir", bits("10101010") + bits("111111") + bits("11001100"), 4, 5),
+        ])
+
+    def test_exchange_dr(self):
+        data = [bits(0x155, 10), bits(0x2aa, 10)]
+        self.assertEqual(self.run_iface(self.iface.exchange_dr(data)), data)
+        self.assertEqual(self.lower.scans, [
+            ("dr", bits(0x155, 10) + bits(0, 1) + bits(0x2aa, 10), 1, 1),
+        ])
+
+    def test_read_dr(self):
+        self.assertEqual(self.run_iface(self.iface.read_dr(3)), [bits("111"), bits("111")])
+        self.assertEqual(self.lower.scans, [("dr", 7, 1, 1)])
+
+    def test_from_tap(self):
+        tap_iface = TAPInterface.from_layout(self.lower, [4, 8, 6], index=1)
+        iface = MultiTAPInterface.from_tap(tap_iface, index=1)
+        self.assertEqual(iface.indexes, [1])
+        self.assertEqual(iface.ir_lengths, [8])
+        self.run_iface(iface.write_ir([bits("10101010")]))
+        self.assertEqual(self.run_iface(iface.exchange_dr([bits("101")])), [bits("101")])
+        self.assertEqual(self.lower.scans, [
+            ("ir", bits("10101010"), 4, 6),
+            ("dr", bits("101"), 1, 1),
+        ])
+
+
 class JTAGProbeAppletTestCase(GlasgowAppletTestCase, applet=JTAGProbeApplet):
     @synthesis_test
     def test_build(self):
@@ -3,6 +3,7 @@
 # Ref: http://www.jtagtest.com/pdf/svf_specification.pdf
 # Accession: G00023
 
+import mmap
 import struct
 import logging
 import argparse
@@ -26,9 +27,18 @@ class SVFOperation:
         self.tdo   = tdo
         self.mask  = mask
 
+    def __bool__(self):
+        return len(self.tdi) > 0
+
     def __add__(self, other):
         assert isinstance(other, SVFOperation)
 
+        # Header and trailer are usually empty; avoid copying scan data in that case.
+        if not self:
+            return other
+        if not other:
+            return self
+
         if self.tdo is None and other.tdo is None:
             # Propagate "TDO don't care".
             tdo = None
@@ -44,12 +54,29 @@ class SVFOperation:
 
 
 class SVFInterface(SVFEventHandler):
-    def __init__(self, interface, logger, frequency):
+    """
+    An SVF player.
+
+    If ``pipeline`` is true, scans that check TDO do not wait for the captured data; instead,
+    they are checked in batches once ``pipeline_bytes`` bytes of TDO data are outstanding, and
+    when :meth:`check_pending` is called. This removes a USB round trip per scan, but a failing
+    check is only reported after the commands following it have been executed.
+
+    If the player sets :attr:`line` to the line number of each command, failing checks report it.
+    """
+    pipeline_bytes = 65536
+
+    def __init__(self, interface, logger, frequency, *, pipeline=False):
         self.lower   = interface
         self._logger = logger
         self._level  = logging.DEBUG if self._logger.name == __name__ else logging.TRACE
         self._frequency = frequency
 
+        self.pipeline = pipeline
+        self.line     = None
+        self._pending = []
+        self._pending_bytes = 0
+
         self._endir  = "IDLE"
         self._enddr  = "IDLE"
 
@@ -125,28 +152,49 @@ class SVFInterface(SVFEventHandler):
     async def svf_tdr(self, tdi, smask, tdo, mask):
         self._tdr = SVFOperation(tdi, smask, tdo, mask)
 
-    async def svf_sir(self, tdi, smask, tdo, mask):
-        op = self._hir + SVFOperation(tdi, smask, tdo, mask) + self._tir
-        await self.lower.enter_shift_ir()
+    @staticmethod
+    def _check_tdo(command, line, op, tdo):
+        if tdo & op.mask != op.tdo & op.mask:
+            if line is None:
+                where = ""
+            else:
+                where = " at line %d" % line
+            raise SVFError("%s command%s failed: TDO <%s> & <%s> != <%s>"
+                           % (command, where, dump_bin(tdo), dump_bin(op.mask), dump_bin(op.tdo)))
+
+    async def _shift(self, command, op):
         if op.tdo is None:
             await self.lower.shift_tdi(op.tdi)
+        elif self.pipeline:
+            result = await self.lower.shift_tdio(op.tdi, defer=True)
+            self._pending.append((command, self.line, op, result))
+            self._pending_bytes += (len(op.tdi) + 7) // 8
+            if self._pending_bytes >= self.pipeline_bytes:
+                await self.check_pending()
         else:
             tdo = await self.lower.shift_tdio(op.tdi)
-            if tdo & op.mask != op.tdo & op.mask:
-                raise SVFError("SIR command failed: TDO <%s> & <%s> != <%s>"
-                               % (dump_bin(tdo), dump_bin(op.mask), dump_bin(op.tdo)))
+            self._check_tdo(command, self.line, op, tdo)
+
+    async def check_pending(self):
+        """Wait for the TDO data of all pipelined scans and check it."""
+        pending, self._pending, self._pending_bytes = self._pending, [], 0
+        if not pending:
+            return
+        self._log("check %d pipelined scans", len(pending))
+        await self.lower.sync()
+        for command, line, op, result in pending:
+            self._check_tdo(command, line, op, result.result())
+
+    async def svf_sir(self, tdi, smask, tdo, mask):
+        op = self._hir + SVFOperation(tdi, smask, tdo, mask) + self._tir
+        await self.lower.enter_shift_ir()
+        await self._shift("SIR", op)
         await self._enter_state(self._endir)
 
     async def svf_sdr(self, tdi, smask, tdo, mask):
         op = self._hdr + SVFOperation(tdi, smask, tdo, mask) + self._tdr
         await self.lower.enter_shift_dr()
-        if op.tdo is None:
-            await self.lower.shift_tdi(op.tdi)
-        else:
-            tdo = await self.lower.shift_tdio(op.tdi)
-            if tdo & op.mask != op.tdo & op.mask:
-                raise SVFError("SDR command failed: TDO <%s> & <%s> != <%s>"
-                               % (dump_bin(tdo), dump_bin(op.mask), dump_bin(op.tdo)))
+        await self._shift("SDR", op)
         await self._enter_state(self._enddr)
 
     async def svf_runtest(self, run_state, run_count, run_clock, min_time, max_time, end_state):
@@ -181,6 +229,11 @@ class JTAGSVFApplet(JTAGProbeApplet, name="jtag-svf"):
         * The SCK clock in RUNTEST is not supported.
 
     If any commands requiring these features are encountered, the applet terminates itself.
+
+    With --pipeline, TDO checks do not wait for the captured data, which makes playback of large
+    test vectors much faster; however, a failing check is only reported after the commands
+    following it have been executed, so this option should not be used with test vectors that
+    rely on a check to stop before e.g. erasing a device.
     """
 
     async def run(self, device, args):
@@ -190,17 +243,116 @@ class JTAGSVFApplet(JTAGProbeApplet, name="jtag-svf"):
     @classmethod
     def add_interact_arguments(cls, parser):
         parser.add_argument(
-            "svf_file", metavar="SVF-FILE", type=argparse.FileType("r"),
+            "--pipeline", default=False, action="store_true",
+            help="check TDO in batches instead of after every scan")
+        parser.add_argument(
+            "svf_file", metavar="SVF-FILE", type=argparse.FileType("rb"),
             help="test vector to play")
 
     async def interact(self, device, args, svf_iface):
-        svf_parser = SVFParser(args.svf_file.read(), svf_iface)
+        svf_iface.pipeline = args.pipeline
+        # Map the file instead of reading it, so that playback starts immediately and uses
+        # bounded memory regardless of the size of the test vector.
+        try:
+            svf_buffer = mmap.mmap(args.svf_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError): # empty file, pipe, ...
+            svf_buffer = args.svf_file.read()
+        svf_parser = SVFParser(svf_buffer, svf_iface)
+        log_commands = self.logger.isEnabledFor(svf_iface._level)
         while True:
             coro = svf_parser.parse_command()
             if not coro: break
 
-            for line in svf_parser.last_command().split("\n"):
-                line = line.strip()
-                if line: svf_iface._log(line)
+            if log_commands:
+                for line in svf_parser.last_command().decode("latin-1").split("\n"):
+                    line = line.strip()
+                    if line: svf_iface._log(line)
+            svf_iface.line = svf_parser.last_command_line()
 
             await coro
+
+        await svf_iface.check_pending()
+
+# -------------------------------------------------------------------------------------------------
+
+import asyncio
+import unittest
+
+
+class SVFInterfaceTestCase(unittest.TestCase):
+    class MockJTAG:
+        class Result:
+            def __init__(self, tdo):
+                self._tdo = tdo
+
+            def result(self):
+                return self._tdo
+
+        def __init__(self):
+            self.tdo    = bits()
+            self.synced = False
+
+        async def enter_run_test_idle(self):
+            pass
+
+        async def enter_shift_ir(self):
+            pass
+
+        async def enter_shift_dr(self):
+            pass
+
+        async def shift_tdi(self, tdi):
+            pass
+
+        async def shift_tdio(self, tdi, defer=False):
+            tdo = self.tdo
+            if defer:
+                return self.Result(tdo)
+            return tdo
+
+        async def sync(self):
+            self.synced = True
+
+    def setUp(self):
+        self.lower = self.MockJTAG()
+        self.iface = SVFInterface(self.lower, logging.getLogger(__name__), 1e6)
+
+    def run_coro(self, coro):
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+    def test_operation_add(self):
+        op = SVFOperation(bits("0101"), bits("1111"), None, bits("0000"))
+        self.assertIs(SVFOperation() + op + SVFOperation(), op)
+        op = SVFOperation(bits("1"), bits("1"), bits("0"), bits("1")) + op
+        self.assertEqual(op.tdi, bits("01011"))
+        self.assertEqual(op.tdo, bits("00000"))
+        self.assertEqual(op.mask, bits("00001"))
+
+    def test_check(self):
+        self.lower.tdo = bits("0101")
+        self.run_coro(self.iface.svf_sdr(bits("0000"), bits("1111"), bits("0101"), bits("1111")))
+        self.iface.line = 5
+        with self.assertRaisesRegex(SVFError, r"^SDR command at line 5 failed"):
+            self.run_coro(self.iface.svf_sdr(bits("0000"), bits("1111"), bits("0110"), bits("1111")))
+
+    def test_pipeline(self):
+        self.iface.pipeline = True
+        self.lower.tdo = bits("0101")
+        self.iface.line = 3
+        self.run_coro(self.iface.svf_sir(bits("0000"), bits("1111"), bits("0101"), bits("1111")))
+        self.iface.line = 4
+        self.run_coro(self.iface.svf_sir(bits("0000"), bits("1111"), bits("0111"), bits("1101")))
+        self.iface.line = 5
+        self.run_coro(self.iface.svf_sir(bits("0000"), bits("1111"), bits("0110"), bits("1111")))
+        self.assertFalse(self.lower.synced)
+        with self.assertRaisesRegex(SVFError, r"^SIR command at line 5 failed"):
+            self.run_coro(self.iface.check_pending())
+        self.assertTrue(self.lower.synced)
+        self.run_coro(self.iface.check_pending())
+
+    def test_pipeline_limit(self):
+        self.iface.pipeline = True
+        self.iface.pipeline_bytes = 1
+        self.lower.tdo = bits("0101")
+        self.run_coro(self.iface.svf_sdr(bits("0000"), bits("1111"), bits("0101"), bits("1111")))
+        self.assertTrue(self.lower.synced)
@@ -203,6 +203,43 @@ class SPIControllerSubtarget(Module):
         )
 
 
+class SPIControllerCommandList:
+    """
+    A batch of SPI operations, executed by :meth:`SPIControllerInterface.execute` without
+    waiting for the device between operations.
+
+    Each shift operation deasserts chip select once it completes unless ``hold_ss`` is true,
+    exactly like the corresponding :class:`SPIControllerInterface` method.
+    """
+    def __init__(self):
+        self._commands = []
+
+    def __iter__(self):
+        return iter(self._commands)
+
+    def __len__(self):
+        return len(self._commands)
+
+    def write(self, data, hold_ss=False):
+        self._commands.append(("write", SPIControllerInterface._out_view(data), hold_ss))
+        return self
+
+    def transfer(self, data, hold_ss=False):
+        self._commands.append(("transfer", SPIControllerInterface._out_view(data), hold_ss))
+        return self
+
+    def read(self, count, hold_ss=False):
+        self._commands.append(("read", count, hold_ss))
+        return self
+
+    def delay_us(self, delay):
+        self._commands.append(("delay", delay))
+        return self
+
+    def delay_ms(self, delay):
+        return self.delay_us(delay * 1000)
+
+
 class SPIControllerInterface:
     def __init__(self, interface, logger):
         self.lower   = interface
@@ -231,52 +268,121 @@ class SPIControllerInterface:
             offset += chunk_size
         yield bytes[offset:], hold_ss
 
-    async def transfer(self, data, hold_ss=False):
+    @staticmethod
+    def _out_view(data):
         try:
-            out_data = memoryview(data)
+            return memoryview(data)
         except TypeError:
-            out_data = memoryview(bytes(data))
-        self._log("xfer-out=<%s>", dump_hex(out_data))
-        in_data = []
+            return memoryview(bytes(data))
+
+    async def _enqueue_shift_out(self, bits, out_data, hold_ss):
         for out_data, hold_ss in self._chunk_bytes(out_data, hold_ss):
             await self.lower.write(struct.pack("<BH",
-                CMD_SHIFT|BIT_DATA_IN|BIT_DATA_OUT|(BIT_HOLD_SS if hold_ss else 0),
+                CMD_SHIFT|bits|(BIT_HOLD_SS if hold_ss else 0),
                 len(out_data)))
             await self.lower.write(out_data)
-            in_data.append(await self.lower.read(len(out_data)))
-        in_data = b"".join(in_data)
-        self._log("xfer-in=<%s>", dump_hex(in_data))
-        return in_data
 
-    async def read(self, count, hold_ss=False):
-        in_data = []
+    async def _enqueue_shift_in(self, count, hold_ss):
         for count, hold_ss in self._chunk_count(count, hold_ss):
             await self.lower.write(struct.pack("<BH",
                 CMD_SHIFT|BIT_DATA_IN|(BIT_HOLD_SS if hold_ss else 0),
                 count))
-            in_data.append(await self.lower.read(count))
-        in_data = b"".join(in_data)
+
+    async def _enqueue_delay_us(self, delay):
+        while delay > 0xffff:
+            await self.lower.write(struct.pack("<BH", CMD_DELAY, 0xffff))
+            delay -= 0xffff
+        await self.lower.write(struct.pack("<BH", CMD_DELAY, delay))
+
+    # All of the chunk commands for an operation are queued before any of the responses are
+    # read, so that the device never waits for the host between chunks; the responses are then
+    # collected with a single read as they stream back.
+
+    async def transfer(self, data, hold_ss=False):
+        out_data = self._out_view(data)
+        self._log("xfer-out=<%s>", dump_hex(out_data))
+        await self._enqueue_shift_out(BIT_DATA_IN|BIT_DATA_OUT, out_data, hold_ss)
+        in_data = bytes(await self.lower.read(len(out_data)))
+        self._log("xfer-in=<%s>", dump_hex(in_data))
+        return in_data
+
+    async def read(self, count, hold_ss=False):
+        await self._enqueue_shift_in(count, hold_ss)
+        in_data = bytes(await self.lower.read(count))
         self._log("read-in=<%s>", dump_hex(in_data))
         return in_data
 
     async def write(self, data, hold_ss=False):
-        try:
-            out_data = memoryview(data)
-        except TypeError:
-            out_data = memoryview(bytes(data))
+        out_data = self._out_view(data)
         self._log("write-out=<%s>", dump_hex(out_data))
-        for out_data, hold_ss in self._chunk_bytes(out_data, hold_ss):
-            await self.lower.write(struct.pack("<BH",
-                CMD_SHIFT|BIT_DATA_OUT|(BIT_HOLD_SS if hold_ss else 0),
-                len(out_data)))
-            await self.lower.write(out_data)
+        await self._enqueue_shift_out(BIT_DATA_OUT, out_data, hold_ss)
+
+    async def submit(self, commands):
+        """
+        Queue a :class:`SPIControllerCommandList` for execution without waiting for its results.
+
+        Returns an opaque token that must be passed to :meth:`collect`. Several command lists
+        may be submitted before any of them are collected, which keeps the device busy while
+        the host processes earlier results; however, they must be collected in the same order
+        as they were submitted.
+        """
+        in_counts = []
+        for command, *operands in commands:
+            if command == "write":
+                out_data, hold_ss = operands
+                self._log("cmd write-out=<%s>", dump_hex(out_data))
+                await self._enqueue_shift_out(BIT_DATA_OUT, out_data, hold_ss)
+            elif command == "transfer":
+                out_data, hold_ss = operands
+                self._log("cmd xfer-out=<%s>", dump_hex(out_data))
+                await self._enqueue_shift_out(BIT_DATA_IN|BIT_DATA_OUT, out_data, hold_ss)
+                in_counts.append(len(out_data))
+            elif command == "read":
+                count, hold_ss = operands
+                self._log("cmd read count=%d", count)
+                await self._enqueue_shift_in(count, hold_ss)
+                in_counts.append(count)
+            elif command == "delay":
+                delay, = operands
+                self._log("cmd delay=%d us", delay)
+                await self._enqueue_delay_us(delay)
+            else:
+                assert False
+        return in_counts
+
+    async def collect(self, in_counts):
+        """
+        Wait for the results of a command list queued with :meth:`submit`.
+
+        Returns a list with the data received for each ``read`` and ``transfer`` command,
+        in order.
+        """
+        if in_counts:
+            in_data = await self.lower.read(sum(in_counts))
+        else:
+            await self.lower.flush()
+            in_data = b""
+        self._log("cmd in=<%s>", dump_hex(in_data))
+
+        results = []
+        offset  = 0
+        for count in in_counts:
+            results.append(bytes(in_data[offset:offset + count]))
+            offset += count
+        return results
+
+    async def execute(self, commands):
+        """
+        Execute a :class:`SPIControllerCommandList` with a single round-trip.
+
+        Returns a list with the data received for each ``read`` and ``transfer`` command,
+        in order.
+        """
+        return await self.collect(await self.submit(commands))
 
     async def delay_us(self, delay):
         self._log("delay=%d us", delay)
-        while delay > 0xffff:
-            await self.lower.write(struct.pack("<BH", CMD_DELAY, 0xffff))
-            delay -= 0xffff
-        await self.lower.write(struct.pack("<BH", CMD_DELAY, delay))
+        await self._enqueue_delay_us(delay)
 
     async def delay_ms(self, delay):
         await self.delay_us(delay * 1000)
@@ -383,3 +489,21 @@ class SPIControllerAppletTestCase(GlasgowAppletTestCase, applet=SPIControllerApp
         result = yield from spi_iface.transfer([0xAA, 0x55, 0x12, 0x34])
         self.assertEqual(result, bytearray([0xAA, 0x55, 0x12, 0x34]))
         self.assertEqual((yield mux_iface.pads.cs_t.o), 1)
+
+    @applet_simulation_test("setup_loopback",
+                            ["--pin-sck",  "0", "--pin-cs", "1",
+                             "--pin-copi", "2", "--pin-cipo",   "3",
+                             "--frequency", "5000"])
+    @asyncio.coroutine
+    def test_command_list(self):
+        mux_iface = self.applet.mux_interface
+        spi_iface = yield from self.run_simulated_applet()
+
+        commands = (SPIControllerCommandList()
+            .write([0x01, 0x02], hold_ss=True)
+            .transfer([0xAA, 0x55], hold_ss=True)
+            .delay_us(1)
+            .read(2))
+        results = yield from spi_iface.execute(commands)
+        self.assertEqual(results, [b"\xAA\x55", b"\x00\x00"])
+        self.assertEqual((yield mux_iface.pads.cs_t.o), 1)
@@ -124,6 +124,8 @@ class BenchmarkApplet(GlasgowApplet, name="benchmark"):
 
     @classmethod
     def add_run_arguments(cls, parser, access):
+        access.add_xfer_arguments(parser)
+
         parser.add_argument(
             "-c", "--count", metavar="COUNT", type=int, default=1 << 23,
             help="transfer COUNT bytes (default: %(default)s)")
@@ -133,7 +135,7 @@ class BenchmarkApplet(GlasgowApplet, name="benchmark"):
             help="run benchmark mode MODE (default: {})".format(" ".join(cls.__all_modes)))
 
     async def run(self, device, args):
-        iface = await device.demultiplexer.claim_interface(self, self.mux_interface, args=None)
+        iface = await device.demultiplexer.claim_interface(self, self.mux_interface, args)
 
         golden = bytearray()
         while len(golden) < args.count:
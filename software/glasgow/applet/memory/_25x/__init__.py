@@ -5,12 +5,15 @@ import re
 import sys
 import struct
 import logging
+import hashlib
+import inspect
 import argparse
+from collections import deque
 
 from ....support.logging import dump_hex
 from ....database.jedec import *
 from ....protocol.sfdp import *
-from ...interface.spi_controller import SPIControllerApplet
+from ...interface.spi_controller import SPIControllerApplet, SPIControllerCommandList
 from ... import *
 
 
@@ -26,10 +29,11 @@ BIT_ERR  = 0b10000000
 
 
 class Memory25xInterface:
-    def __init__(self, interface, logger):
+    def __init__(self, interface, logger, *, read_depth=4):
         self.lower       = interface
         self._logger     = logger
         self._level      = logging.DEBUG if self._logger.name == __name__ else logging.TRACE
+        self._read_depth = read_depth
 
     def _log(self, message, *args):
         self._logger.log(self._level, "25x: " + message, *args)
@@ -74,20 +78,58 @@ class Memory25xInterface:
     def _format_addr(self, addr):
         return bytes([(addr >> 16) & 0xff, (addr >> 8) & 0xff, addr & 0xff])
 
-    async def _read_command(self, address, length, chunk_size, cmd, dummy=0,
-                            callback=lambda done, total, status: None):
+    async def _iter_read_command(self, address, length, chunk_size, cmd, dummy=0,
+                                 callback=lambda done, total, status: None):
         if chunk_size is None:
             chunk_size = 0x10000 # for progress indication
 
-        data = bytearray()
-        while length > len(data):
-            callback(len(data), length, "reading address {:#08x}".format(address))
-            chunk    = await self._command(cmd, arg=self._format_addr(address),
-                                           dummy=dummy, ret=min(chunk_size, length - len(data)))
-            data    += chunk
-            address += len(chunk)
+        if length == 0:
+            callback(0, 0, None)
+            return
+        elif length <= chunk_size:
+            # Nothing to pipeline.
+            callback(0, length, "reading address {:#08x}".format(address))
+            chunk = await self._command(cmd, arg=self._format_addr(address),
+                                        dummy=dummy, ret=length)
+            yield chunk
+            callback(len(chunk), length, None)
+            return
+
+        # Keep up to `read_depth` chunk commands queued, so that the SPI bus stays busy while
+        # the host is handling the previous chunk.
+        pending = deque()
+        done = submitted = 0
+        try:
+            while done < length:
+                while submitted < length and len(pending) < self._read_depth:
+                    chunk_length = min(chunk_size, length - submitted)
+                    self._log("cmd=%02X addr=%#08x dummy=%d ret=%d",
+                              cmd, address + submitted, dummy, chunk_length)
+                    pending.append(await self.lower.submit(SPIControllerCommandList()
+                        .write([cmd, *self._format_addr(address + submitted), *[0] * dummy],
+                               hold_ss=True)
+                        .read(chunk_length)))
+                    submitted += chunk_length
+
+                callback(done, length, "reading address {:#08x}".format(address + done))
+                chunk, = await self.lower.collect(pending.popleft())
+                self._log("result=<%s>", dump_hex(chunk))
+                yield chunk
+                done += len(chunk)
+        finally:
+            # If the consumer stops early, drain the responses that are still in flight to keep
+            # the interface in sync.
+            while pending:
+                await self.lower.collect(pending.popleft())
+
+        callback(done, length, None)
 
-        callback(len(data), length, None)
+    async def _read_command(self, address, length, chunk_size, cmd, dummy=0,
+                            callback=lambda done, total, status: None):
+        data = bytearray()
+        async for chunk in self._iter_read_command(address, length, chunk_size, cmd, dummy,
+                                                   callback):
+            data += chunk
         return data
 
     async def read(self, address, length, chunk_size=None,
@@ -102,6 +144,39 @@ class Memory25xInterface:
         return await self._read_command(address, length, chunk_size, cmd=0x0B, dummy=1,
                                         callback=callback)
 
+    def iter_read(self, address, length, chunk_size=None, fast=False,
+                  callback=lambda done, total, status: None):
+        """
+        Read ``length`` bytes starting at ``address`` using the READ command (or the FAST READ
+        command, if ``fast`` is true), returning an asynchronous iterator over chunks of at most
+        ``chunk_size`` bytes.
+
+        The iterator must be exhausted or closed before issuing other commands.
+        """
+        self._log("%sread addr=%#08x len=%d", "fast " if fast else "", address, length)
+        if fast:
+            return self._iter_read_command(address, length, chunk_size, cmd=0x0B, dummy=1,
+                                           callback=callback)
+        else:
+            return self._iter_read_command(address, length, chunk_size, cmd=0x03,
+                                           callback=callback)
+
+    async def read_into(self, sink, address, length, chunk_size=None, fast=False, digest=None,
+                        callback=lambda done, total, status: None):
+        """
+        Read ``length`` bytes starting at ``address`` and write them to ``sink`` as they arrive,
+        so that only a few chunks are held in memory at any time.
+
+        ``sink.write`` may be a function or a coroutine function. If ``digest`` is a
+        :mod:`hashlib` object, it is updated with the data as well.
+        """
+        async for chunk in self.iter_read(address, length, chunk_size, fast, callback):
+            if digest is not None:
+                digest.update(chunk)
+            result = sink.write(chunk)
+            if inspect.isawaitable(result):
+                await result
+
     async def read_sfdp(self, address, length):
         self._log("read sfdp addr=%#08x len=%d", address, length)
         return await self._read_command(address, length, chunk_size=0x100, cmd=0x5A, dummy=1)
@@ -202,6 +277,87 @@ class Memory25xInterface:
 
         callback(done, total, None)
 
+    async def verify(self, address, data, chunk_size=None,
+                     callback=lambda done, total, status: None):
+        """
+        Compare memory contents starting at ``address`` with ``data``.
+
+        Returns the offset of the first differing byte, or ``None`` if the contents match.
+        """
+        data   = memoryview(bytes(data))
+        offset = 0
+        chunks = self.iter_read(address, len(data), chunk_size, callback=callback)
+        try:
+            async for chunk in chunks:
+                expected = data[offset:offset + len(chunk)]
+                if chunk != expected:
+                    for index, (actual_byte, expected_byte) in enumerate(zip(chunk, expected)):
+                        if actual_byte != expected_byte:
+                            return offset + index
+                offset += len(chunk)
+        finally:
+            await chunks.aclose()
+        return None
+
+    async def differential_program(self, address, data, sector_size, page_size,
+                                   callback=lambda done, total, status: None):
+        """
+        Modify memory contents starting at ``address`` to match ``data``, reading each affected
+        sector and only erasing and programming it if it actually changes.
+
+        A sector is erased only if the change requires setting bits; if it only clears bits,
+        the differing pages are programmed over the current contents. Within each sector, only
+        pages that differ from the erased (or current) contents are programmed.
+
+        Returns a tuple of the number of unchanged, programmed, and erased and programmed
+        sectors.
+        """
+        data  = bytes(data)
+        start = address & ~(sector_size - 1)
+        end   = (address + len(data) + sector_size - 1) & ~(sector_size - 1)
+
+        # Process one sector at a time, so that only the contents of the current sector are
+        # kept in memory.
+        unchanged = programmed = erased = 0
+        for sector_address in range(start, end, sector_size):
+            done = sector_address - start
+            callback(done, end - start, "reading sector {:#08x}".format(sector_address))
+            old_data = bytes(await self.read(sector_address, sector_size))
+            new_data = bytearray(old_data)
+            patch_start = max(address, sector_address)
+            patch_end   = min(address + len(data), sector_address + sector_size)
+            new_data[patch_start - sector_address:patch_end - sector_address] = \
+                data[patch_start - address:patch_end - address]
+            if new_data == old_data:
+                unchanged += 1
+                continue
+
+            old_bits = int.from_bytes(old_data, "big")
+            new_bits = int.from_bytes(new_data, "big")
+            if old_bits & new_bits == new_bits:
+                self._log("sector %#08x only clears bits, programming without erase",
+                          sector_address)
+                base_data = old_data
+                programmed += 1
+            else:
+                callback(done, end - start, "erasing sector {:#08x}".format(sector_address))
+                await self.write_enable()
+                await self.sector_erase(sector_address)
+                base_data = b"\xff" * sector_size
+                erased += 1
+
+            for page_offset in range(0, sector_size, page_size):
+                page_data = new_data[page_offset:page_offset + page_size]
+                if page_data == base_data[page_offset:page_offset + page_size]:
+                    continue
+                callback(done + page_offset, end - start,
+                         "programming page {:#08x}".format(sector_address + page_offset))
+                await self.write_enable()
+                await self.page_program(sector_address + page_offset, page_data)
+
+        callback(end - start, end - start, None)
+        return unchanged, programmed, erased
+
 
 class Memory25xSFDPParser(SFDPParser):
     async def __init__(self, m25x_iface):
@@ -354,6 +510,12 @@ class Memory25xApplet(SPIControllerApplet, name="memory-25x"):
             help="erase memory in SIZE byte sectors")
         add_page_argument(p_erase_program)
         add_program_arguments(p_erase_program)
+        p_erase_program.add_argument(
+            "-D", "--differential", default=False, action="store_true",
+            help="read the memory region first, and only erase and program sectors that change")
+        p_erase_program.add_argument(
+            "--verify", default=False, action="store_true",
+            help="read the memory region after programming and verify contents")
 
         p_protect = p_operation.add_parser(
             "protect", help="query and set block protection using READ/WRITE STATUS "
@@ -376,6 +538,16 @@ class Memory25xApplet(SPIControllerApplet, name="memory-25x"):
                     sys.stdout.write("; {}".format(status))
             sys.stdout.flush()
 
+    async def _verify(self, m25x_iface, address, gold_data):
+        offset = await m25x_iface.verify(address, gold_data, callback=self._show_progress)
+        if offset is None:
+            self.logger.info("verify PASS")
+        else:
+            flash_byte, = await m25x_iface.read(address + offset, 1)
+            self.logger.error("first differing byte at %#08x (expected %#04x, actual %#04x)",
+                              address + offset, gold_data[offset], flash_byte)
+            raise GlasgowAppletError("verify FAIL")
+
     async def interact(self, device, args, m25x_iface):
         await m25x_iface.wakeup()
 
@@ -429,7 +601,14 @@ class Memory25xApplet(SPIControllerApplet, name="memory-25x"):
             except ValueError as e:
                 self.logger.info("device does not have valid SFDP data: %s", str(e))
 
-        if args.operation in ("read", "fast-read"):
+        if args.operation in ("read", "fast-read") and args.file:
+            digest = hashlib.sha256()
+            await m25x_iface.read_into(args.file, args.address, args.length,
+                                       fast=(args.operation == "fast-read"), digest=digest,
+                                       callback=self._show_progress)
+            self.logger.info("read %d bytes, SHA-256 %s", args.length, digest.hexdigest())
+
+        elif args.operation in ("read", "fast-read"):
             if args.operation == "read":
                 data = await m25x_iface.read(args.address, args.length,
                                               callback=self._show_progress)
@@ -437,11 +616,8 @@ class Memory25xApplet(SPIControllerApplet, name="memory-25x"):
                 data = await m25x_iface.fast_read(args.address, args.length,
                                                    callback=self._show_progress)
 
-            if args.file:
-                args.file.write(data)
-            else:
-                self._show_progress(0, 0, "")
-                print(data.hex())
+            self._show_progress(0, 0, "")
+            print(data.hex())
 
         if args.operation in ("program-page", "program", "erase-program"):
             if args.data is not None:
@@ -455,27 +631,26 @@ class Memory25xApplet(SPIControllerApplet, name="memory-25x"):
             if args.operation == "program":
                 await m25x_iface.program(args.address, data, args.page_size,
                                           callback=self._show_progress)
-            if args.operation == "erase-program":
+            if args.operation == "erase-program" and args.differential:
+                unchanged, programmed, erased = \
+                    await m25x_iface.differential_program(args.address, data, args.sector_size,
+                        args.page_size, callback=self._show_progress)
+                self.logger.info("%d sectors unchanged, %d programmed, %d erased and programmed",
+                                 unchanged, programmed, erased)
+            elif args.operation == "erase-program":
                 await m25x_iface.erase_program(args.address, data, args.sector_size,
                                                 args.page_size, callback=self._show_progress)
 
+            if args.operation == "erase-program" and args.verify:
+                await self._verify(m25x_iface, args.address, data)
+
         if args.operation == "verify":
             if args.data is not None:
                 gold_data = args.data
             if args.file is not None:
                 gold_data = args.file.read()
 
-            flash_data = await m25x_iface.read(args.address, len(gold_data))
-            if gold_data == flash_data:
-                self.logger.info("verify PASS")
-            else:
-                for offset, (gold_byte, flash_byte) in enumerate(zip(gold_data, flash_data)):
-                    if gold_byte != flash_byte:
-                        different_at = args.address + offset
-                        break
-                self.logger.error("first differing byte at %#08x (expected %#04x, actual %#04x)",
-                                  different_at, gold_byte, flash_byte)
-                raise GlasgowAppletError("verify FAIL")
+            await self._verify(m25x_iface, args.address, gold_data)
 
         if args.operation in ("erase-sector", "erase-block"):
             for address in args.addresses:
@@ -501,6 +676,7 @@ class Memory25xApplet(SPIControllerApplet, name="memory-25x"):
 
 # -------------------------------------------------------------------------------------------------
 
+import asyncio
 import unittest
 
 
@@ -629,3 +805,111 @@ class Memory25xAppletTestCase(GlasgowAppletTestCase, applet=Memory25xApplet):
             page_size=0x100, sector_size=self.dut_sector_size)
         self.assertEqual(await m25x_iface.read(0, 14),
                          b"Bye  , world!")
+
+
+class Memory25xInterfaceTestCase(unittest.TestCase):
+    class MockFlash:
+        # Models just enough of SPIControllerInterface and a 25-series memory to exercise
+        # the read, program and erase paths without hardware.
+        def __init__(self, data, sector_size):
+            self.data        = bytearray(data)
+            self.sector_size = sector_size
+            self.command     = None
+            self.inflight    = 0
+            self.max_inflight = 0
+            self.log         = []
+
+        def _execute(self, command, count=0):
+            cmd, *arg = command
+            if cmd in (0x03, 0x0B):
+                address = int.from_bytes(bytes(arg[:3]), "big")
+                return bytes(self.data[address:address + count])
+            elif cmd == 0x05:
+                return b"\x00"
+            elif cmd == 0x20:
+                address = int.from_bytes(bytes(arg[:3]), "big")
+                self.data[address:address + self.sector_size] = b"\xff" * self.sector_size
+                self.log.append(("erase", address))
+            elif cmd == 0x02:
+                address = int.from_bytes(bytes(arg[:3]), "big")
+                for offset, byte in enumerate(arg[3:]):
+                    self.data[address + offset] &= byte
+                self.log.append(("program", address))
+            return b""
+
+        async def write(self, data, hold_ss=False):
+            if hold_ss:
+                self.command = bytes(data)
+            else:
+                self._execute(bytes(data))
+
+        async def read(self, count):
+            command, self.command = self.command, None
+            if command is None:
+                return b""
+            return self._execute(command, count)
+
+        async def submit(self, commands):
+            (_, command, _), (_, count, _) = commands
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+            return self._execute(bytes(command), count)
+
+        async def collect(self, token):
+            self.inflight -= 1
+            return [token]
+
+    def setUp(self):
+        self.data  = bytes(range(256)) * 64
+        self.lower = self.MockFlash(self.data, sector_size=0x1000)
+        self.iface = Memory25xInterface(self.lower, logging.getLogger(__name__), read_depth=3)
+
+    def run_iface(self, coro):
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+    def test_read_pipelined(self):
+        data = self.run_iface(self.iface.read(0x100, 0x3000, chunk_size=0x400))
+        self.assertEqual(data, self.data[0x100:0x3100])
+        self.assertEqual(self.lower.max_inflight, 3)
+        self.assertEqual(self.lower.inflight, 0)
+
+    def test_read_into(self):
+        class Sink:
+            def __init__(self):
+                self.chunks = []
+
+            async def write(self, chunk):
+                self.chunks.append(chunk)
+
+        sink   = Sink()
+        digest = hashlib.sha256()
+        self.run_iface(self.iface.read_into(sink, 0, 0x1000, chunk_size=0x300, digest=digest))
+        self.assertEqual([len(chunk) for chunk in sink.chunks], [0x300] * 5 + [0x100])
+        self.assertEqual(b"".join(sink.chunks), self.data[:0x1000])
+        self.assertEqual(digest.digest(), hashlib.sha256(self.data[:0x1000]).digest())
+
+    def test_verify(self):
+        self.assertIsNone(self.run_iface(
+            self.iface.verify(0x10, self.data[0x10:0x3010], chunk_size=0x400)))
+        gold_data = bytearray(self.data[0x10:0x3010])
+        gold_data[0x1234] ^= 1
+        self.assertEqual(self.run_iface(
+            self.iface.verify(0x10, gold_data, chunk_size=0x400)), 0x1234)
+        self.assertEqual(self.lower.inflight, 0)
+
+    def test_differential_program(self):
+        new_data = bytearray(self.data[0x800:0x3800])
+        new_data[0x0905] = 0x04 # clears bits only, sector 0x1000
+        new_data[0x2900] = 0xff # sets bits, sector 0x3000
+        self.assertEqual(self.run_iface(
+            self.iface.differential_program(0x800, new_data, sector_size=0x1000,
+                                            page_size=0x100)),
+            (2, 1, 1))
+        self.assertEqual(self.lower.log, [
+            ("program", 0x1100),
+            ("erase",   0x3000),
+            *(("program", address) for address in range(0x3000, 0x4000, 0x100)),
+        ])
+        self.assertEqual(self.lower.data[0x800:0x3800], new_data)
+        self.assertEqual(self.lower.data[:0x800], self.data[:0x800])
+        self.assertEqual(self.lower.data[0x3800:], self.data[0x3800:])
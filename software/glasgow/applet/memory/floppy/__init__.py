@@ -296,20 +296,24 @@
 # however many are necessary for the PLL in the controller to lock, and some more to pad the space
 # on the track where its end meets its beginning. Such a floppy would have a much larger density.
 
+import os
 import logging
 import asyncio
 import argparse
 import struct
 import random
+import time
 import itertools
 import crcmod
 import math
+import concurrent.futures
 from nmigen.compat import *
 from nmigen.compat.genlib.cdc import MultiReg
 
 from ....gateware.pads import *
 from ... import *
 from .mfm import *
+from .image import *
 
 
 class ShugartFloppyBus(Module):
@@ -580,19 +584,25 @@ class ShugartFloppyInterface:
                   self._sys_clk_freq / cycles * 60)
         return cycles
 
-    async def read_track_raw(self, redundancy=1):
+    async def iter_track_raw(self, redundancy=1):
+        """Yield raw track data in chunks, as it is received from the device."""
         self._log("read track raw")
-        data  = []
         await self.lower.write([CMD_READ_RAW, redundancy])
         while True:
             packet = await self.lower.read()
             if packet[-1] == 0xff:
                 raise GlasgowAppletError("FIFO overflow while reading track")
             elif packet[-1] == 0xfe:
-                data.append(packet[:-1])
-                return b"".join(data)
+                yield packet[:-1]
+                return
             else:
-                data.append(packet)
+                yield packet
+
+    async def read_track_raw(self, redundancy=1):
+        data = []
+        async for chunk in self.iter_track_raw(redundancy):
+            data.append(chunk)
+        return b"".join(data)
 
 
 class MemoryFloppyApplet(GlasgowApplet, name="memory-floppy"):
@@ -666,6 +676,9 @@ class MemoryFloppyApplet(GlasgowApplet, name="memory-floppy"):
         p_read_raw.add_argument(
             "-R", "--redundancy", metavar="N", type=int, default=1,
             help="read track N+1 times (i.e. with N redundant copies)")
+        p_read_raw.add_argument(
+            "-z", "--compress", action="store_true", default=False,
+            help="compress track data in the raw image")
         p_read_raw.add_argument(
             "file", metavar="RAW-FILE", type=argparse.FileType("wb"),
             help="write raw image to RAW-FILE")
@@ -683,21 +696,41 @@ class MemoryFloppyApplet(GlasgowApplet, name="memory-floppy"):
 
         try:
             if args.operation == "read-raw":
-                for track in range(args.first, args.last + 1):
-                    cylinder, head = track >> 1, track & 1
-                    self.logger.info("reading C/H %d/%d", cylinder, head)
-
-                    await floppy_iface.seek_track(track)
-                    data = await floppy_iface.read_track_raw(redundancy=args.redundancy)
-                    args.file.write(struct.pack(">LBB", len(data), cylinder, head))
-                    args.file.write(data)
-                    args.file.flush()
+                writer = RawImageWriter(args.file, compress=args.compress)
+                try:
+                    for track in range(args.first, args.last + 1):
+                        cylinder, head = track >> 1, track & 1
+                        self.logger.info("reading C/H %d/%d", cylinder, head)
+
+                        await floppy_iface.seek_track(track)
+                        writer.begin_track(cylinder, head)
+                        async for chunk in floppy_iface.iter_track_raw(
+                                redundancy=args.redundancy):
+                            writer.write(chunk)
+                        writer.end_track()
+                finally:
+                    # Keep the tracks that were read completely if reading is interrupted.
+                    writer.close()
 
         finally:
             await floppy_iface.stop()
 
 # -------------------------------------------------------------------------------------------------
 
+_worker_reader = None
+
+
+def _init_decode_worker(raw_path):
+    global _worker_reader
+    with open(raw_path, "rb") as raw_file:
+        _worker_reader = RawImageReader(raw_file)
+
+
+def _decode_track_worker(index):
+    mfm = SoftwareMFMDecoder(logging.getLogger(__name__))
+    return mfm.decode_track(_worker_reader.read_track(_worker_reader.tracks[index]))
+
+
 class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
     help = "manipulate raw disk images captured from IBM/Shugart floppy drives"
     description = """
@@ -726,6 +759,8 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
         cls._add_train_arguments(p_operation)
         cls._add_index_arguments(p_operation)
         cls._add_raw2img_arguments(p_operation)
+        cls._add_benchmark_arguments(p_operation)
+        cls._add_convert_arguments(p_operation)
 
     async def run(self, args):
         if args.operation == "histogram":
@@ -736,6 +771,10 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
             self._run_index(args)
         if args.operation == "raw2img":
             self._run_raw2img(args)
+        if args.operation == "benchmark":
+            self._run_benchmark(args)
+        if args.operation == "convert":
+            self._run_convert(args)
 
     @classmethod
     def _add_histogram_arguments(self, p_operation):
@@ -760,11 +799,14 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
 
         data = []
         labels = []
-        for cylinder, head, bytestream in self.iter_tracks(args.file):
+        reader = self.open_raw_image(args.file)
+        for track in reader.tracks:
+            cylinder, head = track.cylinder, track.head
             if cylinder not in args.cylinders or args.head is not None and head not in args.head:
                 continue
             self.logger.info("processing C/H %d/%d",
                              cylinder, head)
+            bytestream = reader.read_track(track)
 
             mfm = SoftwareMFMDecoder(self.logger)
             data.append(np.array(list(mfm.edges(bytestream))) * self._timebase)
@@ -812,62 +854,65 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
         import numpy as np
         import matplotlib.pyplot as plt
 
-        for cylinder, head, bytestream in self.iter_tracks(args.file):
-            if (cylinder << 1) | head != args.track:
-                continue
-            self.logger.info("processing C/H %d/%d",
-                             cylinder, head)
-
-            if args.offset is not None or args.limit is not None:
-                bytestream = bytestream[args.offset:args.offset + args.limit]
-            mfm = SoftwareMFMDecoder(self.logger)
+        reader = self.open_raw_image(args.file)
+        cylinder, head = args.track >> 1, args.track & 1
+        track = reader.find_track(cylinder, head)
+        if track is None:
+            raise GlasgowAppletError("raw image {} does not contain C/H {}/{}"
+                                     .format(args.file.name, cylinder, head))
+        self.logger.info("processing C/H %d/%d", cylinder, head)
+        bytestream = reader.read_track(track)
+
+        if args.offset is not None or args.limit is not None:
+            bytestream = bytestream[args.offset:args.offset + args.limit]
+        mfm = SoftwareMFMDecoder(self.logger)
+
+        bits    = list(mfm.bits(bytestream))
+        edges   = list(mfm.edges(bytestream))
+        domains = list(mfm.domains(bits))
+        plldata = list(mfm.lock(bits, debug=True))
+
+        ui_cycles = args.ui / self._timebase
+
+        ui_time = 0
+        ui_times, ui_lengths = [], []
+        for edge in edges:
+            ui_times.append(ui_time * self._timebase)
+            ui_lengths.append(edge / ui_cycles)
+            ui_time += edge
+
+        fig, (ax1, ax2, ax3) = plt.subplots(3, 1, sharex=True)
+        fig.suptitle("PLL debug output for {}, track {}, range {}+{}"
+                     .format(args.file.name, args.track, args.offset or 0, len(bytestream)))
+        times = np.arange(0, len(bits)) * self._timebase
+
+        ax1.plot(times, np.array([x[1] / ui_cycles for x in plldata]),
+                 color="green", label="NCO period", linewidth=1)
+        ax1.axhline(y=ui_cycles * self._timebase,
+                    color="gray")
+        ax1.set_ylim(0)
+        ax1.set_ylabel("UI")
+        ax1.grid()
+        ax1.legend(loc="upper right")
+
+        ax2.plot(times, np.array([x[2] / ui_cycles for x in plldata]),
+                 label="phase error", linewidth=1)
+        ax2.set_ylim(-0.5, 0.5)
+        ax2.set_yticks([-0.5 + 0.2 * x for x in range(6)])
+        ax2.set_ylabel("UI")
+        ax2.grid()
+        ax2.legend(loc="upper right")
+
+        ax3.plot(ui_times, ui_lengths, "+",
+                 color="red", label="edge-to-edge time", linewidth=1)
+        ax3.set_xlabel("us")
+        ax3.set_ylim(1, 6)
+        ax3.set_yticks(range(1, 7))
+        ax3.set_ylabel("UI")
+        ax3.grid()
+        ax3.legend(loc="upper right")
 
-            bits    = list(mfm.bits(bytestream))
-            edges   = list(mfm.edges(bytestream))
-            domains = list(mfm.domains(bits))
-            plldata = list(mfm.lock(bits, debug=True))
-
-            ui_cycles = args.ui / self._timebase
-
-            ui_time = 0
-            ui_times, ui_lengths = [], []
-            for edge in edges:
-                ui_times.append(ui_time * self._timebase)
-                ui_lengths.append(edge / ui_cycles)
-                ui_time += edge
-
-            fig, (ax1, ax2, ax3) = plt.subplots(3, 1, sharex=True)
-            fig.suptitle("PLL debug output for {}, track {}, range {}+{}"
-                         .format(args.file.name, args.track, args.offset or 0, len(bytestream)))
-            times = np.arange(0, len(bits)) * self._timebase
-
-            ax1.plot(times, np.array([x[1] / ui_cycles for x in plldata]),
-                     color="green", label="NCO period", linewidth=1)
-            ax1.axhline(y=ui_cycles * self._timebase,
-                        color="gray")
-            ax1.set_ylim(0)
-            ax1.set_ylabel("UI")
-            ax1.grid()
-            ax1.legend(loc="upper right")
-
-            ax2.plot(times, np.array([x[2] / ui_cycles for x in plldata]),
-                     label="phase error", linewidth=1)
-            ax2.set_ylim(-0.5, 0.5)
-            ax2.set_yticks([-0.5 + 0.2 * x for x in range(6)])
-            ax2.set_ylabel("UI")
-            ax2.grid()
-            ax2.legend(loc="upper right")
-
-            ax3.plot(ui_times, ui_lengths, "+",
-                     color="red", label="edge-to-edge time", linewidth=1)
-            ax3.set_xlabel("us")
-            ax3.set_ylim(1, 6)
-            ax3.set_yticks(range(1, 7))
-            ax3.set_ylabel("UI")
-            ax3.grid()
-            ax3.legend(loc="upper right")
-
-            plt.show()
+        plt.show()
 
     @classmethod
     def _add_index_arguments(self, p_operation):
@@ -879,19 +924,27 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
         p_index.add_argument(
             "--ignore-data-crc", action="store_true", default=False,
             help="do not reject sector data with incorrect CRC")
+        self._add_jobs_argument(p_index)
         p_index.add_argument(
             "file", metavar="RAW-FILE", type=argparse.FileType("rb"),
             help="read raw disk image from RAW-FILE")
 
+    @classmethod
+    def _add_jobs_argument(self, parser):
+        parser.add_argument(
+            "-j", "--jobs", metavar="JOBS", type=int, default=1,
+            help="decode up to JOBS tracks at once in separate processes (default: %(default)s)")
+
     def _run_index(self, args):
-        for cylinder, head, bytestream in self.iter_tracks(args.file):
-            self.logger.info("indexing C/H %d/%d: %d edges captured",
-                             cylinder, head, len(bytestream))
-            if args.no_decode:
-                continue
+        if args.no_decode:
+            for cylinder, head, bytestream in self.iter_tracks(args.file):
+                self.logger.info("indexing C/H %d/%d: %d edges captured",
+                                 cylinder, head, len(bytestream))
+            return
 
-            mfm        = SoftwareMFMDecoder(self.logger)
-            symbstream = mfm.demodulate(mfm.lock(mfm.bits(bytestream)))
+        for cylinder, head, size, symbstream in self.iter_decoded_tracks(args.file, args.jobs):
+            self.logger.info("indexing C/H %d/%d: %d edges captured",
+                             cylinder, head, size)
             for _ in self.iter_mfm_sectors(symbstream, verbose=True,
                     ignore_data_crc=args.ignore_data_crc):
                 pass
@@ -909,6 +962,7 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
         p_raw2img.add_argument(
             "-t", "--sectors-per-track", metavar="COUNT", type=int, required=True,
             help="amount of sectors per track (9 for DD, 18 for HD, ...)")
+        self._add_jobs_argument(p_raw2img)
         p_raw2img.add_argument(
             "raw_file", metavar="RAW-FILE", type=argparse.FileType("rb"),
             help="read raw disk image from RAW-FILE")
@@ -923,12 +977,10 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
 
         try:
             curr_lba = 0
-            for cylinder, head, bytestream in self.iter_tracks(args.raw_file):
+            for cylinder, head, _, symbstream in self.iter_decoded_tracks(args.raw_file,
+                                                                          args.jobs):
                 self.logger.info("processing C/H %d/%d", cylinder, head)
 
-                mfm        = SoftwareMFMDecoder(self.logger)
-                symbstream = mfm.demodulate(mfm.lock(mfm.bits(bytestream)))
-
                 sectors    = {}
                 seen       = set()
                 for (cyl, hd, sec), data in self.iter_mfm_sectors(symbstream,
@@ -981,12 +1033,107 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
         finally:
             self.logger.info("%d/%d sectors missing", missing, last_lba)
 
+    @classmethod
+    def _add_benchmark_arguments(self, p_operation):
+        p_benchmark = p_operation.add_parser(
+            "benchmark", help="compare the throughput and output of MFM decoder implementations")
+        p_benchmark.add_argument(
+            "file", metavar="RAW-FILE", type=argparse.FileType("rb"),
+            help="read raw disk image from RAW-FILE")
+        p_benchmark.add_argument(
+            "tracks", metavar="TRACK", type=int, nargs="*",
+            help="use only tracks TRACK (default: all)")
+
+    def _run_benchmark(self, args):
+        total_bytes = total_ref_time = total_block_time = 0
+        for cylinder, head, bytestream in self.iter_tracks(args.file):
+            if args.tracks and (cylinder << 1) | head not in args.tracks:
+                continue
+
+            mfm = SoftwareMFMDecoder(self.logger)
+            started_at  = time.perf_counter()
+            ref_symbols = list(mfm.demodulate(mfm.lock(mfm.bits(bytestream))))
+            ref_time    = time.perf_counter() - started_at
+
+            mfm = SoftwareMFMDecoder(self.logger)
+            started_at    = time.perf_counter()
+            block_symbols = mfm.decode_track(bytestream)
+            block_time    = time.perf_counter() - started_at
+
+            if ref_symbols != block_symbols:
+                raise GlasgowAppletError("decoder output differs at C/H {}/{}"
+                                         .format(cylinder, head))
+            self.logger.info("C/H %d/%d: %d symbols, reference %.3f s, block %.3f s",
+                             cylinder, head, len(ref_symbols), ref_time, block_time)
+            total_bytes      += len(bytestream)
+            total_ref_time   += ref_time
+            total_block_time += block_time
+
+        if total_block_time > 0:
+            self.logger.info("reference decoder: %.1f KiB/s, block decoder: %.1f KiB/s (%.1fx)",
+                             total_bytes / total_ref_time / 1024,
+                             total_bytes / total_block_time / 1024,
+                             total_ref_time / total_block_time)
+
+    @classmethod
+    def _add_convert_arguments(self, p_operation):
+        p_convert = p_operation.add_parser(
+            "convert", help="convert a raw disk image, e.g. from the legacy format")
+        p_convert.add_argument(
+            "-z", "--compress", action="store_true", default=False,
+            help="compress track data in the converted raw image")
+        p_convert.add_argument(
+            "file", metavar="RAW-FILE", type=argparse.FileType("rb"),
+            help="read raw disk image from RAW-FILE")
+        p_convert.add_argument(
+            "output_file", metavar="OUTPUT-FILE", type=argparse.FileType("wb"),
+            help="write raw disk image to OUTPUT-FILE")
+
+    def _run_convert(self, args):
+        reader = self.open_raw_image(args.file)
+        writer = RawImageWriter(args.output_file, compress=args.compress)
+        for track in reader.tracks:
+            writer.write_track(track.cylinder, track.head, reader.read_track(track),
+                               revolution=track.revolution)
+        writer.close()
+        self.logger.info("converted %d tracks", len(reader.tracks))
+
+    def open_raw_image(self, file):
+        try:
+            return RawImageReader(file)
+        except RawImageError as e:
+            raise GlasgowAppletError("cannot read raw image {}: {}".format(file.name, e))
+
     def iter_tracks(self, file):
-        while True:
-            header = file.read(struct.calcsize(">LBB"))
-            if header == b"": break
-            size, cylinder, head = struct.unpack(">LBB", header)
-            yield cylinder, head, file.read(size)
+        yield from self.open_raw_image(file)
+
+    def iter_decoded_tracks(self, file, jobs=1):
+        """
+        Yield ``(cylinder, head, size, symbols)`` for each track, where ``symbols`` is
+        the decoded MFM symbol stream.
+
+        If ``jobs`` is greater than 1, tracks are decoded in that many worker processes, each of
+        which maps the raw file into memory; the results are still yielded in file order. Since
+        the workers reopen the raw file by its path, a raw image read from standard input or
+        a pipe is always decoded serially.
+        """
+        if jobs > 1 and not (isinstance(file.name, str) and os.path.isfile(file.name)):
+            self.logger.warning("raw image %s is not a regular file, decoding tracks serially",
+                                file.name)
+            jobs = 1
+
+        if jobs <= 1:
+            for cylinder, head, bytestream in self.iter_tracks(file):
+                mfm = SoftwareMFMDecoder(self.logger)
+                yield cylinder, head, len(bytestream), mfm.decode_track(bytestream)
+            return
+
+        tracks = self.open_raw_image(file).tracks
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+                initializer=_init_decode_worker, initargs=(file.name,)) as pool:
+            results = pool.map(_decode_track_worker, range(len(tracks)))
+            for track, symbols in zip(tracks, results):
+                yield track.cylinder, track.head, track.size, symbols
 
     crc_mfm = staticmethod(crcmod.mkCrcFun(0x11021, initCrc=0xffff, rev=False))
 
@@ -1073,7 +1220,62 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
 
 # -------------------------------------------------------------------------------------------------
 
+import tempfile
+import unittest
+
+
 class MemoryFloppyAppletTestCase(GlasgowAppletTestCase, applet=MemoryFloppyApplet):
     @synthesis_test
     def test_build(self):
         self.assertBuilds()
+
+
+class MemoryFloppyAppletToolTestCase(unittest.TestCase):
+    def setUp(self):
+        from .mfm import SoftwareMFMDecoderTestCase
+        rng = random.Random(0)
+        self.raw_file = tempfile.NamedTemporaryFile(suffix=".raw")
+        self.bytestreams = []
+        for track in range(3):
+            bytestream = SoftwareMFMDecoderTestCase.encode_track(rng, sector_count=1)
+            self.raw_file.write(struct.pack(">LBB", len(bytestream), track >> 1, track & 1))
+            self.raw_file.write(bytestream)
+            self.bytestreams.append(bytes(bytestream))
+        self.raw_file.flush()
+        self.tool = MemoryFloppyAppletTool()
+
+    def tearDown(self):
+        self.raw_file.close()
+
+    def test_iter_tracks(self):
+        tracks = [(cyl, hd, bytes(data)) for cyl, hd, data in self.tool.iter_tracks(self.raw_file)]
+        self.assertEqual([(cyl, hd) for cyl, hd, _ in tracks], [(0, 0), (0, 1), (1, 0)])
+        self.assertEqual([data for _, _, data in tracks], self.bytestreams)
+
+    def test_decode_jobs(self):
+        serial = list(self.tool.iter_decoded_tracks(self.raw_file, jobs=1))
+        parallel = list(self.tool.iter_decoded_tracks(self.raw_file, jobs=2))
+        self.assertEqual(serial, parallel)
+
+    def test_decode_jobs_pipe(self):
+        read_fd, write_fd = os.pipe()
+        with open(read_fd, "rb") as pipe_file:
+            with open(write_fd, "wb") as write_file:
+                self.raw_file.seek(0)
+                write_file.write(self.raw_file.read())
+            with self.assertLogs(self.tool.logger, level="WARNING"):
+                parallel = list(self.tool.iter_decoded_tracks(pipe_file, jobs=2))
+        serial = list(self.tool.iter_decoded_tracks(self.raw_file, jobs=1))
+        self.assertEqual(serial, parallel)
+
+    def test_convert(self):
+        with tempfile.NamedTemporaryFile(suffix=".raw") as output_file:
+            args = argparse.Namespace(file=self.raw_file, output_file=output_file,
+                                      compress=True)
+            self.tool._run_convert(args)
+            output_file.seek(0)
+            reader = RawImageReader(output_file)
+            self.assertFalse(reader.legacy)
+            self.assertEqual([bytes(data) for _, _, data in reader], self.bytestreams)
+            self.assertEqual(list(self.tool.iter_decoded_tracks(output_file, jobs=2)),
+                             list(self.tool.iter_decoded_tracks(self.raw_file, jobs=1)))
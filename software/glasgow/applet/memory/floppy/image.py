@@ -0,0 +1,282 @@
+import mmap
+import zlib
+import struct
+from collections import namedtuple
+
+
+__all__ = ["RawImageError", "RawImageTrack", "RawImageReader", "RawImageWriter"]
+
+
+class RawImageError(Exception):
+    pass
+
+
+# A raw image container consists of a header, the data of each track, an index of tracks,
+# and a footer pointing to the index:
+#
+#   header: MAGIC, >H version
+#   index entry: >BBBB cylinder, head, revolution, compression; >QQQ offset, size, stored size
+#   footer: >QL index offset, track count; MAGIC
+#
+# Legacy raw images are a sequence of tracks, each a >LBB size, cylinder, head header followed
+# by the track data.
+
+MAGIC   = b"GLFLOPPY"
+VERSION = 1
+
+_HEADER = struct.Struct(">8sH")
+_ENTRY  = struct.Struct(">BBBBQQQ")
+_FOOTER = struct.Struct(">QL8s")
+_LEGACY_HEADER = struct.Struct(">LBB")
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+
+class RawImageTrack(namedtuple("RawImageTrack", ("cylinder", "head", "revolution",
+                                                 "compression", "offset", "size",
+                                                 "stored_size"))):
+    pass
+
+
+class RawImageReader:
+    """
+    A reader for raw floppy images, either containers written by :class:`RawImageWriter` or
+    legacy images.
+
+    The image is mapped into memory (or read, if it cannot be mapped, e.g. because it is a pipe)
+    and indexed when the reader is created; track data is only accessed when requested, and
+    uncompressed tracks are returned as ``memoryview`` objects into the mapping, without copying.
+    """
+    def __init__(self, file):
+        self.file = file
+        try:
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError): # empty file, pipe, ...
+            self._data = file.read()
+        self._view = memoryview(self._data)
+
+        if self._view[:len(MAGIC)] == MAGIC:
+            self.legacy = False
+            self.tracks = self._index_container()
+        else:
+            self.legacy = True
+            self.tracks = self._index_legacy()
+
+    def _index_container(self):
+        if len(self._data) < _HEADER.size + _FOOTER.size:
+            raise RawImageError("raw image is truncated or was not closed")
+        _, version = _HEADER.unpack_from(self._data, 0)
+        if version != VERSION:
+            raise RawImageError("raw image version {} is not supported".format(version))
+        index_offset, track_count, magic = \
+            _FOOTER.unpack_from(self._data, len(self._data) - _FOOTER.size)
+        if magic != MAGIC:
+            raise RawImageError("raw image is truncated or was not closed")
+        if index_offset + track_count * _ENTRY.size + _FOOTER.size != len(self._data):
+            raise RawImageError("raw image index is corrupted")
+
+        tracks = []
+        for index in range(track_count):
+            track = RawImageTrack(*_ENTRY.unpack_from(self._data,
+                                                      index_offset + index * _ENTRY.size))
+            if track.compression not in (COMPRESSION_NONE, COMPRESSION_ZLIB):
+                raise RawImageError("track compression {} is not supported"
+                                    .format(track.compression))
+            if track.offset + track.stored_size > index_offset:
+                raise RawImageError("raw image index is corrupted")
+            tracks.append(track)
+        return tracks
+
+    def _index_legacy(self):
+        tracks = []
+        offset = 0
+        while offset < len(self._data):
+            if offset + _LEGACY_HEADER.size > len(self._data):
+                raise RawImageError("legacy raw image is truncated")
+            size, cylinder, head = _LEGACY_HEADER.unpack_from(self._data, offset)
+            offset += _LEGACY_HEADER.size
+            if offset + size > len(self._data):
+                raise RawImageError("legacy raw image is truncated")
+            tracks.append(RawImageTrack(cylinder, head, 0, COMPRESSION_NONE, offset, size, size))
+            offset += size
+        return tracks
+
+    def read_track(self, track):
+        """Return the data of ``track``, an element of :attr:`tracks`."""
+        data = self._view[track.offset:track.offset + track.stored_size]
+        if track.compression == COMPRESSION_ZLIB:
+            data = zlib.decompress(data)
+        return data
+
+    def find_track(self, cylinder, head, revolution=0):
+        for track in self.tracks:
+            if (track.cylinder, track.head, track.revolution) == (cylinder, head, revolution):
+                return track
+
+    def __iter__(self):
+        for track in self.tracks:
+            yield track.cylinder, track.head, self.read_track(track)
+
+
+class RawImageWriter:
+    """
+    A writer for raw floppy image containers.
+
+    Track data may be written all at once with :meth:`write_track`, or streamed as it arrives
+    between :meth:`begin_track` and :meth:`end_track`. If ``compress`` is true, track data is
+    compressed with zlib. The index is written by :meth:`close`; a container that was not closed
+    cannot be read.
+
+    If ``file`` is not seekable (e.g. it is a pipe), streamed track data is buffered until
+    :meth:`end_track`, so that :meth:`abort_track` can discard it.
+    """
+    def __init__(self, file, *, compress=False):
+        self.file = file
+        self._compression = COMPRESSION_ZLIB if compress else COMPRESSION_NONE
+        self._tracks = []
+        self._track  = None
+        self._buffer = None if file.seekable() else bytearray()
+        self._offset = file.write(_HEADER.pack(MAGIC, VERSION))
+
+    def _write(self, data):
+        if self._buffer is None:
+            self._offset += self.file.write(data)
+        else:
+            self._buffer += data
+            self._offset += len(data)
+
+    def begin_track(self, cylinder, head, revolution=0):
+        assert self._track is None
+        self._track = RawImageTrack(cylinder, head, revolution, self._compression,
+                                    self._offset, 0, 0)
+        if self._compression == COMPRESSION_ZLIB:
+            self._compressor = zlib.compressobj()
+
+    def write(self, data):
+        assert self._track is not None
+        size = len(data)
+        if self._compression == COMPRESSION_ZLIB:
+            data = self._compressor.compress(data)
+        self._write(data)
+        self._track = self._track._replace(size=self._track.size + size)
+
+    def end_track(self):
+        assert self._track is not None
+        if self._compression == COMPRESSION_ZLIB:
+            self._write(self._compressor.flush())
+        if self._buffer is not None:
+            self.file.write(self._buffer)
+            self._buffer.clear()
+        self._tracks.append(self._track._replace(
+            stored_size=self._offset - self._track.offset))
+        self._track = None
+        self.file.flush()
+
+    def abort_track(self):
+        """Discard the data written since :meth:`begin_track`."""
+        assert self._track is not None
+        self._offset = self._track.offset
+        if self._buffer is None:
+            self.file.seek(self._offset)
+            self.file.truncate()
+        else:
+            self._buffer.clear()
+        self._track = None
+
+    def write_track(self, cylinder, head, data, revolution=0):
+        self.begin_track(cylinder, head, revolution)
+        self.write(data)
+        self.end_track()
+
+    def close(self):
+        if self._track is not None:
+            self.abort_track()
+        for track in self._tracks:
+            self.file.write(_ENTRY.pack(*track))
+        self.file.write(_FOOTER.pack(self._offset, len(self._tracks), MAGIC))
+        self.file.flush()
+
+# -------------------------------------------------------------------------------------------------
+
+import os
+import tempfile
+import unittest
+
+
+class RawImageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.file = tempfile.TemporaryFile()
+
+    def tearDown(self):
+        self.file.close()
+
+    def write_tracks(self, **kwargs):
+        writer = RawImageWriter(self.file, **kwargs)
+        writer.write_track(0, 0, b"\x01\x02\x03")
+        writer.begin_track(0, 1)
+        writer.write(b"\x04\x05")
+        writer.write(b"\x06")
+        writer.end_track()
+        writer.write_track(0, 1, b"\x07", revolution=1)
+        writer.begin_track(1, 0)
+        writer.write(b"\x08")
+        writer.close()
+        self.file.seek(0)
+
+    def assertTracks(self, reader):
+        self.assertEqual([(cyl, hd, bytes(data)) for cyl, hd, data in reader], [
+            (0, 0, b"\x01\x02\x03"),
+            (0, 1, b"\x04\x05\x06"),
+            (0, 1, b"\x07"),
+        ])
+        self.assertEqual(bytes(reader.read_track(reader.find_track(0, 1, revolution=1))),
+                         b"\x07")
+        self.assertIsNone(reader.find_track(1, 0))
+
+    def test_container(self):
+        self.write_tracks()
+        reader = RawImageReader(self.file)
+        self.assertFalse(reader.legacy)
+        self.assertTracks(reader)
+
+    def test_container_compressed(self):
+        self.write_tracks(compress=True)
+        reader = RawImageReader(self.file)
+        self.assertEqual(reader.tracks[0].compression, COMPRESSION_ZLIB)
+        self.assertTracks(reader)
+
+    def test_legacy(self):
+        self.file.write(_LEGACY_HEADER.pack(3, 0, 0) + b"\x01\x02\x03")
+        self.file.write(_LEGACY_HEADER.pack(1, 0, 1) + b"\x04")
+        self.file.flush()
+        reader = RawImageReader(self.file)
+        self.assertTrue(reader.legacy)
+        self.assertEqual([(cyl, hd, bytes(data)) for cyl, hd, data in reader],
+                         [(0, 0, b"\x01\x02\x03"), (0, 1, b"\x04")])
+
+    def test_pipe(self):
+        read_fd, write_fd = os.pipe()
+        with open(read_fd, "rb") as read_file:
+            with open(write_fd, "wb") as write_file:
+                self.assertFalse(write_file.seekable())
+                writer = RawImageWriter(write_file)
+                writer.write_track(0, 0, b"\x01\x02\x03")
+                writer.begin_track(0, 1)
+                writer.write(b"\x04\x05")
+                writer.abort_track()
+                writer.write_track(0, 1, b"\x06")
+                writer.close()
+            reader = RawImageReader(read_file)
+            self.assertEqual([(cyl, hd, bytes(data)) for cyl, hd, data in reader],
+                             [(0, 0, b"\x01\x02\x03"), (0, 1, b"\x06")])
+
+    def test_empty(self):
+        self.assertEqual(RawImageReader(self.file).tracks, [])
+
+    def test_unclosed(self):
+        writer = RawImageWriter(self.file)
+        writer.write_track(0, 0, bytes(range(64)))
+        self.file.flush()
+        with self.assertRaisesRegex(RawImageError, r"not closed"):
+            RawImageReader(self.file)
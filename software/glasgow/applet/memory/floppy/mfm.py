@@ -4,6 +4,10 @@ import logging
 __all__ = ["SoftwareMFMDecoder"]
 
 
+_SYNC_K_A1 = bytes([0,1,0,0,0,1,0,0,1,0,0,0,1,0,0,1])
+_CHIPS_TO_ASCII = bytes.maketrans(b"\x00\x01", b"01")
+
+
 class SoftwareMFMDecoder:
     def __init__(self, logger):
         self._logger    = logger
@@ -134,3 +138,247 @@ class SoftwareMFMDecoder:
                     if len(bits) == 8:
                         yield (0, sum(bit << (7 - n) for n, bit in enumerate(bits)))
                         bits = []
+
+    # The methods below implement exactly the same algorithm as `demodulate(lock(bits(...)))`,
+    # but process a whole track at once. Instead of simulating the PLL for every flux cell, they
+    # advance it arithmetically across the cells between edges; instead of matching the chip
+    # stream against the sync mark at every offset, they search for it with `bytes.find`; and
+    # instead of validating and assembling data bits one by one, they convert the chip stream
+    # to big integers and check the clock bits of a whole run of data at once.
+
+    def lock_track(self, bytestream, *,
+                   nco_init_period=0, nco_min_period=16, nco_max_period=256,
+                   nco_frac_bits=8, pll_kp_exp=2, pll_gph_exp=1):
+        """Recover the chip stream of a track. Returns a ``bytearray`` of 0 and 1 bytes."""
+        nco_min_period <<= nco_frac_bits
+        nco_max_period <<= nco_frac_bits
+        nco_period = nco_init_period << nco_frac_bits
+        nco_phase  = 0
+        nco_step   = 1 << nco_frac_bits
+        pll_feedbk = 0
+        pll_min_gain = 1 << pll_gph_exp
+        bit_curr   = 0
+        prev_byte  = 0
+
+        chips = bytearray()
+        for cells in bytestream:
+            if prev_byte != 0xfd:
+                if nco_period <  nco_min_period:
+                    nco_period = nco_min_period
+                if nco_period >= nco_max_period:
+                    nco_period = nco_max_period
+
+                bit_curr    = 1
+                pll_error   = nco_phase - (nco_period >> 1)
+                pll_gain    = max(pll_min_gain, abs(pll_error) >> pll_kp_exp)
+                if pll_error < 0:
+                    pll_feedbk = +pll_gain
+                else:
+                    pll_feedbk = -pll_gain
+
+                if nco_phase >= nco_period:
+                    nco_phase   = 0
+                    chips.append(bit_curr)
+                    bit_curr    = 0
+                else:
+                    nco_phase  += nco_step + pll_feedbk
+                    nco_period -= pll_feedbk >> pll_gph_exp
+                    pll_feedbk  = 0
+            prev_byte = cells
+
+            # Apply any feedback left over from the edge cell one cell at a time.
+            while cells > 0 and pll_feedbk != 0:
+                if nco_period <  nco_min_period:
+                    nco_period = nco_min_period
+                if nco_period >= nco_max_period:
+                    nco_period = nco_max_period
+
+                if nco_phase >= nco_period:
+                    nco_phase   = 0
+                    chips.append(bit_curr)
+                    bit_curr    = 0
+                else:
+                    nco_phase  += nco_step + pll_feedbk
+                    nco_period -= pll_feedbk >> pll_gph_exp
+                    pll_feedbk  = 0
+                cells -= 1
+            if cells == 0:
+                continue
+
+            # Without feedback, the NCO period stays constant, and the phase wraps around every
+            # `wrap_cells` cells, each time emitting a chip.
+            if nco_period <  nco_min_period:
+                nco_period = nco_min_period
+            if nco_period >= nco_max_period:
+                nco_period = nco_max_period
+
+            if nco_phase >= nco_period:
+                first_cells = 1
+            else:
+                first_cells = -(-(nco_period - nco_phase) // nco_step) + 1
+            if cells < first_cells:
+                nco_phase += cells * nco_step
+            else:
+                chips.append(bit_curr)
+                bit_curr    = 0
+                wrap_cells  = -(-nco_period // nco_step) + 1
+                wraps, rest = divmod(cells - first_cells, wrap_cells)
+                if wraps:
+                    chips += bytes(wraps)
+                nco_phase   = rest * nco_step
+
+        return chips
+
+    def demodulate_track(self, chips):
+        """Demodulate the chip stream of a track. Returns a list of ``(comma, symbol)`` tuples."""
+        chips   = bytes(chips)
+        limit   = len(chips) - 64 # the last offset at which `demodulate` examines the stream
+        symbols = []
+        offset  = 0
+        synced  = False
+        prev    = 0
+        while True:
+            sync_offset = chips.find(_SYNC_K_A1, offset)
+            if not synced:
+                # Every offset is examined (together with the next one) until a sync mark is
+                # found.
+                if sync_offset == -1 or max(offset, sync_offset - 1) > limit:
+                    break
+                self._log("sync=K.A1 chip-off=%d", sync_offset)
+
+            else:
+                # Offsets are examined two chips at a time, so the sync mark is found at
+                # the examined offset at or just before it.
+                if sync_offset != -1:
+                    sync_check = offset + ((sync_offset - offset) & ~1)
+                    if sync_check > limit:
+                        sync_offset = -1
+                if sync_offset == -1:
+                    cell_count = max(0, (limit - offset) // 2 + 1)
+                else:
+                    cell_count = (sync_check - offset) // 2
+
+                cells  = chips[offset:offset + cell_count * 2]
+                clocks = cells[0::2].translate(_CHIPS_TO_ASCII)
+                datas  = cells[1::2].translate(_CHIPS_TO_ASCII)
+                valid_count = cell_count
+                if cell_count > 0:
+                    data_bits  = int(datas, 2)
+                    clock_bits = int(clocks, 2)
+                    prev_bits  = (prev << (cell_count - 1)) | (data_bits >> 1)
+                    mask       = (1 << cell_count) - 1
+                    # In MFM, a clock chip is set only if neither adjacent data chip is set.
+                    invalid    = clock_bits ^ (~(data_bits | prev_bits) & mask)
+                    if invalid:
+                        valid_count = cell_count - invalid.bit_length()
+
+                byte_count = valid_count // 8
+                if byte_count > 0:
+                    symbols.extend((0, byte) for byte in
+                        int(datas[:byte_count * 8], 2).to_bytes(byte_count, "big"))
+
+                if valid_count < cell_count:
+                    if valid_count > 0:
+                        prev = datas[valid_count - 1] - ord("0")
+                    offset += valid_count * 2
+                    synced  = False
+                    self._log("desync chip-off=%d bitno=%d prev=%d cell=%d%d",
+                              offset, valid_count % 8, prev, chips[offset], chips[offset + 1])
+                    continue
+                elif sync_offset == -1:
+                    break
+                elif sync_offset != sync_check:
+                    self._log("sync=K.A1 chip-off=%d", sync_offset)
+
+            symbols.append((1, 0xA1))
+            offset = sync_offset + 16
+            synced = True
+            prev   = 1
+        return symbols
+
+    def decode_track(self, bytestream, **kwargs):
+        """
+        Decode a track. Returns the same symbols as ``demodulate(lock(bits(bytestream)))``,
+        as a list.
+        """
+        return self.demodulate_track(self.lock_track(bytestream, **kwargs))
+
+# -------------------------------------------------------------------------------------------------
+
+import random
+import unittest
+
+
+class SoftwareMFMDecoderTestCase(unittest.TestCase):
+    @staticmethod
+    def encode_track(rng, sector_count=2, cell_cycles=20, jitter=2, error_rate=0):
+        chips = []
+        prev  = 0
+        def emit(data):
+            nonlocal prev
+            for byte in data:
+                for n in range(8):
+                    bit = (byte >> (7 - n)) & 1
+                    chips.extend([int(not (prev or bit)), bit])
+                    prev = bit
+        def emit_sync():
+            nonlocal prev
+            chips.extend(_SYNC_K_A1 * 3)
+            prev = 1
+
+        emit(b"\x4e" * 80)
+        for sector in range(sector_count):
+            emit(b"\x00" * 12)
+            emit_sync()
+            emit(bytes([0xfe, 0, 0, 1 + sector, 2, 0, 0]))
+            emit(b"\x4e" * 22 + b"\x00" * 12)
+            emit_sync()
+            emit(bytes([0xfb]) + bytes(rng.randrange(256) for _ in range(512)) + b"\x00\x00")
+            emit(b"\x4e" * 40)
+        for index in range(len(chips)):
+            if rng.random() < error_rate:
+                chips[index] ^= 1
+
+        bytestream = bytearray()
+        cells = 0
+        for chip in chips:
+            cells += cell_cycles
+            if chip:
+                cells += rng.randint(-jitter, jitter) - 1
+                while cells > 0xfc:
+                    bytestream.append(0xfd)
+                    cells -= 0xfe
+                bytestream.append(max(0, cells))
+                cells = 0
+        return bytes(bytestream)
+
+    def assertDecodesSame(self, bytestream):
+        logger  = logging.getLogger(__name__)
+        ref_mfm = SoftwareMFMDecoder(logger)
+        ref_chips   = bytearray(ref_mfm.lock(ref_mfm.bits(bytestream)))
+        ref_symbols = list(ref_mfm.demodulate(iter(ref_chips)))
+        mfm = SoftwareMFMDecoder(logger)
+        self.assertEqual(mfm.lock_track(bytestream), ref_chips)
+        self.assertEqual(mfm.demodulate_track(ref_chips), ref_symbols)
+        return ref_symbols
+
+    def test_clean(self):
+        rng = random.Random(0)
+        symbols = self.assertDecodesSame(self.encode_track(rng))
+        self.assertEqual(symbols.count((1, 0xA1)), 12)
+
+    def test_jitter(self):
+        rng = random.Random(1)
+        for jitter in (0, 4, 8):
+            with self.subTest(jitter=jitter):
+                self.assertDecodesSame(self.encode_track(rng, jitter=jitter))
+
+    def test_errors(self):
+        rng = random.Random(2)
+        for error_rate in (0.0005, 0.01, 0.2):
+            with self.subTest(error_rate=error_rate):
+                self.assertDecodesSame(self.encode_track(rng, error_rate=error_rate))
+
+    def test_noise(self):
+        rng = random.Random(3)
+        self.assertDecodesSame(bytes(rng.randrange(256) for _ in range(10000)))
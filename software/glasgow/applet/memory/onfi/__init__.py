@@ -79,6 +79,7 @@ import argparse
 import logging
 import asyncio
 import struct
+from collections import deque
 from nmigen.compat import *
 from nmigen.compat.genlib.cdc import MultiReg
 
@@ -369,6 +370,51 @@ class ONFIInterface:
         ])
         return await self._do_read(command=0x30, wait=True, length=length)
 
+    async def read_pages(self, row, count, length, *, cache=False, block_size=None, depth=8):
+        """
+        Read ``length`` bytes starting at column 0 of each of ``count`` pages starting at ``row``,
+        yielding ``(row, data)`` pairs.
+
+        Up to ``depth`` page reads are queued in the FIFO ahead of the one being received, so that
+        the device never waits for the host. If ``cache`` is true, the Read Cache Sequential
+        and Read Cache End commands are used, so that loading the next page from the array
+        overlaps with transferring the current one; since Read Cache Sequential is only defined
+        within a block, the sequence is restarted at every ``block_size`` page boundary.
+        """
+        assert not cache or block_size is not None
+        self._log("read pages row=%#08x count=%d cache=%d", row, count, cache)
+
+        queued = deque()
+        for page_row in range(row, row + count):
+            if cache:
+                first = page_row == row or page_row % block_size == 0
+                last  = page_row == row + count - 1 or (page_row + 1) % block_size == 0
+            else:
+                first = last = True
+            if first:
+                await self._do(command=0x00, address=[
+                    0,
+                    0,
+                    (page_row >>  0) & 0xff,
+                    (page_row >>  8) & 0xff,
+                    (page_row >> 16) & 0xff,
+                ])
+                await self._do(command=0x30, wait=True)
+            if not last:
+                # Read Cache Sequential: output this page, and load the next one.
+                await self._do(command=0x31, wait=True)
+            elif not first:
+                # Read Cache End: output the last loaded page.
+                await self._do(command=0x3F, wait=True)
+            await self._read(length)
+
+            queued.append(page_row)
+            if len(queued) > depth:
+                yield queued.popleft(), await self.lower.read(length)
+
+        while queued:
+            yield queued.popleft(), await self.lower.read(length)
+
     async def program(self, row, chunks):
         self._log("program row=%#08x", row)
         await self._do_write(command=0x80, address=[
@@ -401,6 +447,31 @@ class ONFIInterface:
         return (await self.read_status() & BIT_STATUS_FAIL) == 0
 
 
+class ONFIBadBlockIndex:
+    """
+    An index of factory bad blocks, built from the spare areas of pages as they are read.
+
+    A factory bad block is marked by a non-FFh value in the first ``marker_size`` bytes of
+    the spare area of its first or its last page.
+    """
+    def __init__(self, block_size, marker_size=1):
+        self.block_size  = block_size
+        self.marker_size = marker_size
+        self.bad_blocks  = set()
+
+    def add_page(self, row, spare):
+        """Check the spare area of page ``row``; return ``True`` if it marks a new bad block."""
+        if row % self.block_size not in (0, self.block_size - 1):
+            return False
+        block = row // self.block_size
+        if block in self.bad_blocks:
+            return False
+        if all(byte == 0xff for byte in spare[:self.marker_size]):
+            return False
+        self.bad_blocks.add(block)
+        return True
+
+
 class MemoryONFIApplet(GlasgowApplet, name="memory-onfi"):
     preview = True
     logger = logging.getLogger(__name__)
@@ -429,6 +500,7 @@ class MemoryONFIApplet(GlasgowApplet, name="memory-onfi"):
 
         * Cmd 0x70: Read Status (all devices)
         * Cmd 0x00 Addr Col1..2,Row1..3 Cmd 0x30: Read (all devices)
+        * Cmd 0x31, Cmd 0x3F: Read Cache Sequential/End (if advertised in ONFI parameter page)
         * Cmd 0x60 Addr Row1..3 Cmd 0xD0: Erase (all devices)
         * Cmd 0x80 Addr Col1..2,Row1..3 [Cmd 0x85 Col1..2]+ Cmd 0x10: Page Program (all devices)
     """
@@ -510,11 +582,22 @@ class MemoryONFIApplet(GlasgowApplet, name="memory-onfi"):
             "count", metavar="COUNT", type=count,
             help="read COUNT pages")
         p_read.add_argument(
-            "data_file", metavar="DATA-FILE", type=argparse.FileType("wb"),
+            "data_file", metavar="DATA-FILE", type=argparse.FileType("a+b", 1 << 20),
             help="write bytes from data and possibly spare area to DATA-FILE")
         p_read.add_argument(
-            "spare_file", metavar="SPARE-FILE", type=argparse.FileType("wb"), nargs="?",
+            "spare_file", metavar="SPARE-FILE", type=argparse.FileType("a+b", 1 << 20),
+            nargs="?",
             help="write bytes from spare area to SPARE-FILE instead of DATA-FILE")
+        p_read.add_argument(
+            "-r", "--resume", default=False, action="store_true",
+            help="skip pages already present in DATA-FILE (and SPARE-FILE), instead of "
+                 "overwriting them")
+        p_read.add_argument(
+            "--bad-blocks", metavar="FILE", type=argparse.FileType("wt"),
+            help="write indexes of blocks with a factory bad block marker to FILE")
+        p_read.add_argument(
+            "--no-cache-read", dest="cache_read", default=True, action="store_false",
+            help="do not use Read Cache commands even if the device advertises them")
 
         p_program = p_operation.add_parser(
             "program", help="program data and spare contents for a page range")
@@ -707,23 +790,60 @@ class MemoryONFIApplet(GlasgowApplet, name="memory-onfi"):
                 return
 
         if args.operation == "read":
-            row   = args.start_page
-            count = args.count
-            while count > 0:
-                self.logger.info("reading page (row) %d", row)
-                chunk = await onfi_iface.read(column=0, row=row, length=page_size + spare_size)
-
+            if args.spare_file:
+                files = [(args.data_file, 0, page_size), (args.spare_file, page_size, spare_size)]
+            else:
+                files = [(args.data_file, 0, page_size + spare_size)]
+
+            bad_block_index = ONFIBadBlockIndex(block_size)
+            def add_page(row, spare):
+                if bad_block_index.add_page(row, spare):
+                    self.logger.warning("block %d (row %d) is marked bad",
+                                        row // block_size, row)
+
+            done = 0
+            if args.resume:
+                if not all(f.seekable() for f, _, _ in files):
+                    raise GlasgowAppletError("cannot resume reading into a non-seekable file")
+                # Only whole pages count as done; anything after the last whole page is discarded.
+                done = min(args.count, *(f.seek(0, 2) // size for f, _, size in files))
+                for f, _, size in files:
+                    f.truncate(done * size)
+                self.logger.info("resuming after %d pages", done)
+
+                # Recover bad block markers of the pages that were already read.
                 if args.spare_file:
-                    args.data_file.write(chunk[:page_size])
-                    args.data_file.flush()
-                    args.spare_file.write(chunk[-spare_size:])
-                    args.spare_file.flush()
+                    spare_file, spare_offset, spare_stride = \
+                        args.spare_file, 0, spare_size
                 else:
-                    args.data_file.write(chunk)
-                    args.data_file.flush()
-
-                row   += 1
-                count -= 1
+                    spare_file, spare_offset, spare_stride = \
+                        args.data_file, page_size, page_size + spare_size
+                for row in range(args.start_page, args.start_page + done):
+                    if row % block_size in (0, block_size - 1):
+                        spare_file.seek((row - args.start_page) * spare_stride + spare_offset)
+                        add_page(row, spare_file.read(1))
+            else:
+                for f, _, _ in files:
+                    if f.seekable():
+                        f.truncate(0)
+
+            use_cache = (args.cache_read and onfi_param is not None and
+                         onfi_param.opt_commands.read_cache)
+            async for row, chunk in onfi_iface.read_pages(
+                    args.start_page + done, args.count - done, page_size + spare_size,
+                    cache=use_cache, block_size=block_size):
+                if row % block_size == 0 or row == args.start_page + done:
+                    self.logger.info("reading block %d (row %d)", row // block_size, row)
+                for f, offset, size in files:
+                    f.write(chunk[offset:offset + size])
+                add_page(row, chunk[page_size:])
+
+            for f, _, _ in files:
+                f.flush()
+            if args.bad_blocks:
+                for block in sorted(bad_block_index.bad_blocks):
+                    args.bad_blocks.write("{}\n".format(block))
+            self.logger.info("%d bad blocks found", len(bad_block_index.bad_blocks))
 
         if args.operation == "program":
             row   = args.start_page
@@ -757,6 +877,113 @@ class MemoryONFIApplet(GlasgowApplet, name="memory-onfi"):
 
 # -------------------------------------------------------------------------------------------------
 
+import unittest
+
+
+class ONFIInterfaceTestCase(unittest.TestCase):
+    class MockNAND:
+        """A NAND array behind the applet command stream, implementing the page read commands."""
+        def __init__(self, pages, page_length):
+            self.pages       = pages
+            self.page_length = page_length
+            self.buffer      = bytearray()
+            self.output      = bytearray()
+            self.control     = 0
+            self.address     = []
+            self.row         = None
+            self.loaded      = None
+            self.commands    = []
+
+        def _command(self, command):
+            self.commands.append(command)
+            if command == 0x00:
+                self.address = []
+            elif command == 0x30:
+                self.row = self.address[2] | (self.address[3] << 8) | (self.address[4] << 16)
+                self.loaded = self.pages[self.row]
+            elif command == 0x31:
+                self.output_page = self.loaded
+                self.row += 1
+                self.loaded = self.pages[self.row]
+            elif command == 0x3F:
+                self.output_page = self.loaded
+                self.loaded = None
+            self.column = 0
+
+        async def write(self, data):
+            self.buffer += data
+            while self.buffer:
+                command = self.buffer[0]
+                if command == CMD_SELECT or command == CMD_CONTROL:
+                    if len(self.buffer) < 2: break
+                    if command == CMD_CONTROL:
+                        self.control = self.buffer[1]
+                    del self.buffer[:2]
+                elif command == CMD_WAIT:
+                    del self.buffer[:1]
+                elif command in (CMD_WRITE, CMD_READ):
+                    if len(self.buffer) < 3: break
+                    length, = struct.unpack("<H", self.buffer[1:3])
+                    if command == CMD_READ:
+                        page = self.output_page if self.commands[-1] in (0x31, 0x3F) else \
+                               self.loaded
+                        self.output += page[self.column:self.column + length]
+                        self.column += length
+                        del self.buffer[:3]
+                    else:
+                        if len(self.buffer) < 3 + length: break
+                        for byte in self.buffer[3:3 + length]:
+                            if self.control & BIT_CLE:
+                                self._command(byte)
+                            elif self.control & BIT_ALE:
+                                self.address.append(byte)
+                        del self.buffer[:3 + length]
+                else:
+                    assert False
+
+        async def read(self, length):
+            assert len(self.output) >= length
+            data, self.output = self.output[:length], self.output[length:]
+            return memoryview(bytes(data))
+
+    def setUp(self):
+        self.pages = [bytes([row] * 6) + bytes([0x00 if row in (8, 23) else 0xff] * 2)
+                      for row in range(32)]
+        self.lower = self.MockNAND(self.pages, 8)
+        self.iface = ONFIInterface(self.lower, logging.getLogger(__name__))
+
+    def read_pages(self, *args, **kwargs):
+        async def collect():
+            return [(row, bytes(data))
+                    async for row, data in self.iface.read_pages(*args, **kwargs)]
+        return asyncio.get_event_loop().run_until_complete(collect())
+
+    def test_read_pages(self):
+        self.assertEqual(self.read_pages(3, 10, 8, depth=2),
+                         [(row, self.pages[row]) for row in range(3, 13)])
+        self.assertEqual(self.lower.commands.count(0x30), 10)
+
+    def test_read_pages_cache(self):
+        self.assertEqual(self.read_pages(3, 20, 8, cache=True, block_size=8),
+                         [(row, self.pages[row]) for row in range(3, 23)])
+        # One cache read sequence per block, with the last page of each ending it.
+        self.assertEqual(self.lower.commands.count(0x30), 3)
+        self.assertEqual(self.lower.commands.count(0x3F), 3)
+        self.assertEqual(self.lower.commands.count(0x31), 17)
+
+    def test_read_pages_cache_single(self):
+        self.assertEqual(self.read_pages(7, 2, 8, cache=True, block_size=8),
+                         [(7, self.pages[7]), (8, self.pages[8])])
+        self.assertNotIn(0x31, self.lower.commands)
+
+    def test_bad_block_index(self):
+        index = ONFIBadBlockIndex(block_size=8)
+        for row in range(32):
+            index.add_page(row, self.pages[row][6:])
+        self.assertEqual(index.bad_blocks, {1, 2})
+        self.assertFalse(index.add_page(8, b"\x00"))
+
+
 class MemoryONFIAppletTestCase(GlasgowAppletTestCase, applet=MemoryONFIApplet):
     @synthesis_test
     def test_build(self):
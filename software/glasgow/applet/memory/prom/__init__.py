@@ -2,9 +2,11 @@
 # Accession: G00057
 
 import re
+import sys
 import enum
 import math
 import json
+import array
 import random
 import logging
 import asyncio
@@ -324,6 +326,10 @@ class MemoryPROMSubtarget(Elaboratable):
 
 class MemoryPROMInterface:
     class Data:
+        # Typed array codes for each word size; words are kept in native byte order.
+        _TYPECODES = {array.array(code).itemsize: code for code in "LIHB"}
+        _POPCOUNT  = bytes(format(n, "b").count("1") for n in range(256))
+
         def __init__(self, raw_data, dq_bytes, endian="little"):
             assert isinstance(raw_data, (bytes, bytearray, memoryview))
             assert isinstance(dq_bytes, int)
@@ -331,6 +337,30 @@ class MemoryPROMInterface:
             self.raw_data = raw_data
             self.dq_bytes = dq_bytes
             self.endian   = endian
+            self._words   = None
+
+        @classmethod
+        def _typecode(cls, dq_bytes):
+            return cls._TYPECODES.get(dq_bytes)
+
+        @property
+        def words(self):
+            """The words of the data, as an ``array.array`` (or a list, for unusual word sizes)."""
+            if self._words is None:
+                typecode = self._typecode(self.dq_bytes)
+                if typecode is None:
+                    self._words = [
+                        int.from_bytes(self.raw_data[index * self.dq_bytes:
+                                                     (index + 1) * self.dq_bytes],
+                                       byteorder=self.endian)
+                        for index in range(len(self))
+                    ]
+                else:
+                    self._words = array.array(typecode)
+                    self._words.frombytes(self.raw_data[:len(self) * self.dq_bytes])
+                    if self.endian != sys.byteorder:
+                        self._words.byteswap()
+            return self._words
 
         def __bytes__(self):
             return bytes(self.raw_data)
@@ -343,18 +373,14 @@ class MemoryPROMInterface:
             if isinstance(key, int):
                 if key not in range(-n, n):
                     raise IndexError("Cannot index {} words into {}-word data".format(key, n))
-                if key < 0:
-                    key += n
-                elem = self.raw_data[key * self.dq_bytes:(key + 1) * self.dq_bytes]
-                return int.from_bytes(elem, byteorder=self.endian)
+                return self.words[key]
             elif isinstance(key, slice):
-                start, stop, step = key.indices(n)
-                return [self[index] for index in range(start, stop, step)]
+                return list(self.words[key])
             else:
                 raise TypeError("Cannot index value with {}".format(repr(key)))
 
-            if index not in range(len(self)):
-                raise IndexError
+        def __iter__(self):
+            return iter(self.words)
 
         def __eq__(self, other):
             if not isinstance(other, type(self)):
@@ -366,21 +392,33 @@ class MemoryPROMInterface:
         def convert(self, endian):
             if endian == self.endian:
                 return self
-            return type(self)(b"".join(elem.to_bytes(self.dq_bytes, byteorder=endian)
-                                       for elem in self),
-                              self.dq_bytes, endian)
+            if self._typecode(self.dq_bytes) is None:
+                return type(self)(b"".join(elem.to_bytes(self.dq_bytes, byteorder=endian)
+                                           for elem in self),
+                                  self.dq_bytes, endian)
+            words = array.array(self.words.typecode, self.words)
+            if endian != sys.byteorder:
+                words.byteswap()
+            return type(self)(words.tobytes(), self.dq_bytes, endian)
 
         def difference(self, other):
             assert (isinstance(other, type(self)) and len(self) == len(other) and
                     self.endian == other.endian)
-            raw_diff = ((int.from_bytes(self.raw_data,  "little") ^
-                         int.from_bytes(other.raw_data, "little"))
-                        .to_bytes(len(self.raw_data), "little"))
-            diff = dict()
-            for m in re.finditer(rb"[^\x00]", raw_diff):
-                index = m.start() // self.dq_bytes
-                diff[index] = (self[index], other[index])
-            return diff
+            # Only whole words are compared; a trailing partial word is not part of the data.
+            length   = len(self) * self.dq_bytes
+            raw_diff = ((int.from_bytes(self.raw_data[:length],  "little") ^
+                         int.from_bytes(other.raw_data[:length], "little"))
+                        .to_bytes(length, "little"))
+            indexes = {m.start() // self.dq_bytes for m in re.finditer(rb"[^\x00]", raw_diff)}
+            words, other_words = self.words, other.words
+            return {index: (words[index], other_words[index]) for index in sorted(indexes)}
+
+        def popcount(self):
+            return sum(bytes(self.raw_data).translate(self._POPCOUNT))
+
+    # Number of words read per command chunk. Reads are pipelined one chunk deep, so that
+    # the command FIFO never runs dry while the previous responses are being received.
+    _READ_CHUNK_WORDS = 16384
 
     def __init__(self, interface, logger, a_bits, dq_bits):
         self.lower    = interface
@@ -392,42 +430,94 @@ class MemoryPROMInterface:
     def _log(self, message, *args):
         self._logger.log(self._level, "PROM: " + message, *args)
 
+    async def _read_chunks(self, chunks, consume):
+        # Each chunk is a pair of commands and response word count; `consume` is called with
+        # the chunk index and its responses.
+        pending_count = 0
+        for index, (commands, count) in enumerate(chunks):
+            await self.lower.write(commands)
+            if pending_count:
+                consume(index - 1, await self.lower.read(pending_count * self.dq_bytes))
+            pending_count = count
+        if pending_count:
+            consume(index, await self.lower.read(pending_count * self.dq_bytes))
+
+    def _iter_read_chunks(self, address, count):
+        read_commands = bytes([_Command.READ, _Command.INCR]) * self._READ_CHUNK_WORDS
+        for offset in range(0, count, self._READ_CHUNK_WORDS):
+            chunk_count = min(count - offset, self._READ_CHUNK_WORDS)
+            commands = read_commands[:chunk_count * 2]
+            if offset == 0:
+                commands = bytes([_Command.SEEK, *address.to_bytes(self.a_bytes, "little")]) + \
+                           commands
+            yield commands, chunk_count
+
+    def _shuffled_read_commands(self, addresses):
+        # Lay out a SEEK, address and READ record per word using strided slice assignment.
+        size     = 2 + self.a_bytes
+        commands = bytearray(len(addresses) * size)
+        commands[0::size] = bytes([_Command.SEEK]) * len(addresses)
+        commands[size - 1::size] = bytes([_Command.READ]) * len(addresses)
+        address_words = array.array(self.Data._typecode(4), addresses)
+        if sys.byteorder != "little":
+            address_words.byteswap()
+        address_bytes = address_words.tobytes()
+        for index in range(self.a_bytes):
+            commands[1 + index::size] = address_bytes[index::4]
+        return commands
+
     async def read(self, address, count):
         self._log("read a=%#x n=%d", address, count)
-        await self.lower.write([
-            _Command.SEEK,
-            *address.to_bytes(self.a_bytes, byteorder="little"),
-            *[
-                _Command.READ,
-                _Command.INCR,
-            ] * count,
-        ])
-
-        data = self.Data(await self.lower.read(count * self.dq_bytes), self.dq_bytes)
+        raw_data = bytearray(count * self.dq_bytes)
+        raw_view = memoryview(raw_data)
+        chunk_bytes = self._READ_CHUNK_WORDS * self.dq_bytes
+        def consume(index, chunk):
+            raw_view[index * chunk_bytes:index * chunk_bytes + len(chunk)] = chunk
+        await self._read_chunks(self._iter_read_chunks(address, count), consume)
+
+        data = self.Data(raw_data, self.dq_bytes)
         self._log("read q=<%s>",
                   dump_mapseq(" ", lambda q: f"{q:0{self.dq_bytes * 2}x}", data))
         return data
 
     async def read_shuffled(self, address, count):
         self._log("read shuffled a=%#x n=%d", address, count)
-        order = [offset for offset in range(count)]
+        order = list(range(count))
         random.shuffle(order)
-        commands = []
-        for offset in order:
-            commands += [
-                _Command.SEEK,
-                *(address + offset).to_bytes(self.a_bytes, byteorder="little"),
-                _Command.READ,
-            ]
-        await self.lower.write(commands)
-
-        linear_raw_chunks = [None for _ in range(count)]
-        shuffled_raw_data = await self.lower.read(count * self.dq_bytes)
-        for shuffled_offset, linear_offset in enumerate(order):
-            linear_raw_chunks[linear_offset] = \
-                shuffled_raw_data[shuffled_offset * self.dq_bytes:
-                                 (shuffled_offset + 1) * self.dq_bytes]
-        data = self.Data(b"".join(linear_raw_chunks), self.dq_bytes)
+
+        def iter_chunks():
+            for base in range(0, count, self._READ_CHUNK_WORDS):
+                chunk_order = order[base:base + self._READ_CHUNK_WORDS]
+                yield (self._shuffled_read_commands([address + offset for offset in chunk_order]),
+                       len(chunk_order))
+
+        typecode = self.Data._typecode(self.dq_bytes)
+        raw_data = bytearray(count * self.dq_bytes)
+        if typecode is not None:
+            # Scatter the responses as native words, and convert to little endian afterwards.
+            words = array.array(typecode, bytes(len(raw_data)))
+            def consume(index, chunk):
+                chunk_words = array.array(typecode)
+                chunk_words.frombytes(chunk)
+                if sys.byteorder != "little":
+                    chunk_words.byteswap()
+                base = index * self._READ_CHUNK_WORDS
+                for offset, word in zip(order[base:base + len(chunk_words)], chunk_words):
+                    words[offset] = word
+        else:
+            def consume(index, chunk):
+                base = index * self._READ_CHUNK_WORDS
+                for chunk_offset, offset in enumerate(order[base:base + len(chunk) //
+                                                                 self.dq_bytes]):
+                    raw_data[offset * self.dq_bytes:(offset + 1) * self.dq_bytes] = \
+                        chunk[chunk_offset * self.dq_bytes:(chunk_offset + 1) * self.dq_bytes]
+        await self._read_chunks(iter_chunks(), consume)
+        if typecode is not None:
+            if sys.byteorder != "little":
+                words.byteswap()
+            raw_data = words.tobytes()
+
+        data = self.Data(raw_data, self.dq_bytes)
         self._log("read shuffled q=<%s>",
                   dump_mapseq(" ", lambda q: f"{q:0{self.dq_bytes * 2}x}", data))
         return data
@@ -663,6 +753,15 @@ class MemoryPROMApplet(GlasgowApplet, name="memory-prom"):
             "file", metavar="FILENAME", type=argparse.FileType("wt"),
             help="write aggregated data to FILENAME")
 
+    @staticmethod
+    def _read_file_data(args, prom_iface):
+        raw_data = args.file.read()
+        if len(raw_data) % prom_iface.dq_bytes != 0:
+            raise GlasgowAppletError("file {} is {} bytes long, which is not a multiple of "
+                                     "the {}-byte word size"
+                                     .format(args.file.name, len(raw_data), prom_iface.dq_bytes))
+        return prom_iface.Data(raw_data, prom_iface.dq_bytes, args.endian)
+
     async def interact(self, device, args, prom_iface):
         a_bits  = args.a_bits
         dq_bits = len(args.pin_set_dq)
@@ -680,22 +779,22 @@ class MemoryPROMApplet(GlasgowApplet, name="memory-prom"):
                     print("{:0{}x}".format(word, (dq_bits + 3) // 4))
 
         if args.operation == "verify":
-            golden_data = prom_iface.Data(args.file.read(), prom_iface.dq_bytes, args.endian)
+            golden_data = self._read_file_data(args, prom_iface)
             actual_data = await prom_iface.read(args.address, len(golden_data))
             if actual_data == golden_data:
                 self.logger.info("verify PASS")
             else:
-                differ = sum(a != b for a, b in zip(golden_data, actual_data))
+                differ = len(golden_data.difference(actual_data.convert(golden_data.endian)))
                 raise GlasgowAppletError("verify FAIL ({} words differ)"
                                          .format(differ))
 
         if args.operation == "write":
-            data = prom_iface.Data(args.file.read(), prom_iface.dq_bytes, args.endian)
+            data = self._read_file_data(args, prom_iface)
             self.logger.info("writing %#x+%#x", args.address, len(data))
             await prom_iface.write(args.address, data)
 
         if args.operation == "atmel" and args.vendor_operation == "write":
-            data = prom_iface.Data(args.file.read(), prom_iface.dq_bytes, args.endian)
+            data = self._read_file_data(args, prom_iface)
             offset = 0
             for address in range(args.address, args.address + len(data) + args.sector_size - 1,
                                  args.sector_size):
@@ -789,7 +888,6 @@ class MemoryPROMApplet(GlasgowApplet, name="memory-prom"):
 
         if args.operation == "health" and args.mode == "popcount":
             voltage_from, voltage_to = args.sweep
-            popcount_lut = [format(n, "b").count("1") for n in range(1 << dq_bits)]
 
             series = []
             voltage = voltage_from
@@ -802,7 +900,7 @@ class MemoryPROMApplet(GlasgowApplet, name="memory-prom"):
                 for sample_num in range(args.samples):
                     self.logger.info("  sample %d", sample_num)
                     data = await prom_iface.read_shuffled(0, depth)
-                    popcounts.append(sum(popcount_lut[word] for word in data))
+                    popcounts.append(data.popcount())
 
                 series.append((voltage, popcounts))
                 self.logger.info("population %d/%d",
@@ -866,7 +964,100 @@ class MemoryPROMAppletTool(GlasgowAppletTool, applet=MemoryPROMApplet):
 
 # -------------------------------------------------------------------------------------------------
 
+import io
+import unittest
+
+
 class MemoryPROMAppletTestCase(GlasgowAppletTestCase, applet=MemoryPROMApplet):
     @synthesis_test
     def test_build(self):
         self.assertBuilds()
+
+
+class MemoryPROMInterfaceTestCase(unittest.TestCase):
+    class MockInterface:
+        def __init__(self, memory, a_bytes, dq_bytes):
+            self.memory   = memory
+            self.a_bytes  = a_bytes
+            self.dq_bytes = dq_bytes
+            self.address  = 0
+            self.output   = bytearray()
+            self.writes   = 0
+
+        async def write(self, data):
+            self.writes += 1
+            data = bytes(data)
+            while data:
+                command, data = data[0], data[1:]
+                if command == _Command.SEEK:
+                    self.address = int.from_bytes(data[:self.a_bytes], "little")
+                    data = data[self.a_bytes:]
+                elif command == _Command.INCR:
+                    self.address += 1
+                elif command == _Command.READ:
+                    self.output += self.memory[self.address].to_bytes(self.dq_bytes, "little")
+                else:
+                    assert False
+
+        async def read(self, length):
+            assert len(self.output) >= length
+            data, self.output = self.output[:length], self.output[length:]
+            return memoryview(bytes(data))
+
+    def setUp(self):
+        self.memory = [(n * 0x1234 + 0x5678) & 0xffff for n in range(1000)]
+        self.lower  = self.MockInterface(self.memory, a_bytes=2, dq_bytes=2)
+        self.iface  = MemoryPROMInterface(self.lower, logging.getLogger(__name__),
+                                          a_bits=10, dq_bits=16)
+        self.iface._READ_CHUNK_WORDS = 64
+
+    def run_coro(self, coro):
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+    def test_read(self):
+        data = self.run_coro(self.iface.read(10, 300))
+        self.assertEqual(list(data), self.memory[10:310])
+        self.assertEqual(self.lower.writes, 5)
+
+    def test_read_shuffled(self):
+        data = self.run_coro(self.iface.read_shuffled(10, 300))
+        self.assertEqual(list(data), self.memory[10:310])
+        self.assertEqual(data, self.run_coro(self.iface.read(10, 300)))
+
+    def test_data(self):
+        data = MemoryPROMInterface.Data(b"\x01\x02\x03\x04\x05\x06", 2)
+        self.assertEqual(len(data), 3)
+        self.assertEqual(data[0], 0x0201)
+        self.assertEqual(data[-1], 0x0605)
+        self.assertEqual(data[1:], [0x0403, 0x0605])
+        with self.assertRaises(IndexError):
+            data[3]
+        self.assertEqual(list(data.convert("big")), [0x0201, 0x0403, 0x0605])
+        self.assertEqual(data.convert("big").raw_data, b"\x02\x01\x04\x03\x06\x05")
+        self.assertEqual(data, data.convert("big"))
+        self.assertEqual(data.popcount(), 1 + 1 + 2 + 1 + 2 + 2)
+
+    def test_data_difference(self):
+        data_a = MemoryPROMInterface.Data(b"\x01\x02\x03\x04\x05\x06", 2)
+        data_b = MemoryPROMInterface.Data(b"\x01\x02\x03\x00\x00\x06", 2)
+        self.assertEqual(data_a.difference(data_b), {1: (0x0403, 0x0003), 2: (0x0605, 0x0600)})
+
+    def test_data_difference_partial_word(self):
+        data_a = MemoryPROMInterface.Data(b"\x01\x02\x03", 2)
+        data_b = MemoryPROMInterface.Data(b"\x01\x02", 2)
+        self.assertEqual(data_a.difference(data_b), {})
+
+    def test_read_file_data(self):
+        args = argparse.Namespace(file=io.BytesIO(b"\x01\x02\x03\x04"), endian="little")
+        data = MemoryPROMApplet._read_file_data(args, self.iface)
+        self.assertEqual(list(data), [0x0201, 0x0403])
+        args.file = io.BytesIO(b"\x01\x02\x03")
+        args.file.name = "image.bin"
+        with self.assertRaisesRegex(GlasgowAppletError,
+                r"file image.bin is 3 bytes long, which is not a multiple of the 2-byte "):
+            MemoryPROMApplet._read_file_data(args, self.iface)
+
+    def test_data_odd_width(self):
+        data = MemoryPROMInterface.Data(b"\x01\x02\x03\x04\x05\x06", 3, "big")
+        self.assertEqual(list(data), [0x010203, 0x040506])
+        self.assertEqual(data.convert("little").raw_data, b"\x03\x02\x01\x06\x05\x04")
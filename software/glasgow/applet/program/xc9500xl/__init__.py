@@ -230,7 +230,7 @@ from ....arch.jtag import *
 from ....arch.xilinx.xc9500xl import *
 from ....support.logging import *
 from ....database.xilinx.xc9500xl import *
-from ...interface.jtag_probe import JTAGProbeApplet
+from ...interface.jtag_probe import JTAGProbeApplet, MultiTAPInterface
 from ....protocol.jesd3 import *
 from ... import *
 
@@ -294,7 +294,8 @@ class XC9500XLInterface:
         if device is None:
             xc95xx_iface = None
         else:
-            xc95xx_iface = XC95xxXLInterface(self.lower, self._logger, self._frequency, device)
+            xc95xx_iface = XC95xxXLInterface(MultiTAPInterface.from_tap(self.lower),
+                                             self._logger, self._frequency, device)
         return idcode, device, xc95xx_iface
 
     async def read_usercode(self):
@@ -305,6 +306,14 @@ class XC9500XLInterface:
 
 
 class XC95xxXLInterface:
+    """
+    One or several identical XC95xxXL devices in a JTAG chain, operated in lockstep.
+
+    Every instruction is loaded into all of the devices, and every ISCONFIGURATION or ISDATA scan
+    carries one word for each of them, so the Run-Test/Idle cycles that dominate programming time
+    are spent only once regardless of the number of devices. A single device is operated through
+    a one-element ``MultiTAPInterface``.
+    """
     def __init__(self, interface, logger, frequency, device):
         self.lower   = interface
         self._logger = logger
@@ -317,61 +326,89 @@ class XC95xxXLInterface:
     def _log(self, message, *args):
         self._logger.log(self._level, "XC95xx: " + message, *args)
 
+    @property
+    def indexes(self):
+        return self.lower.indexes
+
+    def _tap_prefix(self, index):
+        if len(self.indexes) > 1:
+            return "TAP #{:d}: ".format(index)
+        else:
+            return ""
+
+    def _format_words(self, words):
+        return ", ".join("{:0{}b}".format(word, self.device.word_width) for word in words)
+
+    async def _write_ir(self, data):
+        await self.lower.write_ir([data] * len(self.indexes))
+
+    async def _write_dr(self, data):
+        await self.lower.write_dr([data] * len(self.indexes))
+
+    async def _exchange_dr(self, data):
+        return await self.lower.exchange_dr([data] * len(self.indexes))
+
     async def programming_enable(self):
         self._log("programming enable")
-        await self.lower.write_ir(IR_ISPEN)
+        await self._write_ir(IR_ISPEN)
         await self.lower.run_test_idle(1)
 
     async def programming_disable(self):
         self._log("programming disable")
-        await self.lower.write_ir(IR_ISPEX)
+        await self._write_ir(IR_ISPEX)
         await self.lower.run_test_idle(100)
-        await self.lower.write_ir(IR_BYPASS)
+        await self._write_ir(IR_BYPASS)
         await self.lower.run_test_idle(1)
 
     async def _fvfy(self, address, count):
-        await self.lower.write_ir(IR_FVFY)
+        await self._write_ir(IR_FVFY)
 
         dev_address = bitstream_to_device_address(address)
         self._log("read address=%03x", dev_address)
         isconf = self.DR_ISCONFIGURATION(valid=1, strobe=1, address=dev_address)
-        await self.lower.write_dr(isconf.to_bits())
+        await self._write_dr(isconf.to_bits())
 
-        words = []
+        words = [[] for _ in self.indexes]
         for offset in range(count):
             await self.lower.run_test_idle(1)
 
             dev_address = bitstream_to_device_address(address + offset + 1)
             isconf = self.DR_ISCONFIGURATION(valid=1, strobe=1, address=dev_address)
-            isconf_bits = await self.lower.exchange_dr(isconf.to_bits())
-            isconf = self.DR_ISCONFIGURATION.from_bits(isconf_bits)
+            isconf_bits = await self._exchange_dr(isconf.to_bits())
+            prev_words = [self.DR_ISCONFIGURATION.from_bits(device_bits).data
+                          for device_bits in isconf_bits]
             self._log("read address=%03x prev-data=%s",
-                      dev_address, "{:0{}b}".format(isconf.data, self.device.word_width))
-            words.append(isconf.data)
+                      dev_address, self._format_words(prev_words))
+            for device_words, word in zip(words, prev_words):
+                device_words.append(word)
 
         return words
 
     async def _fvfyi(self, count):
-        await self.lower.write_ir(IR_FVFYI)
+        await self._write_ir(IR_FVFYI)
 
-        words = []
-        index = 0
-        while index < count:
+        # The address counters of the devices advance independently, since each device only
+        # advances it on a valid read.
+        words = [[] for _ in self.indexes]
+        while any(len(device_words) < count for device_words in words):
             await self.lower.run_test_idle(1)
 
             isdata_bits = await self.lower.read_dr(self.DR_ISDATA.bit_length())
-            isdata = self.DR_ISDATA.from_bits(isdata_bits)
-            if isdata.valid:
-                self._log("read autoinc %d data=%s",
-                          index, "{:0{}b}".format(isdata.data, self.device.word_width))
-                words.append(isdata.data)
-                index += 1
-            else:
-                self._log("read autoinc %d invalid")
+            for index, device_words, device_bits in zip(self.indexes, words, isdata_bits):
+                isdata = self.DR_ISDATA.from_bits(device_bits)
+                if not isdata.valid:
+                    self._log("%sread autoinc %d invalid",
+                              self._tap_prefix(index), len(device_words))
+                elif len(device_words) < count:
+                    self._log("%sread autoinc %d data=%s",
+                              self._tap_prefix(index), len(device_words),
+                              self._format_words([isdata.data]))
+                    device_words.append(isdata.data)
 
         return words
 
     async def read(self, address, count, fast=True):
+        """Read ``count`` words starting at ``address`` from every device, as a list per device."""
         if fast:
             # Use FVFY just to set the address counter.
             await self._fvfy(address, 0)
@@ -381,34 +418,53 @@ class XC95xxXLInterface:
             # Use FVFY for all reads.
             return await self._fvfy(address, count)
 
-    async def bulk_erase(self):
-        self._log("bulk erase")
-        await self.lower.write_ir(IR_FBULK)
-        isaddr = DR_ISADDRESS(valid=1, strobe=1, address=0xffff)
-        await self.lower.write_dr(isaddr.to_bits())
+    async def verify(self, address, words, fast=True):
+        """
+        Compare ``words`` with the contents of every device, returning a list with the offset of
+        the first mismatched word (or ``None``) for each device.
+        """
+        mismatches = []
+        for device_words in await self.read(address, len(words), fast):
+            for offset, (device_word, gold_word) in enumerate(zip(device_words, words)):
+                if device_word != gold_word:
+                    mismatches.append(offset)
+                    break
+            else:
+                mismatches.append(None)
+        return mismatches
+
+    async def _erase(self, ir, address, kind):
+        await self._write_ir(ir)
+        isaddr = DR_ISADDRESS(valid=1, strobe=1, address=address)
+        await self._write_dr(isaddr.to_bits())
 
         await self.lower.run_test_idle(200_000)
 
-        isaddr_bits = await self.lower.read_dr(DR_ISADDRESS.bit_length())
-        isaddr = DR_ISADDRESS.from_bits(isaddr_bits)
-        if not (isaddr.valid and not isaddr.strobe):
-            raise XC9500XLError("bulk erase failed %s" % isaddr.bits_repr())
+        failed = []
+        for index, isaddr_bits in zip(self.indexes,
+                                      await self.lower.read_dr(DR_ISADDRESS.bit_length())):
+            isaddr = DR_ISADDRESS.from_bits(isaddr_bits)
+            if not (isaddr.valid and not isaddr.strobe):
+                failed.append(self._tap_prefix(index) + isaddr.bits_repr())
+        if failed:
+            raise XC9500XLError("%s failed %s" % (kind, ", ".join(failed)))
+
+    async def bulk_erase(self):
+        self._log("bulk erase")
+        await self._erase(IR_FBULK, 0xffff, "bulk erase")
 
     async def override_erase(self):
         self._log("override erase")
-        await self.lower.write_ir(IR_FERASE)
-        isaddr = DR_ISADDRESS(valid=1, strobe=1, address=0xaa55)
-        await self.lower.write_dr(isaddr.to_bits())
-
-        await self.lower.run_test_idle(200_000)
+        await self._erase(IR_FERASE, 0xaa55, "override erase")
 
-        isaddr_bits = await self.lower.read_dr(DR_ISADDRESS.bit_length())
-        isaddr = DR_ISADDRESS.from_bits(isaddr_bits)
-        if not (isaddr.valid and not isaddr.strobe):
-            raise XC9500XLError("override erase failed %s" % isaddr.bits_repr())
+    def _check_strobe(self, drs, message, *args):
+        for index, dr in zip(self.indexes, drs):
+            if not (dr.valid and not dr.strobe):
+                self._logger.warn("%s" + message + " %s",
+                                  self._tap_prefix(index), *args, dr.bits_repr())
 
     async def _fpgm(self, address, words):
-        await self.lower.write_ir(IR_FPGM)
+        await self._write_ir(IR_FPGM)
 
         for offset, word in enumerate(words):
             dev_address = bitstream_to_device_address(address + offset)
@@ -417,7 +473,7 @@ class XC95xxXLInterface:
             strobe = (offset % BLOCK_WORDS == BLOCK_WORDS - 1)
             isconf = self.DR_ISCONFIGURATION(valid=1, strobe=strobe, address=dev_address,
                                              data=word)
-            await self.lower.write_dr(isconf.to_bits())
+            await self._write_dr(isconf.to_bits())
 
             if not strobe:
                 await self.lower.run_test_idle(1)
@@ -425,26 +481,25 @@ class XC95xxXLInterface:
                 await self.lower.run_test_idle(20_000)
 
                 isconf = self.DR_ISCONFIGURATION(address=dev_address)
-                isconf_bits = await self.lower.exchange_dr(isconf.to_bits())
-                isconf = self.DR_ISCONFIGURATION.from_bits(isconf_bits)
-                if not (isconf.valid and not isconf.strobe):
-                    self._logger.warn("program failed address=%03x %s",
-                                      offset, isconf.bits_repr())
+                isconf_bits = await self._exchange_dr(isconf.to_bits())
+                self._check_strobe([self.DR_ISCONFIGURATION.from_bits(device_bits)
+                                    for device_bits in isconf_bits],
+                                   "program failed address=%03x", offset)
 
         if not words:
             dev_address = bitstream_to_device_address(address)
             isconf = self.DR_ISCONFIGURATION(valid=1, address=dev_address)
-            await self.lower.write_dr(isconf.to_bits())
+            await self._write_dr(isconf.to_bits())
 
     async def _fpgmi(self, words):
-        await self.lower.write_ir(IR_FPGMI)
+        await self._write_ir(IR_FPGMI)
 
         for offset, word in enumerate(words):
             self._log("program autoinc data=%s",
                       "{:0{}b}".format(word, self.device.word_width))
             strobe = (offset % BLOCK_WORDS == BLOCK_WORDS - 1)
             isdata = self.DR_ISDATA(valid=1, strobe=strobe, data=word)
-            await self.lower.write_dr(isdata.to_bits())
+            await self._write_dr(isdata.to_bits())
 
             if not strobe:
                 await self.lower.run_test_idle(1)
@@ -452,11 +507,10 @@ class XC95xxXLInterface:
                 await self.lower.run_test_idle(20_000)
 
                 isdata = self.DR_ISDATA()
-                isdata_bits = await self.lower.exchange_dr(isdata.to_bits())
-                isdata = self.DR_ISDATA.from_bits(isdata_bits)
-                if not (isdata.valid and not isdata.strobe):
-                    self._logger.warn("program autoinc word %03x failed %s",
-                                      offset, isdata.bits_repr())
+                isdata_bits = await self._exchange_dr(isdata.to_bits())
+                self._check_strobe([self.DR_ISDATA.from_bits(device_bits)
+                                    for device_bits in isdata_bits],
+                                   "program autoinc word %03x failed", offset)
 
     async def program(self, address, words, fast=True):
         assert address % BLOCK_WORDS == 0 and len(words) % BLOCK_WORDS == 0
@@ -471,6 +525,57 @@ class XC95xxXLInterface:
             return await self._fpgm(address, words)
 
 
+class XC9500XLChainInterface:
+    def __init__(self, interface, logger, frequency, *, ir_lengths=None):
+        self.lower   = interface
+        self._logger = logger
+        self._level  = logging.DEBUG if self._logger.name == __name__ else logging.TRACE
+        self._frequency  = frequency
+        self._ir_lengths = ir_lengths
+        self._multi_tap  = None
+
+    def _log(self, message, *args):
+        self._logger.log(self._level, "XC9500XL chain: " + message, *args)
+
+    async def identify(self):
+        dr_value, ir_value = await self.lower.scan_reset_dr_ir()
+        idcodes = self.lower.interrogate_dr(dr_value)
+        ir_layout = self.lower.interrogate_ir(ir_value,
+            tap_count=len(idcodes), ir_lengths=self._ir_lengths)
+
+        indexes, tap_idcodes, device = [], [], None
+        for index, idcode_value in enumerate(idcodes):
+            if idcode_value is None:
+                continue
+            idcode = DR_IDCODE.from_int(idcode_value)
+            tap_device = devices_by_idcode[idcode.mfg_id, idcode.part_id]
+            if tap_device is None:
+                continue
+            if device is not None and tap_device is not device:
+                raise XC9500XLError("chain contains different devices (%s and %s)"
+                                    % (device.name, tap_device.name))
+            self._log("found %s at TAP #%d", tap_device.name, index)
+            device = tap_device
+            indexes.append(index)
+            tap_idcodes.append(idcode)
+        if device is None:
+            raise XC9500XLError("chain does not contain any supported devices")
+
+        self._multi_tap = MultiTAPInterface.from_layout(self.lower, ir_layout, indexes=indexes)
+        xc95xx_iface = XC95xxXLInterface(self._multi_tap, self._logger, self._frequency, device)
+        return tap_idcodes, device, xc95xx_iface
+
+    async def read_usercode(self):
+        assert self._multi_tap is not None
+        await self._multi_tap.write_ir([IR_USERCODE] * len(self._multi_tap.indexes))
+        usercodes = []
+        for index, usercode_bits in zip(self._multi_tap.indexes,
+                                        await self._multi_tap.read_dr(32)):
+            self._log("read usercode TAP #%d <%s>", index, dump_bin(usercode_bits))
+            usercodes.append(bytes(usercode_bits)[::-1])
+        return usercodes
+
+
 class ProgramXC9500XLApplet(JTAGProbeApplet, name="program-xc9500xl"):
     logger = logging.getLogger(__name__)
     help = "program Xilinx XC9500XL CPLDs via JTAG"
@@ -486,6 +591,9 @@ class ProgramXC9500XLApplet(JTAGProbeApplet, name="program-xc9500xl"):
 
     [1]: http://tech.mattmillman.com/making-use-of-recycled-xilinx-xc9500-cplds/
 
+    If a JTAG chain contains several identical CPLDs, they can be erased, programmed, and verified
+    at once with --all-taps; this takes about as long as doing so for a single CPLD.
+
     Supported devices are:
 {devices}
 
@@ -502,7 +610,18 @@ class ProgramXC9500XLApplet(JTAGProbeApplet, name="program-xc9500xl"):
         super().add_run_arguments(parser, access)
         super().add_run_tap_arguments(parser)
 
+        parser.add_argument(
+            "--all-taps", default=False, action="store_true",
+            help="operate on every supported device in the chain at once; all of them must be "
+                 "the same device")
+
     async def run(self, device, args):
+        if args.all_taps:
+            if args.tap_index is not None:
+                raise XC9500XLError("--all-taps and --tap-index are mutually exclusive")
+            jtag_iface = await self.run_lower(ProgramXC9500XLApplet, device, args)
+            return XC9500XLChainInterface(jtag_iface, self.logger, args.frequency * 1000,
+                                          ir_lengths=args.ir_lengths)
         tap_iface = await self.run_tap(ProgramXC9500XLApplet, device, args)
         return XC9500XLInterface(tap_iface, self.logger, args.frequency * 1000)
 
@@ -538,7 +657,64 @@ class ProgramXC9500XLApplet(JTAGProbeApplet, name="program-xc9500xl"):
             "--override", default=False, action="store_true",
             help="override write-protection")
 
+    @staticmethod
+    def _read_bit_file(bit_file, xc9500_device):
+        bytes_per_word = (xc9500_device.word_width + 7) // 8
+        words = []
+        while True:
+            data = bit_file.read(bytes_per_word)
+            if data == b"": break
+            words.append(int.from_bytes(data, "little"))
+
+        if len(words) != xc9500_device.bitstream_words:
+            raise GlasgowAppletError("incorrect .bit file size (%d words) for device %s"
+                                     % (len(words), xc9500_device.name))
+        return words
+
+    async def _interact_chain(self, args, chain_iface):
+        idcodes, xc9500_device, xc95xx_iface = await chain_iface.identify()
+        usercodes = await chain_iface.read_usercode()
+        for index, idcode, usercode in zip(xc95xx_iface.indexes, idcodes, usercodes):
+            self.logger.info("TAP #%d: found %s rev=%d USERCODE=%s (%s)",
+                             index, xc9500_device.name, idcode.version, usercode.hex(),
+                             re.sub(rb"[^\x20-\x7e]", b"?", usercode).decode("ascii"))
+
+        if args.operation == "read-bit":
+            raise GlasgowAppletError("read-bit cannot be used with --all-taps")
+
+        if args.operation in ("program-bit", "verify-bit"):
+            words = self._read_bit_file(args.bit_file, xc9500_device)
+
+        try:
+            if args.operation == "program-bit":
+                await xc95xx_iface.programming_enable()
+                await xc95xx_iface.program(0, words,
+                                           fast=not args.slow)
+
+            if args.operation == "verify-bit":
+                await xc95xx_iface.programming_enable()
+                mismatches = await xc95xx_iface.verify(0, words,
+                                                       fast=not args.slow)
+                failures = ["TAP #%d at word %03x" % (index, offset)
+                            for index, offset in zip(xc95xx_iface.indexes, mismatches)
+                            if offset is not None]
+                if failures:
+                    raise GlasgowAppletError("bitstream verification failed on %s"
+                                             % ", ".join(failures))
+
+            if args.operation == "erase":
+                await xc95xx_iface.programming_enable()
+                if args.override:
+                    await xc95xx_iface.override_erase()
+                await xc95xx_iface.bulk_erase()
+
+        finally:
+            await xc95xx_iface.programming_disable()
+
     async def interact(self, device, args, xc9500_iface):
+        if isinstance(xc9500_iface, XC9500XLChainInterface):
+            return await self._interact_chain(args, xc9500_iface)
+
         idcode, xc9500_device, xc95xx_iface = await xc9500_iface.identify()
         if xc9500_device is None:
             raise GlasgowAppletError("cannot operate on unknown device with IDCODE=%#10x"
@@ -556,20 +732,13 @@ class ProgramXC9500XLApplet(JTAGProbeApplet, name="program-xc9500xl"):
         try:
             if args.operation == "read-bit":
                 await xc95xx_iface.programming_enable()
-                for word in await xc95xx_iface.read(0, xc9500_device.bitstream_words,
-                                                    fast=not args.slow):
+                words, = await xc95xx_iface.read(0, xc9500_device.bitstream_words,
+                                                 fast=not args.slow)
+                for word in words:
                     args.bit_file.write(word.to_bytes(bytes_per_word, "little"))
 
             if args.operation in ("program-bit", "verify-bit"):
-                words = []
-                while True:
-                    data = args.bit_file.read(bytes_per_word)
-                    if data == b"": break
-                    words.append(int.from_bytes(data, "little"))
-
-                if len(words) != xc9500_device.bitstream_words:
-                    raise GlasgowAppletError("incorrect .bit file size (%d words) for device %s"
-                                             % (len(words), xc9500_device.name))
+                words = self._read_bit_file(args.bit_file, xc9500_device)
 
             if args.operation == "program-bit":
                 await xc95xx_iface.programming_enable()
@@ -578,12 +747,11 @@ class ProgramXC9500XLApplet(JTAGProbeApplet, name="program-xc9500xl"):
 
             if args.operation == "verify-bit":
                 await xc95xx_iface.programming_enable()
-                device_words = await xc95xx_iface.read(0, xc9500_device.bitstream_words,
-                                                       fast=not args.slow)
-                for offset, (device_word, gold_word) in enumerate(zip(device_words, words)):
-                    if device_word != gold_word:
-                        raise GlasgowAppletError("bitstream verification failed at word %03x"
-                                                 % offset)
+                mismatch, = await xc95xx_iface.verify(0, words,
+                                                      fast=not args.slow)
+                if mismatch is not None:
+                    raise GlasgowAppletError("bitstream verification failed at word %03x"
+                                             % mismatch)
 
             if args.operation == "erase":
                 await xc95xx_iface.programming_enable()
@@ -677,3 +845,121 @@ class ProgramXC9500XLAppletTool(GlasgowAppletTool, applet=ProgramXC9500XLApplet)
             words = fuses_to_words(parser.fuse, args.device)
             for word in words:
                 args.bit_file.write(word.to_bytes(bytes_per_word, "little"))
+
+# -------------------------------------------------------------------------------------------------
+
+import asyncio
+import unittest
+
+from ....support.bits import bits
+from ...interface.jtag_probe import TAPInterface
+
+
+class XC95xxXLInterfaceTestCase(unittest.TestCase):
+    class MockMultiTAP:
+        # Records the operations, and answers DR captures with `responses`, which is called with
+        # the DR length and returns a list with one register value per TAP.
+        def __init__(self, indexes, responses):
+            self.indexes   = indexes
+            self.responses = responses
+            self.ops       = []
+
+        async def write_ir(self, data):
+            self.ops.append(("ir", data))
+
+        async def write_dr(self, data):
+            self.ops.append(("dr", data))
+
+        async def exchange_dr(self, data):
+            self.ops.append(("dr", data))
+            return [value.to_bits() for value in self.responses(len(data[0]))]
+
+        async def read_dr(self, length):
+            self.ops.append(("read_dr", length))
+            return [value.to_bits() for value in self.responses(length)]
+
+        async def run_test_idle(self, count):
+            self.ops.append(("idle", count))
+
+    def setUp(self):
+        self.device = devices_by_name["XC9572XL"]
+
+    def make_iface(self, indexes, responses):
+        self.lower = self.MockMultiTAP(indexes, responses)
+        return XC95xxXLInterface(self.lower, logging.getLogger(__name__), 0, self.device)
+
+    def run_iface(self, coro):
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+    def test_program_lockstep(self):
+        def responses(length):
+            if length == iface.DR_ISDATA.bit_length():
+                dr = iface.DR_ISDATA
+            else:
+                dr = iface.DR_ISCONFIGURATION
+            return [dr(valid=1), dr(valid=1, strobe=1)]
+        iface = self.make_iface([1, 3], responses)
+        words = list(range(BLOCK_WORDS * 3))
+        with self.assertLogs(__name__, level="WARNING") as logs:
+            self.run_iface(iface.program(0, words))
+        # The strobe wait is spent once per block, regardless of the number of devices.
+        self.assertEqual(self.lower.ops.count(("idle", 20_000)), 3)
+        self.assertEqual([op for op in self.lower.ops if op[0] == "ir"], [
+            ("ir", [IR_FPGM, IR_FPGM]),
+            ("ir", [IR_FPGMI, IR_FPGMI]),
+        ])
+        for kind, data in self.lower.ops:
+            if kind == "dr":
+                self.assertEqual(len(data), 2)
+                self.assertEqual(data[0], data[1])
+        self.assertEqual(len(logs.output), 3)
+        self.assertIn("TAP #3: program failed address=00e", logs.output[0])
+        self.assertIn("TAP #3: program autoinc word 00e failed", logs.output[1])
+
+    def test_verify(self):
+        data_a = iter([1, 2, 3, 4])
+        data_b = iter([1, None, 2, 4])
+        def responses(length):
+            isdata_b = next(data_b)
+            return [self.iface.DR_ISDATA(valid=1, data=next(data_a)),
+                    self.iface.DR_ISDATA(valid=isdata_b is not None, data=isdata_b or 0)]
+        self.iface = self.make_iface([0, 2], responses)
+        self.iface._fvfy = lambda address, count: asyncio.sleep(0)
+        self.assertEqual(self.run_iface(self.iface.verify(0, [1, 2, 3])), [None, 2])
+        # The devices advance their address counters independently.
+        self.assertEqual(self.lower.ops.count(("read_dr", self.iface.DR_ISDATA.bit_length())), 4)
+
+    def test_erase_failed(self):
+        iface = self.make_iface([0, 1], lambda length: [
+            DR_ISADDRESS(valid=1), DR_ISADDRESS(valid=0)])
+        with self.assertRaisesRegex(XC9500XLError, r"^bulk erase failed TAP #1: "):
+            self.run_iface(iface.bulk_erase())
+        self.assertEqual(self.lower.ops.count(("idle", 200_000)), 1)
+
+    def test_single_tap(self):
+        iface = self.make_iface([0], lambda length: [DR_ISADDRESS(valid=1, strobe=1)])
+        with self.assertRaisesRegex(XC9500XLError, r"^bulk erase failed valid=1 strobe=1 "):
+            self.run_iface(iface.bulk_erase())
+
+    def test_from_tap(self):
+        class MockJTAGProbe:
+            def __init__(self):
+                self.scans = []
+
+            async def write_ir(self, data, *, prefix, suffix, elide):
+                self.scans.append(("ir", data, prefix, suffix))
+
+            async def read_dr(self, length, *, prefix, suffix):
+                self.scans.append(("dr", length, prefix, suffix))
+                return bits(0, length)
+
+            async def run_test_idle(self, count):
+                pass
+
+        lower = MockJTAGProbe()
+        tap_iface = TAPInterface.from_layout(lower, [8, 8], index=1)
+        iface = XC95xxXLInterface(MultiTAPInterface.from_tap(tap_iface),
+                                  logging.getLogger(__name__), 0, self.device)
+        words, = self.run_iface(iface._fvfyi(0))
+        self.assertEqual(words, [])
+        self.assertEqual(lower.scans, [("ir", bits(IR_FVFYI), 8, 0)])
@@ -8,10 +8,55 @@ from ....support.bitstruct import *
 
 
 __all__ = [
+    "AP_CSW_addr", "AP_CSW", "AP_CSW_SIZE", "AP_CSW_ADDRINC",
+    "AP_TAR_addr", "AP_DRW_addr",
     "AP_IDR_addr", "AP_IDR", "AP_IDR_CLASS",
 ]
 
 
+# CSW MEM-AP register layout
+
+AP_CSW_addr = 0x00
+
+AP_CSW = bitstruct("AP_CSW", 32, [
+    ("Size",        3),
+    (None,          1),
+    ("AddrInc",     2),
+    ("DeviceEn",    1),
+    ("TrInProg",    1),
+    ("Mode",        4),
+    ("Type",        3),
+    ("MTE",         1),
+    (None,          7),
+    ("SPIDEN",      1),
+    ("Prot",        7),
+    ("DbgSwEnable", 1),
+])
+
+
+class AP_CSW_SIZE(IntEnum):
+    BYTE        = 0b000
+    HALFWORD    = 0b001
+    WORD        = 0b010
+    DOUBLEWORD  = 0b011
+
+
+class AP_CSW_ADDRINC(IntEnum):
+    OFF         = 0b00
+    SINGLE      = 0b01
+    PACKED      = 0b10
+
+
+# TAR MEM-AP register layout
+
+AP_TAR_addr = 0x04
+
+
+# DRW MEM-AP register layout
+
+AP_DRW_addr = 0x0C
+
+
 # IDR AP register layout
 
 AP_IDR_addr = 0xFC
@@ -16,7 +16,7 @@ __all__ = [
     "DR_IMPCODE", "DR_IMPCODE_EJTAGver_values",
     "DR_CONTROL",
     # DMSEG
-    "DMSEG_addr", "DMSEG_mask",
+    "DMSEG_addr", "DMSEG_mask", "DMSEG_FASTDATA_addr", "DMSEG_FASTDATA_size",
     "DRSEG_addr", "DMSEG_TRAP_addr", "DRSEG_DCR_addr", "DRSEG_IBS_addr", "DRSEG_IBAn_addr",
     "DRSEG_IBMn_addr", "DRSEG_IBASIDn_addr", "DRSEG_IBCn_addr", "DRSEG_IBCCn_addr",
     "DRSEG_IBPCn_addr", "DRSEG_DBS_addr", "DRSEG_DBAn_addr", "DRSEG_DBMn_addr",
@@ -104,6 +104,8 @@ DMSEG_addr          = 0xffff_ffff_ff20_0000
 DRSEG_addr          = 0xffff_ffff_ff30_0000
 DMSEG_mask          = 0xffff_ffff_ffe0_0000
 
+DMSEG_FASTDATA_addr = DMSEG_addr + 0x0000
+DMSEG_FASTDATA_size = 0x10
 DMSEG_TRAP_addr     = DMSEG_addr + 0x0200
 DRSEG_DCR_addr      = DRSEG_addr + 0x0000
 
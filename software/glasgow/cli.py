@@ -1,14 +1,18 @@
 import os
 import sys
 import ast
+import time
 import logging
 import argparse
 import textwrap
 import re
+import shlex
 import asyncio
 import signal
+import tempfile
 import unittest
-from vcd import VCDWriter
+import contextvars
+import concurrent.futures
 from datetime import datetime
 try:
     from ast import PyCF_ALLOW_TOP_LEVEL_AWAIT # Python 3.8+
@@ -24,8 +28,9 @@ from .support.asignal import *
 from .device import GlasgowDeviceError
 from .device.config import GlasgowConfig
 from .target.hardware import GlasgowHardwareTarget
+from .target.cache import GlasgowBitstreamCache
 from .gateware import GatewareBuildError
-from .gateware.analyzer import TraceDecoder
+from .gateware.analyzer import TraceDecoder, TraceEndDetector, TraceVCDWriter, TraceCaptureWriter
 from .device.hardware import VID_QIHW, PID_GLASGOW, GlasgowHardwareDevice
 from .access.direct import *
 from .applet import *
@@ -102,6 +107,72 @@ def create_argparser():
     return parser
 
 
+class LazySubParsersAction(argparse._SubParsersAction):
+    """
+    A subparsers action that allows deferring population of a subparser until it is selected.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._populators = {}
+
+    def add_parser(self, name, *, populate=None, **kwargs):
+        parser = super().add_parser(name, **kwargs)
+        if populate is not None:
+            self._populators[name] = populate
+        return parser
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        populate = self._populators.pop(values[0], None)
+        if populate is not None:
+            populate(self._name_parser_map[values[0]])
+        super().__call__(parser, namespace, values, option_string)
+
+
+class _DeferredFile(str):
+    """
+    The name of a file that is only opened once the command line has been parsed.
+    """
+
+
+class _DeferredFileType:
+    def __init__(self, file_type, action_name):
+        self.file_type   = file_type
+        self.action_name = action_name
+
+    def __call__(self, string):
+        deferred = _DeferredFile(string)
+        deferred.file_type   = self.file_type
+        deferred.action_name = self.action_name
+        return deferred
+
+
+def _defer_file_types(parser):
+    # Applet arguments are used for every device in gang mode, with `{serial}` replaced in each
+    # of them, so files must not be opened while the command line is being parsed.
+    for action in parser._actions:
+        if isinstance(action.type, argparse.FileType):
+            action.type = _DeferredFileType(action.type, argparse._get_action_name(action))
+        if isinstance(action, argparse._SubParsersAction):
+            for subparser in action.choices.values():
+                _defer_file_types(subparser)
+
+
+def _open_deferred_files(parser, args, serial=None):
+    def open_value(value):
+        if isinstance(value, list):
+            return [open_value(elem) for elem in value]
+        if isinstance(value, _DeferredFile):
+            filename = value if serial is None else value.replace("{serial}", serial)
+            try:
+                return value.file_type(filename)
+            except argparse.ArgumentTypeError as e:
+                parser.error("argument {}: {}".format(value.action_name, e))
+        if isinstance(value, str) and serial is not None:
+            return value.replace("{serial}", serial)
+        return value
+    return argparse.Namespace(**{name: open_value(value) for name, value in vars(args).items()})
+
+
 def get_argparser():
     def add_subparsers(parser, **kwargs):
         if isinstance(parser, argparse._MutuallyExclusiveGroup):
@@ -112,69 +183,80 @@ def get_argparser():
                 kwargs['prog'] = formatter.format_help().strip()
 
             parsers_class = parser._pop_action_class(kwargs, 'parsers')
-            subparsers = argparse._SubParsersAction(option_strings=[],
-                                                    parser_class=type(container),
-                                                    **kwargs)
+            subparsers = parsers_class(option_strings=[],
+                                       parser_class=type(container),
+                                       **kwargs)
             parser._add_action(subparsers)
         else:
             subparsers = parser.add_subparsers(**kwargs)
         return subparsers
 
     def add_applet_arg(parser, mode, required=False):
-        subparsers = add_subparsers(parser, dest="applet", metavar="APPLET", required=required)
+        subparsers = add_subparsers(parser, dest="applet", metavar="APPLET", required=required,
+                                    action=LazySubParsersAction)
 
-        for applet_name, applet in GlasgowApplet.all_applets.items():
-            if mode == "test" and not hasattr(applet, "test_cls"):
-                continue
-            if mode == "tool" and not hasattr(applet, "tool_cls"):
+        for applet_name, manifest in all.applets.items():
+            if mode == "tool" and manifest.tool_help is None:
                 continue
 
             if mode == "tool":
-                help        = applet.tool_cls.help
-                description = applet.tool_cls.description
+                help = manifest.tool_help
             else:
-                help        = applet.help
-                description = applet.description
-            if applet.preview:
+                help = manifest.help
+            if manifest.preview:
                 help += " (PREVIEW QUALITY APPLET)"
-                description = "    This applet is PREVIEW QUALITY and may CORRUPT DATA or " \
-                              "have missing features. Use at your own risk.\n" + description
-            if applet.required_revision > "A0":
-                help += " (rev{}+)".format(applet.required_revision)
-                description += "\n    This applet requires Glasgow rev{} or later." \
-                               .format(applet.required_revision)
-
-            p_applet = subparsers.add_parser(
-                applet_name, help=help, description=description,
-                formatter_class=TextHelpFormatter)
-
-            if mode == "test":
-                p_applet.add_argument(
-                    "tests", metavar="TEST", nargs="*",
-                    help="test cases to run")
-
-            if mode in ("build", "interact", "repl", "script"):
-                access_args = DirectArguments(applet_name=applet_name,
-                                              default_port="AB",
-                                              pin_count=16)
-                if mode in ("interact", "repl", "script"):
-                    g_applet_build = p_applet.add_argument_group("build arguments")
-                    applet.add_build_arguments(g_applet_build, access_args)
-                    g_applet_run = p_applet.add_argument_group("run arguments")
-                    applet.add_run_arguments(g_applet_run, access_args)
-                    if mode == "interact":
-                        # FIXME: this makes it impossible to add subparsers in applets
-                        # g_applet_interact = p_applet.add_argument_group("interact arguments")
-                        # applet.add_interact_arguments(g_applet_interact)
-                        applet.add_interact_arguments(p_applet)
-                    if mode == "repl":
-                        # FIXME: same as above
-                        applet.add_repl_arguments(p_applet)
-                if mode == "build":
-                    applet.add_build_arguments(p_applet, access_args)
+            if manifest.required_revision > "A0":
+                help += " (rev{}+)".format(manifest.required_revision)
 
-            if mode == "tool":
-                applet.tool_cls.add_arguments(p_applet)
+            # Importing an applet is slow, so only do it once the applet is selected.
+            def populate(p_applet, applet_name=applet_name, manifest=manifest):
+                applet = manifest.load()
+
+                if mode == "tool":
+                    description = applet.tool_cls.description
+                else:
+                    description = applet.description
+                if applet.preview:
+                    description = "    This applet is PREVIEW QUALITY and may CORRUPT DATA or " \
+                                  "have missing features. Use at your own risk.\n" + description
+                if applet.required_revision > "A0":
+                    description += "\n    This applet requires Glasgow rev{} or later." \
+                                   .format(applet.required_revision)
+                p_applet.description = description
+
+                if mode == "test":
+                    p_applet.add_argument(
+                        "tests", metavar="TEST", nargs="*",
+                        help="test cases to run")
+
+                if mode in ("build", "interact", "repl", "script"):
+                    access_args = DirectArguments(applet_name=applet_name,
+                                                  default_port="AB",
+                                                  pin_count=16)
+                    if mode in ("interact", "repl", "script"):
+                        g_applet_build = p_applet.add_argument_group("build arguments")
+                        applet.add_build_arguments(g_applet_build, access_args)
+                        g_applet_run = p_applet.add_argument_group("run arguments")
+                        applet.add_run_arguments(g_applet_run, access_args)
+                        if mode == "interact":
+                            # FIXME: this makes it impossible to add subparsers in applets
+                            # g_applet_interact = p_applet.add_argument_group("interact arguments")
+                            # applet.add_interact_arguments(g_applet_interact)
+                            applet.add_interact_arguments(p_applet)
+                        if mode == "repl":
+                            # FIXME: same as above
+                            applet.add_repl_arguments(p_applet)
+                    if mode == "build":
+                        applet.add_build_arguments(p_applet, access_args)
+
+                if mode == "tool":
+                    applet.tool_cls.add_arguments(p_applet)
+
+                _defer_file_types(p_applet)
+
+            subparsers.add_parser(
+                applet_name, help=help, formatter_class=TextHelpFormatter,
+                populate=populate)
 
     parser = create_argparser()
 
@@ -238,6 +320,14 @@ def get_argparser():
             "--override-required-revision", default=False, action="store_true",
             help="(advanced) override applet revision requirement")
 
+        g_build_cache = parser.add_mutually_exclusive_group()
+        g_build_cache.add_argument(
+            "--cache", dest="use_cache", default=True, action="store_true",
+            help="reuse previously built bitstreams from the bitstream cache (default)")
+        g_build_cache.add_argument(
+            "--no-cache", dest="use_cache", action="store_false",
+            help="always build bitstreams from scratch, bypassing the bitstream cache")
+
     def add_run_args(parser):
         add_build_args(parser)
 
@@ -253,14 +343,27 @@ def get_argparser():
             type=argparse.FileType("rb"),
             help="(advanced) load prebuilt applet bitstream from BITSTREAM-FILE")
 
-        parser.add_argument(
+        g_run_trace = parser.add_mutually_exclusive_group()
+        g_run_trace.add_argument(
             "--trace", metavar="VCD-FILE", type=argparse.FileType("wt"),
             help="trace applet I/O to VCD-FILE")
+        g_run_trace.add_argument(
+            "--trace-raw", metavar="CAPTURE-FILE", type=argparse.FileType("wb"),
+            help="save undecoded applet I/O trace to CAPTURE-FILE; convert it to VCD later "
+                 "using `glasgow tool analyzer convert`")
 
     p_run = subparsers.add_parser(
         "run", formatter_class=TextHelpFormatter,
         help="run an applet and interact through its command-line interface")
     add_run_args(p_run)
+    p_run.add_argument(
+        "--gang", default=False, action="store_true",
+        help="run the applet on several devices at once: every connected device, or those "
+             "given with --gang-serial; '{serial}' in applet arguments is replaced with "
+             "the serial number of each device")
+    p_run.add_argument(
+        "--gang-serial", metavar="SERIAL", dest="gang_serials", type=serial, action="append",
+        help="with --gang, use device with serial number SERIAL (may be specified several times)")
     add_applet_arg(p_run, mode="interact", required=True)
 
     p_repl = subparsers.add_parser(
@@ -315,8 +418,8 @@ def get_argparser():
     add_build_args(p_build)
 
     p_build.add_argument(
-        "--rev", metavar="REVISION", type=revision, required=True,
-        help="board revision")
+        "--rev", metavar="REVISION", dest="revs", type=revision, action="append", required=True,
+        help="board revision (may be specified several times with --matrix)")
     p_build.add_argument(
         "--trace", default=False, action="store_true",
         help="include applet analyzer")
@@ -327,7 +430,16 @@ def get_argparser():
     p_build.add_argument(
         "-f", "--filename", metavar="FILENAME", type=str,
         help="file to save artifact to (default: <applet-name>.{zip,il,bin})")
-    add_applet_arg(p_build, mode="build", required=True)
+    p_build.add_argument(
+        "--matrix", metavar="MATRIX-FILE", type=argparse.FileType("r"),
+        help="build bitstreams for every applet invocation listed in MATRIX-FILE (one per line, "
+             "e.g. 'uart --pin-tx 0 --pin-rx 1') and every board revision; "
+             "save them to the bitstream cache, and to the directory FILENAME if specified")
+    p_build.add_argument(
+        "-j", "--jobs", metavar="JOBS", type=int, default=None,
+        help="with --matrix, run up to JOBS toolchain processes at once "
+             "(default: number of CPUs)")
+    add_applet_arg(p_build, mode="build")
 
     p_test = subparsers.add_parser(
         "test", formatter_class=TextHelpFormatter,
@@ -363,10 +475,12 @@ def get_argparser():
 
 # The name of this function appears in Verilog output, so keep it tidy.
 def _applet(revision, args):
+    with_analyzer = (hasattr(args, "trace") and bool(args.trace) or
+                     hasattr(args, "trace_raw") and bool(args.trace_raw))
     target = GlasgowHardwareTarget(revision=revision,
                                    multiplexer_cls=DirectMultiplexer,
-                                   with_analyzer=hasattr(args, "trace") and args.trace)
-    applet = GlasgowApplet.all_applets[args.applet]()
+                                   with_analyzer=with_analyzer)
+    applet = all.applets[args.applet].load()()
     try:
         message = ("applet requires device rev{}+, rev{} found"
                    .format(applet.required_revision, revision))
@@ -383,6 +497,119 @@ def _applet(revision, args):
     return target, applet
 
 
+def _bitstream_cache(args):
+    if args.use_cache:
+        return GlasgowBitstreamCache()
+    else:
+        return None
+
+
+def _parse_build_matrix(parser, args):
+    # Elaborate every applet invocation first, so that invocations that result in identical
+    # bitstreams (e.g. the same applet on revA0 and revB0) are only built once.
+    plans = {}
+    invocations = []
+    with args.matrix:
+        for line_no, line in enumerate(args.matrix, start=1):
+            invocation = shlex.split(line, comments=True)
+            if not invocation:
+                continue
+            for revision in args.revs:
+                inv_args = parser.parse_args(["build", "--rev", revision, *invocation])
+                inv_args = _open_deferred_files(parser, inv_args)
+                if inv_args.applet is None or inv_args.matrix is not None:
+                    parser.error("{}:{}: expected an applet invocation"
+                                 .format(args.matrix.name, line_no))
+                inv_args.override_required_revision = args.override_required_revision
+                target, applet = _applet(revision, inv_args)
+                plan = target.build_plan()
+                plans[plan.bitstream_id] = plan
+                invocations.append((revision, " ".join(invocation), plan.bitstream_id))
+    return plans, invocations
+
+
+def _execute_matrix_plan(plan):
+    # Runs in a worker process. The toolchain writes its log straight to the inherited file
+    # descriptors, where the output of concurrent builds would be interleaved; capture it instead,
+    # and return it if the build fails.
+    with tempfile.TemporaryFile() as log:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved_fds = os.dup(1), os.dup(2)
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            return plan.execute(), None
+        except Exception as e:
+            error = e
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            for fd, saved_fd in zip((1, 2), saved_fds):
+                os.dup2(saved_fd, fd)
+                os.close(saved_fd)
+        log.seek(0)
+        return None, "{}\n{}".format(error, log.read().decode("utf-8", errors="replace"))
+
+
+async def _build_matrix(parser, args):
+    cache = _bitstream_cache(args)
+    if cache is None and args.filename is None:
+        parser.error("--matrix with --no-cache requires an output directory (-f)")
+
+    plans, invocations = _parse_build_matrix(parser, args)
+    logger.info("%d applet invocations require %d unique bitstreams",
+                len(invocations), len(plans))
+
+    bitstreams = {}
+    pending = []
+    for bitstream_id, plan in plans.items():
+        bitstream = None if cache is None else cache.get(bitstream_id)
+        if bitstream is None:
+            pending.append(plan)
+        else:
+            logger.info("using cached bitstream ID %s", bitstream_id.hex())
+            bitstreams[bitstream_id] = bitstream
+
+    loop = asyncio.get_event_loop()
+    failed = False
+    # Each build changes the working directory, so builds have to run in separate processes.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        async def build(plan):
+            return plan, await loop.run_in_executor(pool, _execute_matrix_plan, plan)
+
+        for index, future in enumerate(asyncio.as_completed([build(plan) for plan in pending])):
+            plan, (bitstream, build_log) = await future
+            if bitstream is None:
+                logger.error("failed to build bitstream ID %s", plan.bitstream_id.hex())
+                for revision, invocation, bitstream_id in invocations:
+                    if bitstream_id == plan.bitstream_id:
+                        logger.error("required by rev%s: %s", revision, invocation)
+                logger.error("build log:\n%s", build_log.rstrip())
+                failed = True
+                continue
+            logger.info("built bitstream ID %s (%d/%d)",
+                        plan.bitstream_id.hex(), index + 1, len(pending))
+            if cache is not None:
+                cache.put(plan.bitstream_id, bitstream)
+            bitstreams[plan.bitstream_id] = bitstream
+
+    if args.filename is not None:
+        os.makedirs(args.filename, exist_ok=True)
+        for bitstream_id, bitstream in bitstreams.items():
+            with open(os.path.join(args.filename, bitstream_id.hex() + ".bin"), "wb") as f:
+                f.write(bitstream_id)
+                f.write(bitstream)
+
+    for revision, invocation, bitstream_id in invocations:
+        if bitstream_id in bitstreams:
+            print("rev{}\t{}\t{}".format(revision, bitstream_id.hex(), invocation))
+        else:
+            print("rev{}\t{}\t{}".format(revision, "(failed)", invocation))
+
+    return 1 if failed else 0
+
+
 class TerminalFormatter(logging.Formatter):
     DEFAULT_COLORS = {
         "TRACE"   : "\033[0m",
@@ -457,8 +684,154 @@ def create_logger(args):
         root_logger.setLevel(level)
 
 
+_gang_serial = contextvars.ContextVar("_gang_serial", default=None)
+
+
+def _gang_record_factory(factory):
+    # Tag every message logged by the task running the applet on a particular device with
+    # the serial number of that device.
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        serial = _gang_serial.get()
+        if serial is not None:
+            record.name = "{}[{}]".format(record.name, serial)
+        return record
+    return record_factory
+
+
+async def _run_gang(parser, args):
+    if args.trace or args.trace_raw:
+        parser.error("--gang cannot be used with --trace or --trace-raw")
+    if args.serial is not None:
+        parser.error("--gang cannot be used with --serial; use --gang-serial")
+
+    devices = GlasgowHardwareDevice.open_many(args.gang_serials)
+    try:
+        logger.info("running applet %r on %d devices", args.applet, len(devices))
+        logging.setLogRecordFactory(_gang_record_factory(logging.getLogRecordFactory()))
+        if all.applets[args.applet].preview:
+            logger.warn("applet %r is PREVIEW QUALITY and may CORRUPT DATA", args.applet)
+
+        # Every device gets its own applet instance, with its own arguments and file objects
+        # (and its own output files, if `{serial}` is used in their names). Only the build plan
+        # is shared, so the bitstream is built (or retrieved from the cache) once per revision.
+        applets = {}
+        plans = {}
+        for serial, device in devices.items():
+            device_args = _open_deferred_files(parser, args, serial)
+            target, applet = _applet(device.revision, device_args)
+            applets[serial] = target, applet, device_args
+            if device.revision not in plans:
+                plans[device.revision] = target.build_plan()
+
+        prebuilt_id = prebuilt = None
+        if args.prebuilt or args.bitstream:
+            bitstream_file = args.bitstream or open("{}.bin".format(args.applet), "rb")
+            with bitstream_file:
+                prebuilt_id, prebuilt = bitstream_file.read(16), bitstream_file.read()
+
+        started = time.perf_counter()
+        for revision, plan in plans.items():
+            rev_devices = [device for device in devices.values() if device.revision == revision]
+            bitstream_ids = await asyncio.gather(*(device.bitstream_id()
+                                                   for device in rev_devices))
+            stale_devices = [device for device, bitstream_id in zip(rev_devices, bitstream_ids)
+                             if bitstream_id != plan.bitstream_id or args.rebuild or
+                                prebuilt_id == b"\xff" * 16]
+            if not stale_devices:
+                logger.info("rev%s devices already have bitstream ID %s",
+                            revision, plan.bitstream_id.hex())
+                continue
+
+            try:
+                if prebuilt is not None:
+                    if prebuilt_id not in (plan.bitstream_id, b"\xff" * 16):
+                        logger.warn("prebuilt bitstream ID %s does not match design bitstream "
+                                    "ID %s", prebuilt_id.hex(), plan.bitstream_id.hex())
+                    bitstream = prebuilt
+                else:
+                    cache = _bitstream_cache(args)
+                    if args.rebuild and cache is not None:
+                        cache.discard(plan.bitstream_id)
+                    logger.info("building bitstream ID %s", plan.bitstream_id.hex())
+                    bitstream = plan.execute(cache=cache)
+            except GatewareBuildError as e:
+                logger.error(e)
+                return 1
+
+            logger.info("downloading bitstream ID %s to %d rev%s devices",
+                        plan.bitstream_id.hex(), len(stale_devices), revision)
+            await asyncio.gather(*(device.download_bitstream(bitstream, plan.bitstream_id)
+                                   for device in stale_devices))
+        logger.info("devices ready in %.3f s", time.perf_counter() - started)
+
+        async def run_applet(serial, device):
+            _gang_serial.set(serial)
+            target, applet, device_args = applets[serial]
+            device.demultiplexer = DirectDemultiplexer(device, target.multiplexer.pipe_count)
+            started = time.perf_counter()
+            error = None
+            try:
+                iface = await applet.run(device, device_args)
+                await applet.interact(device, device_args, iface)
+            except GlasgowAppletError as e:
+                applet.logger.error(str(e))
+                error = str(e)
+            except GlasgowDeviceError as e:
+                logger.error(e)
+                error = str(e)
+            except asyncio.CancelledError:
+                error = "cancelled"
+            finally:
+                await device.demultiplexer.flush()
+                if args.show_statistics:
+                    device.demultiplexer.statistics()
+                await device.demultiplexer.cancel()
+            return error, time.perf_counter() - started
+
+        tasks = {serial: asyncio.ensure_future(run_applet(serial, device))
+                 for serial, device in devices.items()}
+        all_done = asyncio.ensure_future(asyncio.wait(tasks.values()))
+        sigint = asyncio.ensure_future(wait_for_signal(signal.SIGINT))
+        await asyncio.wait([all_done, sigint], return_when=asyncio.FIRST_COMPLETED)
+        if not all_done.done():
+            logger.debug("Ctrl+C pressed, terminating")
+            for task in tasks.values():
+                task.cancel()
+            await all_done
+        sigint.cancel()
+
+        failed = 0
+        for serial, task in tasks.items():
+            if task.cancelled():
+                error, elapsed = "cancelled", None
+            elif task.exception() is not None:
+                exception = task.exception()
+                logger.error("applet failed on device %s", serial,
+                             exc_info=(type(exception), exception, exception.__traceback__))
+                error, elapsed = "{}: {}".format(type(exception).__name__, exception), None
+            else:
+                error, elapsed = task.result()
+            result = "ok" if error is None else "FAILED ({})".format(error)
+            if elapsed is not None:
+                result += " in {:.3f} s".format(elapsed)
+            if error is None:
+                logger.info("device %s (rev%s): %s", serial, devices[serial].revision, result)
+            else:
+                logger.error("device %s (rev%s): %s", serial, devices[serial].revision, result)
+                failed += 1
+        logger.info("%d of %d devices succeeded in %.3f s",
+                    len(devices) - failed, len(devices), time.perf_counter() - started)
+        return 1 if failed else 0
+
+    finally:
+        for device in devices.values():
+            device.close()
+
+
 async def _main():
-    args = get_argparser().parse_args()
+    parser = get_argparser()
+    args = parser.parse_args()
     create_logger(args)
 
     if sys.version_info < (3, 8) and os.name == "nt":
@@ -466,6 +839,10 @@ async def _main():
 
     device = None
     try:
+        if args.action == "run" and args.gang:
+            return await _run_gang(parser, args)
+        args = _open_deferred_files(parser, args)
+
         if args.action not in ("build", "test", "tool", "factory", "list"):
             device = GlasgowHardwareDevice(args.serial)
 
@@ -523,74 +900,45 @@ async def _main():
                 with bitstream_file:
                     await device.download_prebuilt(plan, bitstream_file)
             else:
-                await device.download_target(plan, rebuild=args.rebuild)
+                await device.download_target(plan, rebuild=args.rebuild,
+                                             cache=_bitstream_cache(args))
 
-            do_trace = hasattr(args, "trace") and args.trace
+            do_trace = hasattr(args, "trace") and (args.trace or args.trace_raw)
             if do_trace:
                 logger.info("starting applet analyzer")
                 await device.write_register(target.analyzer.addr_done, 0)
                 analyzer_iface = await device.demultiplexer.claim_interface(
                     target.analyzer, target.analyzer.mux_interface, args=None)
-                trace_decoder = TraceDecoder(target.analyzer.event_sources)
-                # Use the coarsest possible timescale to improve performance with sigrok.
-                vcd_writer = VCDWriter(args.trace, timescale="10 ns", check_values=False,
-                    comment='Generated by Glasgow for bitstream ID %s'
-                            % plan.bitstream_id.hex())
 
             async def run_analyzer():
-                signals = {}
-                strobes = set()
-                for field_name, field_trigger, field_width in trace_decoder.events():
-                    if field_trigger == "throttle":
-                        var_type = "wire"
-                        var_init = 0
-                    elif field_trigger == "change":
-                        var_type = "wire"
-                        var_init = "x" * field_width
-                    elif field_trigger == "strobe":
-                        if field_width > 0:
-                            var_type = "tri"
-                            var_init = "z"
-                        else:
-                            var_type = "event"
-                            var_init = ""
-                    else:
-                        assert False
-                    signals[field_name] = vcd_writer.register_var(
-                        scope="", name=field_name, var_type=var_type,
-                        size=field_width, init=var_init)
-                    if field_trigger == "strobe":
-                        strobes.add(field_name)
-
-                init = True
+                trace_decoder = TraceDecoder(target.analyzer.event_sources)
+                vcd_writer = TraceVCDWriter(args.trace, trace_decoder, target.sys_clk_freq,
+                    comment="Generated by Glasgow for bitstream ID %s"
+                            % plan.bitstream_id.hex())
                 while not trace_decoder.is_done():
                     trace_decoder.process(await analyzer_iface.read())
-                    for cycle, events in trace_decoder.flush():
-                        if events == "overrun":
-                            target.analyzer.logger.error("FIFO overrun, shutting down")
-
-                            for name in signals:
-                                vcd_writer.change(signals[name], next_timestamp, "x")
-                            next_timestamp += 100 # 1us
-                            break
-
-                        event_repr = " ".join("{}={}".format(n, v)
-                                              for n, v in events.items())
-                        target.analyzer.logger.trace("cycle %d: %s", cycle, event_repr)
-
-                        timestamp      = int(1e8 * (cycle + 0) // target.sys_clk_freq)
-                        next_timestamp = int(1e8 * (cycle + 1) // target.sys_clk_freq)
-                        if init:
-                            init = False
-                            vcd_writer._timestamp = timestamp
-                        for name, value in events.items():
-                            vcd_writer.change(signals[name], timestamp, value)
-                        for name, _value in events.items():
-                            if name in strobes:
-                                vcd_writer.change(signals[name], next_timestamp, "z")
-                        vcd_writer.flush()
-
-                vcd_writer.close(next_timestamp)
+                    columns = trace_decoder.flush_columns()
+                    if target.analyzer.logger.isEnabledFor(logging.TRACE):
+                        for cycle, events in columns.timeline():
+                            if events == "overrun":
+                                break
+                            event_repr = " ".join("{}={}".format(n, v)
+                                                  for n, v in events.items())
+                            target.analyzer.logger.trace("cycle %d: %s", cycle, event_repr)
+                    if vcd_writer.write(columns):
+                        target.analyzer.logger.error("FIFO overrun, shutting down")
+                        break
+                vcd_writer.close()
+
+            async def run_analyzer_raw():
+                capture = TraceCaptureWriter(args.trace_raw, target.analyzer.event_sources,
+                                             target.sys_clk_freq, plan.bitstream_id)
+                end_detector = TraceEndDetector(target.analyzer.event_sources)
+                while not end_detector.is_done():
+                    data = await analyzer_iface.read()
+                    end_detector.process(data)
+                    capture.write(data)
+                capture.flush()
 
             async def run_applet():
                 logger.info("running handler for applet %r", args.applet)
@@ -627,7 +975,10 @@ async def _main():
                 logger.debug("Ctrl+C pressed, terminating")
 
             if do_trace:
-                analyzer_task = asyncio.ensure_future(run_analyzer())
+                if args.trace_raw:
+                    analyzer_task = asyncio.ensure_future(run_analyzer_raw())
+                else:
+                    analyzer_task = asyncio.ensure_future(run_analyzer())
 
             tasks = []
             tasks.append(asyncio.ensure_future(run_applet()))
@@ -650,7 +1001,7 @@ async def _main():
                     task.result()
 
         if args.action == "tool":
-            tool = GlasgowApplet.all_applets[args.applet].tool_cls()
+            tool = all.applets[args.applet].load().tool_cls()
             try:
                 await tool.run(args)
             except GlasgowAppletError as e:
@@ -698,7 +1049,7 @@ async def _main():
                 target, applet = _applet(device.revision, args)
                 plan = target.build_plan()
                 new_bitstream_id = plan.bitstream_id
-                new_bitstream    = plan.execute()
+                new_bitstream    = plan.execute(cache=_bitstream_cache(args))
 
                 # We always build and reflash the bitstream in case the one currently
                 # in EEPROM is corrupted. If we only compared the ID, there would be
@@ -757,7 +1108,18 @@ async def _main():
                 logger.info("configuration and firmware identical")
 
         if args.action == "build":
-            target, applet = _applet(args.rev, args)
+            if args.matrix is not None:
+                if args.applet is not None:
+                    parser.error("an applet cannot be specified together with --matrix")
+                if args.type not in ("bin", "bitstream"):
+                    parser.error("only bitstreams can be built with --matrix")
+                return await _build_matrix(parser, args)
+            if args.applet is None:
+                parser.error("an applet or --matrix must be specified")
+            if len(args.revs) > 1:
+                parser.error("several board revisions can only be specified with --matrix")
+
+            target, applet = _applet(args.revs[0], args)
             plan = target.build_plan()
             if args.type in ("il", "rtlil"):
                 logger.info("building RTLIL for applet %r", args.applet)
@@ -770,11 +1132,11 @@ async def _main():
                 logger.info("building bitstream for applet %r", args.applet)
                 with open(args.filename or args.applet + ".bin", "wb") as f:
                     f.write(plan.bitstream_id)
-                    f.write(plan.execute())
+                    f.write(plan.execute(cache=_bitstream_cache(args)))
 
         if args.action == "test":
             logger.info("testing applet %r", args.applet)
-            applet = GlasgowApplet.all_applets[args.applet]()
+            applet = all.applets[args.applet].load()()
             loader = unittest.TestLoader()
             stream = unittest.runner._WritelnDecorator(sys.stderr)
             result = unittest.TextTestResult(stream=stream, descriptions=True, verbosity=2)
@@ -859,3 +1221,108 @@ def main():
 
 if __name__ == "__main__":
     main()
+
+# -------------------------------------------------------------------------------------------------
+
+import io
+import contextlib
+
+
+class BuildMatrixTestCase(unittest.TestCase):
+    def setUp(self):
+        self.parser = get_argparser()
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def parse_matrix(self, contents, revs):
+        filename = os.path.join(self.temp_dir.name, "matrix.txt")
+        with open(filename, "w") as f:
+            f.write(contents)
+        args = self.parser.parse_args(["build", "--matrix", filename,
+                                       *(arg for rev in revs for arg in ("--rev", rev))])
+        args.override_required_revision = False
+        return _parse_build_matrix(self.parser, args)
+
+    def test_parse(self):
+        plans, invocations = self.parse_matrix(
+            "# comment\n"
+            "\n"
+            "selftest\n"
+            "uart --pin-tx 0 --pin-rx '1'  # trailing comment\n",
+            revs=["C0", "C1"])
+        self.assertEqual([(revision, invocation) for revision, invocation, _ in invocations], [
+            ("C0", "selftest"),
+            ("C1", "selftest"),
+            ("C0", "uart --pin-tx 0 --pin-rx 1"),
+            ("C1", "uart --pin-tx 0 --pin-rx 1"),
+        ])
+        bitstream_ids = {bitstream_id for _, _, bitstream_id in invocations}
+        self.assertEqual(set(plans), bitstream_ids)
+
+    def test_parse_deduplicate(self):
+        plans, invocations = self.parse_matrix("selftest\nselftest\n", revs=["C0"])
+        self.assertEqual(len(invocations), 2)
+        self.assertEqual(len(plans), 1)
+
+    def test_parse_not_applet(self):
+        with self.assertRaises(SystemExit):
+            self.parse_matrix("--trace\n", revs=["C0"])
+
+    def test_execute_failed(self):
+        class FailingPlan:
+            def execute(self):
+                os.write(1, b"Error: no placement found\n")
+                raise GatewareBuildError("toolchain failed")
+
+        bitstream, build_log = _execute_matrix_plan(FailingPlan())
+        self.assertIsNone(bitstream)
+        self.assertIn("toolchain failed", build_log)
+        self.assertIn("Error: no placement found", build_log)
+
+    def test_execute_succeeded(self):
+        class Plan:
+            def execute(self):
+                return b"bitstream"
+
+        self.assertEqual(_execute_matrix_plan(Plan()), (b"bitstream", None))
+
+
+class DeferredFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.parser = get_argparser()
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_gang_serial(self):
+        filename = os.path.join(self.temp_dir.name, "capture-{serial}.bin")
+        args = self.parser.parse_args(["run", "--gang", "analyzer", "-V", "3.3", filename])
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+        for serial in ("C3-1", "C3-2"):
+            device_args = _open_deferred_files(self.parser, args, serial)
+            with device_args.file:
+                self.assertEqual(device_args.file.name,
+                                 os.path.join(self.temp_dir.name, "capture-{}.bin".format(serial)))
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)),
+                         ["capture-C3-1.bin", "capture-C3-2.bin"])
+        self.assertEqual(args.file, filename)
+
+    def test_open(self):
+        filename = os.path.join(self.temp_dir.name, "capture.bin")
+        args = _open_deferred_files(self.parser,
+            self.parser.parse_args(["run", "analyzer", "-V", "3.3", filename]))
+        with args.file:
+            self.assertEqual(args.file.name, filename)
+            self.assertEqual(args.file.mode, "wb")
+
+    def test_open_error(self):
+        filename = os.path.join(self.temp_dir.name, "missing", "capture.bin")
+        args = self.parser.parse_args(["run", "analyzer", "-V", "3.3", filename])
+        stderr = io.StringIO()
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(stderr):
+            _open_deferred_files(self.parser, args)
+        self.assertIn("argument FILE: can't open", stderr.getvalue())
+
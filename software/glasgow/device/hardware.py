@@ -47,14 +47,56 @@ IO_BUF_B         = 1<<1
 
 
 class _PollerThread(threading.Thread):
+    """
+    Handles libusb events for every device opened within ``context``.
+
+    Transfer callbacks are collected while libusb dispatches events and are handed over to
+    the event loop in one batch per iteration, so that the event loop wakes up once for all
+    transfers that completed together, however many devices share the context.
+    """
     def __init__(self, context):
         super().__init__()
         self.done    = False
         self.context = context
+        self._users  = 0
+        self._lock   = threading.Lock()
+        self._ready  = []
+
+    def acquire(self):
+        with self._lock:
+            self._users += 1
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+        self.done = True
+        self.context.close()
+
+    def call_soon(self, loop, callback, *args):
+        if threading.current_thread() is not self:
+            # Events are occasionally handled by other threads, e.g. during synchronous
+            # transfers; those callbacks cannot wait for the end of this iteration.
+            loop.call_soon_threadsafe(callback, *args)
+        else:
+            self._ready.append((loop, callback, args))
+
+    @staticmethod
+    def _run_batch(batch):
+        for callback, args in batch:
+            callback(*args)
 
     def run(self):
         while not self.done:
             self.context.handleEvents()
+            if self._ready:
+                batches = {}
+                for loop, callback, args in self._ready:
+                    batches.setdefault(loop, []).append((callback, args))
+                self._ready = []
+                for loop, batch in batches.items():
+                    loop.call_soon_threadsafe(self._run_batch, batch)
 
 
 class GlasgowHardwareDevice:
@@ -174,6 +216,48 @@ class GlasgowHardwareDevice:
             devices = cls._enumerate_devices(usb_context)
             return list(devices.keys())
 
+    @classmethod
+    def open_many(cls, serials=None):
+        """
+        Open the devices with serial numbers ``serials``, or every connected device if
+        ``serials`` is ``None``, and return a dict mapping serial numbers to devices.
+
+        All of the devices share a single libusb context and a single thread handling its
+        events, which is much cheaper than opening each device separately when many of them
+        are used at once.
+        """
+        usb_context = usb1.USBContext()
+        try:
+            devices = cls._enumerate_devices(usb_context)
+            if serials is None:
+                serials = sorted(devices)
+            if len(serials) == 0:
+                raise GlasgowDeviceError("device not found")
+            for serial in serials:
+                if serial not in devices:
+                    raise GlasgowDeviceError("device with serial number {} not found"
+                                             .format(serial))
+        except:
+            usb_context.close()
+            raise
+
+        usb_poller = _PollerThread(usb_context)
+        usb_poller.acquire() # keep the context open while the devices are being opened
+        opened = {}
+        try:
+            for serial in serials:
+                device = cls.__new__(cls)
+                device._open(usb_context, usb_poller, *devices[serial])
+                opened[serial] = device
+        except:
+            for device in opened.values():
+                device.close()
+            usb_poller.release()
+            raise
+        usb_poller.start()
+        usb_poller.release()
+        return opened
+
     def __init__(self, serial=None, *, _factory_rev=None):
         usb_context = usb1.USBContext()
         devices = self._enumerate_devices(usb_context, _factory_rev)
@@ -185,26 +269,33 @@ class GlasgowHardwareDevice:
                 raise GlasgowDeviceError("found {} devices (serial numbers {}), but a serial "
                                          "number is not specified"
                                          .format(len(devices), ", ".join(devices.keys())))
-            self.revision, usb_device = next(iter(devices.values()))
+            revision, usb_device = next(iter(devices.values()))
         else:
             if serial not in devices:
                 raise GlasgowDeviceError("device with serial number {} not found"
                                          .format(serial))
-            self.revision, usb_device = devices[serial]
+            revision, usb_device = devices[serial]
 
+        usb_poller = _PollerThread(usb_context)
+        self._open(usb_context, usb_poller, revision, usb_device)
+        usb_poller.start()
+
+    def _open(self, usb_context, usb_poller, revision, usb_device):
+        self.revision    = revision
         self.usb_context = usb_context
-        self.usb_poller = _PollerThread(self.usb_context)
-        self.usb_poller.start()
-        self.usb_handle = usb_device.open()
+        self.usb_poller  = usb_poller
+        self.usb_handle  = usb_device.open()
+        self.usb_poller.acquire()
+        self._closed     = False
         try:
             self.usb_handle.setAutoDetachKernelDriver(True)
         except usb1.USBErrorNotSupported:
             pass
 
     def close(self):
-        self.usb_poller.done = True
+        self._closed = True
         self.usb_handle.close()
-        self.usb_context.close()
+        self.usb_poller.release()
 
     async def _do_transfer(self, is_read, setup):
         # libusb transfer cancellation is asynchronous, and moreover, it is necessary to wait for
@@ -217,7 +308,7 @@ class GlasgowHardwareDevice:
         setup(transfer)
 
         def usb_callback(transfer):
-            if self.usb_poller.done:
+            if self._closed:
                 return # shutting down
             if transfer.isSubmitted():
                 return # transfer not completed
@@ -253,7 +344,8 @@ class GlasgowHardwareDevice:
                     "transfer error: {}".format(usb1.libusb1.libusb_transfer_status(status))))
 
         loop = asyncio.get_event_loop()
-        transfer.setCallback(lambda transfer: loop.call_soon_threadsafe(usb_callback, transfer))
+        transfer.setCallback(lambda transfer:
+            self.usb_poller.call_soon(loop, usb_callback, transfer))
         transfer.submit()
         try:
             return await result_future
@@ -419,12 +511,14 @@ class GlasgowHardwareDevice:
         except usb1.USBErrorPipe:
             raise GlasgowDeviceError("FPGA configuration failed")
 
-    async def download_target(self, plan, *, rebuild=False):
+    async def download_target(self, plan, *, rebuild=False, cache=None):
         if await self.bitstream_id() == plan.bitstream_id and not rebuild:
             logger.info("device already has bitstream ID %s", plan.bitstream_id.hex())
             return
+        if rebuild and cache is not None:
+            cache.discard(plan.bitstream_id)
         logger.info("building bitstream ID %s", plan.bitstream_id.hex())
-        await self.download_bitstream(plan.execute(), plan.bitstream_id)
+        await self.download_bitstream(plan.execute(cache=cache), plan.bitstream_id)
 
     async def download_prebuilt(self, plan, bitstream_file):
         bitstream_file_id = bitstream_file.read(16)
@@ -612,3 +706,66 @@ class GlasgowHardwareDevice:
             await self.control_write(usb1.REQUEST_TYPE_VENDOR, REQ_REGISTER, addr, 0, value)
         except usb1.USBErrorPipe:
             await self._register_error(addr)
+
+# -------------------------------------------------------------------------------------------------
+
+import unittest
+
+
+class PollerThreadTestCase(unittest.TestCase):
+    class MockContext:
+        def __init__(self):
+            self.closed = False
+            self.events = []
+
+        def handleEvents(self):
+            if self.events:
+                self.events.pop(0)()
+
+        def close(self):
+            self.closed = True
+
+    class MockLoop:
+        def __init__(self):
+            self.calls = []
+
+        def call_soon_threadsafe(self, callback, *args):
+            self.calls.append((callback, args))
+
+    def setUp(self):
+        self.context = self.MockContext()
+        self.poller  = _PollerThread(self.context)
+
+    def test_acquire_release(self):
+        self.poller.acquire()
+        self.poller.acquire()
+        self.poller.release()
+        self.assertFalse(self.poller.done)
+        self.assertFalse(self.context.closed)
+        self.poller.release()
+        self.assertTrue(self.poller.done)
+        self.assertTrue(self.context.closed)
+
+    def test_call_soon_batch(self):
+        loop_a, loop_b = self.MockLoop(), self.MockLoop()
+        results = []
+        def events():
+            self.poller.call_soon(loop_a, results.append, 1)
+            self.poller.call_soon(loop_b, results.append, 2)
+            self.poller.call_soon(loop_a, results.append, 3)
+            self.poller.done = True
+        self.context.events.append(events)
+        self.poller.start()
+        self.poller.join()
+        # One wakeup per event loop, regardless of how many transfers have completed.
+        self.assertEqual(len(loop_a.calls), 1)
+        self.assertEqual(len(loop_b.calls), 1)
+        for callback, args in loop_a.calls + loop_b.calls:
+            callback(*args)
+        self.assertEqual(results, [1, 3, 2])
+
+    def test_call_soon_other_thread(self):
+        loop = self.MockLoop()
+        self.poller.call_soon(loop, print, "x")
+        self.assertEqual(loop.calls, [(print, ("x",))])
+        self.assertEqual(self.poller._ready, [])
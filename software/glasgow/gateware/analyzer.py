@@ -1,11 +1,21 @@
+import re
+import sys
+import json
+import struct
+from array import array
 from functools import reduce
-from collections import OrderedDict
+from itertools import repeat, accumulate
+from operator import itemgetter
+from collections import namedtuple
+from vcd import VCDWriter
 from nmigen.compat import *
 from nmigen.compat.genlib.fifo import _FIFOInterface, SyncFIFOBuffered
 from nmigen.compat.genlib.coding import PriorityEncoder, PriorityDecoder
 
 
-__all__ = ["EventSource", "EventAnalyzer", "TraceDecodingError", "TraceDecoder"]
+__all__  = ["EventSource", "EventAnalyzer", "TraceDecodingError", "TraceDecoder", "TraceColumns"]
+__all__ += ["TraceEndDetector"]
+__all__ += ["TraceVCDWriter", "TraceCaptureError", "TraceCaptureWriter", "TraceCaptureReader"]
 
 
 REPORT_DELAY        = 0b10000000
@@ -355,26 +365,144 @@ class TraceDecodingError(Exception):
     pass
 
 
+# Classification of trace octets, used by the trace decoder to avoid masking every octet
+# several times.
+_OCTET_DELAY   = 0
+_OCTET_EVENT   = 1
+_OCTET_SPECIAL = 2
+_OCTET_CLASS   = bytes(
+    _OCTET_DELAY   if (octet & REPORT_DELAY_MASK)   == REPORT_DELAY else
+    _OCTET_EVENT   if (octet & REPORT_EVENT_MASK)   == REPORT_EVENT else
+    _OCTET_SPECIAL
+    for octet in range(256)
+)
+
+# Delay octets, delay octets that start a nonzero delay, and the septets they encode; used by
+# the trace decoder to find and decode runs of records without looking at every octet.
+_DELAY_OCTETS         = bytes(range(REPORT_DELAY, 256))
+_NONZERO_DELAY_OCTETS = bytes(range(REPORT_DELAY | 1, 256))
+_DELAY_SEPTETS        = bytes(octet & ~REPORT_DELAY_MASK for octet in range(256))
+
+# Array type codes that can hold event payloads, by item size.
+_PAYLOAD_TYPECODES = sorted({array(typecode).itemsize: typecode
+                             for typecode in "BHILQ"}.items())
+
+_STATE_IDLE    = "IDLE"
+_STATE_DELAY   = "DELAY"
+_STATE_DONE    = "DONE"
+_STATE_OVERRUN = "OVERRUN"
+
+
+def _record_value(indexes, values, group, value):
+    # An event that happens more than once in a group keeps the last value.
+    if indexes and indexes[-1] == group:
+        values[-1] = value
+    else:
+        indexes.append(group)
+        values.append(value)
+
+
+class TraceColumns:
+    """
+    Event analyzer trace, decoded into columns.
+
+    ``timestamps`` is the list of timestamps of every group of events that happened at the same
+    time. ``columns`` maps every event name to a pair of lists: the indexes of the groups in
+    which the event happened, and the values of the event in those groups. ``overrun`` is
+    the timestamp at which the trace ended with an overrun, or ``None``.
+    """
+    def __init__(self, timestamps, columns, overrun=None):
+        self.timestamps = timestamps
+        self.columns    = columns
+        self.overrun    = overrun
+
+    def timeline(self):
+        """
+        Return the events as a timestamped sequence of maps from event fields to their values,
+        ending with an ``"overrun"`` entry if the trace ended with an overrun.
+        """
+        groups = [{} for _ in self.timestamps]
+        for name, (indexes, values) in self.columns.items():
+            for index, value in zip(indexes, values):
+                groups[index][name] = value
+        timeline = list(zip(self.timestamps, groups))
+        if self.overrun is not None:
+            timeline.append((self.overrun, "overrun"))
+        return timeline
+
+
 class TraceDecoder:
     """
     Event analyzer trace decoder.
 
     Decodes raw analyzer traces into a timestamped sequence of maps from event fields to
-    their values.
+    their values, or into :class:`TraceColumns`.
+
+    Events are appended to per-event columns instead of being collected into a map per
+    timestamp. Runs of records that consist of a delay of the same length and an event from
+    the same source (which is what a busy source produces) have a fixed stride, and are decoded
+    at once by slicing the chunk. Other records (delay octets followed by an event and its
+    payload, or by a special) are found using regular expressions. An incomplete record at
+    the end of a chunk is kept until the next one arrives.
     """
     def __init__(self, event_sources, absolute_timestamps=True):
         self.event_sources       = event_sources
         self.absolute_timestamps = absolute_timestamps
 
-        self._state      = "IDLE"
+        self._state      = _STATE_IDLE
         self._byte_off   = 0
+        self._carry      = b""
         self._timestamp  = 0
-        self._delay      = 0
-        self._event_src  = 0
-        self._event_off  = 0
-        self._event_data = 0
-        self._pending    = OrderedDict()
-        self._timeline   = []
+        self._group_open = False
+        # A throttle special, like a delay, may be followed by a special.
+        self._after_special = False
+        self._timestamps = []
+        self._columns    = {name: ([], []) for name, _, _ in self.events()}
+
+        delay  = rb"[\x80-\xff]"
+        events = []
+        for index, event_src in enumerate(self.event_sources):
+            events.append(re.escape(bytes([REPORT_EVENT | index])) +
+                          rb"[\x00-\xff]{%d}" % ((event_src.width + 7) // 8))
+        events = b"|".join(events) or rb"(?!)"
+        specials = rb"[%s]" % b"".join(re.escape(bytes([REPORT_SPECIAL | special]))
+                                       for special in (SPECIAL_THROTTLE, SPECIAL_DETHROTTLE))
+        ends = rb"[%s]" % b"".join(re.escape(bytes([REPORT_SPECIAL | special]))
+                                   for special in (SPECIAL_DONE, SPECIAL_OVERRUN))
+        # A run of up to 64 complete records; a done or overrun special can only be the last one.
+        # A throttle special may be followed by more specials without a delay in between.
+        self._records_re = re.compile(
+            rb"(?:%s*(?:%s)|%s+%s+(?!%s|%s)){0,64}(?:%s+%s*%s)?" %
+            (delay, events, delay, specials, specials, ends, delay, specials, ends),
+            re.DOTALL)
+        # The records themselves, as (delay octets, event octets, delay and special octets).
+        self._record_re = re.compile(
+            rb"(%s*)(%s)|(%s+(?:%s+%s?|%s))" % (delay, events, delay, specials, ends, ends),
+            re.DOTALL)
+        # The beginning of a record that continues in the next chunk.
+        partial_events = []
+        for index, event_src in enumerate(self.event_sources):
+            partial_events.append(re.escape(bytes([REPORT_EVENT | index])) +
+                                  rb"[\x00-\xff]{0,%d}" % ((event_src.width + 7) // 8))
+        self._partial_re = re.compile(
+            rb"%s*(?:%s)?" % (delay, b"|".join(partial_events) or rb"(?!)"),
+            re.DOTALL)
+
+        # For every event octet, the size of the payload and the columns that receive the value
+        # (and the offsets and masks of the fields, if the source has any).
+        self._event_decoders = [None] * 256
+        for index, event_src in enumerate(self.event_sources):
+            size = (event_src.width + 7) // 8
+            if event_src.fields:
+                fields = []
+                offset = 0
+                for field_name, field_width in event_src.fields:
+                    fields.append(("%s-%s" % (field_name, event_src.name),
+                                   offset, (1 << field_width) - 1))
+                    offset += field_width
+                self._event_decoders[REPORT_EVENT | index] = (size, None, fields)
+            else:
+                self._event_decoders[REPORT_EVENT | index] = (size, event_src.name, None)
 
     def events(self):
         """
@@ -389,109 +517,513 @@ class TraceDecoder:
             else:
                 yield (event_src.name, event_src.kind, event_src.width)
 
-    def _flush_timestamp(self):
-        if self._delay == 0:
-            return
-
-        if self._pending:
-            self._timeline.append((self._timestamp, self._pending))
-            self._pending = OrderedDict()
-
+    def _invalid_byte(self, data, offset, state):
+        raise TraceDecodingError("at byte offset %d: invalid byte %#04x for state %s" %
+                                 (self._byte_off + offset, data[offset], state))
+
+    def _invalid_record(self, data, offset):
+        # The record at `offset` is neither complete nor the beginning of a valid record.
+        state = _STATE_DELAY if self._after_special else _STATE_IDLE
+        while _OCTET_CLASS[data[offset]] == _OCTET_DELAY:
+            state   = _STATE_DELAY
+            offset += 1
+        if _OCTET_CLASS[data[offset]] == _OCTET_EVENT:
+            raise TraceDecodingError("at byte offset %d: event source out of bounds" %
+                                     (self._byte_off + offset))
+        self._invalid_byte(data, offset, state)
+
+    def _column_lists(self):
+        # Resolve the columns once per chunk, so that decoding only appends to lists.
+        decoders = []
+        for decoder in self._event_decoders:
+            if decoder is None:
+                decoders.append(None)
+                continue
+            size, name, fields = decoder
+            if fields is None:
+                decoders.append((size, *self._columns[name], None))
+            else:
+                decoders.append((size, None, None, [
+                    (*self._columns[field_key], field_offset, field_mask)
+                    for field_key, field_offset, field_mask in fields
+                ]))
+        return decoders
+
+    def _payload_values(self, data, start, count, stride, size):
+        # Decode the payloads of `count` events at `start`, `start + stride`, ...
+        end = start + count * stride
+        if size == 0:
+            return [None] * count
+        if size == 1:
+            return list(data[start:end:stride])
+        for itemsize, typecode in _PAYLOAD_TYPECODES:
+            if itemsize >= size:
+                break
+        else:
+            return [int.from_bytes(data[offset:offset + size], "big")
+                    for offset in range(start, end, stride)]
+        # Gather the payload octets into big-endian array items.
+        items = bytearray(itemsize * count)
+        for octet in range(size):
+            items[itemsize - size + octet::itemsize] = data[start + octet:end:stride]
+        values = array(typecode, items)
+        if sys.byteorder == "little":
+            values.byteswap()
+        return values.tolist()
+
+    def _process_run(self, data, offset, decoders):
+        # Decode the run of records at `offset` that consist of a delay with the same number of
+        # octets (and no leading zero septets, which the gateware never emits) and an event from
+        # the same source, if any. Returns the offset of the first other record.
+        delay_octets = data[offset:offset + 6]
+        delay_size   = len(delay_octets) - len(delay_octets.lstrip(_DELAY_OCTETS))
+        if (delay_size == 0 or offset + delay_size >= len(data) or
+                data[offset] == REPORT_DELAY):
+            return offset
+        header = data[offset + delay_size]
+        if decoders[header] is None:
+            return offset
+        size, indexes, values, fields = decoders[header]
+        stride = delay_size + 1 + size
+
+        # Look for the end of the run in windows of increasing size, so that a run that is
+        # interrupted early does not cause the whole chunk to be sliced.
+        header_octets = bytes([header])
+        end    = offset
+        window = 16
+        while True:
+            count = min(window, (len(data) - end) // stride)
+            stop  = end + count * stride
+            count -= max(len(data[end:stop:stride].lstrip(_NONZERO_DELAY_OCTETS)),
+                         len(data[end + delay_size:stop:stride].lstrip(header_octets)),
+                         *(len(data[end + octet:stop:stride].lstrip(_DELAY_OCTETS))
+                           for octet in range(1, delay_size)))
+            end   += count * stride
+            if count < window:
+                break
+            window = min(window * 2, 65536)
+        if end - offset < stride * 16:
+            # Not worth slicing the chunk for.
+            return offset
+
+        # Every record in the run is a group of its own.
+        delays = data[offset:end:stride].translate(_DELAY_SEPTETS)
+        for octet in range(1, delay_size):
+            delays = [(delay << 7) | septet for delay, septet in
+                      zip(delays, data[offset + octet:end:stride].translate(_DELAY_SEPTETS))]
         if self.absolute_timestamps:
-            self._timestamp += self._delay
+            run_timestamps = list(accumulate(delays, initial=self._timestamp))
+        else:
+            run_timestamps = [self._timestamp, *delays]
+        if self._group_open:
+            self._timestamps.extend(run_timestamps[:-1])
+        else:
+            self._timestamps.extend(run_timestamps[1:-1])
+        self._timestamp     = run_timestamps[-1]
+        self._group_open    = True
+        self._after_special = False
+
+        count  = len(delays)
+        groups = range(len(self._timestamps) - count + 1, len(self._timestamps) + 1)
+        run_values = self._payload_values(data, offset + delay_size + 1, count, stride, size)
+        if fields is None:
+            indexes.extend(groups)
+            values.extend(run_values)
         else:
-            self._timestamp  = self._delay
-        self._delay = 0
+            for field_indexes, field_values, field_offset, field_mask in fields:
+                field_indexes.extend(groups)
+                field_values.extend([(value >> field_offset) & field_mask
+                                     for value in run_values])
+        return end
+
+    def _process_records(self, data, offset, decoders):
+        # Decode the complete records at `offset`. Returns the offset of the first octet that
+        # is not a part of a complete record.
+        end = self._records_re.match(data, offset).end()
+        if end == offset:
+            return end
+
+        absolute   = self.absolute_timestamps
+        timestamps = self._timestamps
+        timestamp  = self._timestamp
+        group      = len(timestamps)
+        group_open = self._group_open
+        throttle_indexes, throttle_values = self._columns["throttle"]
+        state      = _STATE_IDLE
+        specials   = b""
+
+        for delay_octets, event, specials in self._record_re.findall(data, offset, end):
+            if specials:
+                delay_octets = specials[:len(specials) - len(specials.lstrip(_DELAY_OCTETS))]
+                specials     = specials[len(delay_octets):]
+            if delay_octets:
+                if len(delay_octets) == 1:
+                    delay = delay_octets[0] & ~REPORT_DELAY_MASK
+                else:
+                    delay = 0
+                    for octet in delay_octets:
+                        delay = (delay << 7) | (octet & ~REPORT_DELAY_MASK)
+                if delay != 0:
+                    if group_open:
+                        timestamps.append(timestamp)
+                        group += 1
+                        group_open = False
+                    if absolute:
+                        timestamp += delay
+                    else:
+                        timestamp  = delay
+
+            if event:
+                size, indexes, values, fields = decoders[event[0]]
+                if size == 1:
+                    value = event[1]
+                elif size == 0:
+                    value = None
+                else:
+                    value = int.from_bytes(event[1:], "big")
+                if fields is None:
+                    if indexes and indexes[-1] == group:
+                        values[-1] = value
+                    else:
+                        indexes.append(group)
+                        values.append(value)
+                else:
+                    for indexes, values, field_offset, field_mask in fields:
+                        _record_value(indexes, values, group,
+                                      (value >> field_offset) & field_mask)
+                group_open = True
+            for special in specials:
+                if special == REPORT_SPECIAL | SPECIAL_THROTTLE:
+                    _record_value(throttle_indexes, throttle_values, group, 1)
+                    group_open = True
+                elif special == REPORT_SPECIAL | SPECIAL_DETHROTTLE:
+                    _record_value(throttle_indexes, throttle_values, group, 0)
+                    group_open = True
+                elif special == REPORT_SPECIAL | SPECIAL_DONE:
+                    state = _STATE_DONE
+                elif special == REPORT_SPECIAL | SPECIAL_OVERRUN:
+                    state = _STATE_OVERRUN
+
+        self._state         = state
+        self._timestamp     = timestamp
+        self._group_open    = group_open
+        self._after_special = bool(specials) and state == _STATE_IDLE
+        return end
 
     def process(self, data):
         """
         Incrementally parse a chunk of analyzer trace, and record events in it.
         """
-        for octet in data:
-            is_delay   = ((octet & REPORT_DELAY_MASK)   == REPORT_DELAY)
-            is_event   = ((octet & REPORT_EVENT_MASK)   == REPORT_EVENT)
-            is_special = ((octet & REPORT_SPECIAL_MASK) == REPORT_SPECIAL)
-            special    = octet & ~REPORT_SPECIAL
+        if self._carry:
+            data = self._carry + bytes(data)
+            self._carry = b""
+        elif not isinstance(data, bytes):
+            data = bytes(data)
+        if not data:
+            return
+        if self._state != _STATE_IDLE:
+            self._invalid_byte(data, 0, self._state)
+
+        decoders = self._column_lists()
+        offset   = 0
+        while offset < len(data) and self._state == _STATE_IDLE:
+            end = self._process_run(data, offset, decoders)
+            if end == offset:
+                end = self._process_records(data, offset, decoders)
+                if end == offset:
+                    break
+            offset = end
+
+        if offset == len(data) and self._after_special:
+            # Keep the decoder ready for another special in the next chunk by carrying a zero
+            # delay octet in place of the throttle special.
+            self._carry = bytes([REPORT_DELAY])
+            offset -= 1
+        elif offset < len(data):
+            if self._state != _STATE_IDLE:
+                self._invalid_byte(data, offset, self._state)
+            elif self._partial_re.fullmatch(data, offset):
+                # Apply the delay before a partially received event right away, so that the group
+                # before it is complete and can be flushed.
+                event = data[offset:].lstrip(_DELAY_OCTETS)
+                if event:
+                    delay = 0
+                    for octet in data[offset:len(data) - len(event)]:
+                        delay = (delay << 7) | (octet & ~REPORT_DELAY_MASK)
+                    if delay != 0:
+                        if self._group_open:
+                            self._timestamps.append(self._timestamp)
+                            self._group_open = False
+                        if self.absolute_timestamps:
+                            self._timestamp += delay
+                        else:
+                            self._timestamp  = delay
+                    offset = len(data) - len(event)
+                self._carry = data[offset:]
+            else:
+                self._invalid_record(data, offset)
+        self._byte_off += offset
+
+    def flush_columns(self, pending=False):
+        """
+        Return the complete events since the start of decoding or the previous flush, as
+        :class:`TraceColumns`. If ``pending`` is ``True``, also flushes pending events; this may
+        cause duplicate timestamps if more events arrive after the flush.
+        """
+        timestamps, columns = self._timestamps, self._columns
+        overrun = None
+        if self._state == _STATE_OVERRUN:
+            overrun = self._timestamp
+        elif pending and self._group_open or self._state == _STATE_DONE:
+            timestamps.append(self._timestamp)
+            self._group_open = False
+
+        # Events of the group that is still open are kept, and become a part of the first group
+        # of the next flush.
+        group = len(timestamps)
+        self._timestamps = []
+        self._columns    = {}
+        for name, (indexes, values) in columns.items():
+            split = len(indexes)
+            while split > 0 and indexes[split - 1] == group:
+                split -= 1
+            self._columns[name] = ([0] * (len(indexes) - split), values[split:])
+            del indexes[split:]
+            del values[split:]
+        return TraceColumns(timestamps, columns, overrun)
 
-            if self._state == "IDLE" and is_delay:
-                self._state = "DELAY"
-                self._delay = octet & ~REPORT_DELAY_MASK
+    def flush(self, pending=False):
+        """
+        Return the complete event timeline since the start of decoding or the previous flush.
+        If ``pending`` is ``True``, also flushes pending events; this may cause duplicate
+        timestamps if more events arrive after the flush.
+        """
+        return self.flush_columns(pending).timeline()
 
-            elif self._state == "DELAY" and is_delay:
-                self._delay = (self._delay << 7) | (octet & ~REPORT_DELAY_MASK)
+    def is_done(self):
+        return self._state in (_STATE_DONE, _STATE_OVERRUN)
 
-            elif self._state == "DELAY" and is_special and \
-                        special in (SPECIAL_THROTTLE, SPECIAL_DETHROTTLE):
-                self._flush_timestamp()
 
-                if special == SPECIAL_THROTTLE:
-                    self._pending["throttle"] = 1
-                elif special == SPECIAL_DETHROTTLE:
-                    self._pending["throttle"] = 0
+class TraceEndDetector:
+    """
+    Event analyzer trace end detector.
 
-            elif self._state in ("IDLE", "DELAY") and is_event:
-                self._flush_timestamp()
+    Finds the end of an analyzer trace without decoding it, for saving undecoded traces.
+    Event payloads are skipped rather than parsed, since their octets may have the same value
+    as a done or overrun report.
+    """
+    def __init__(self, event_sources):
+        self._payload_sizes = [(event_src.width + 7) // 8 for event_src in event_sources]
+        self._byte_off = 0
+        self._skip     = 0
+        self._done     = False
 
-                if (octet & ~REPORT_EVENT_MASK) > len(self.event_sources):
+    def process(self, data):
+        """
+        Scan a chunk of analyzer trace.
+        """
+        octet_class   = _OCTET_CLASS
+        payload_sizes = self._payload_sizes
+
+        offset = self._skip
+        length = len(data)
+        while offset < length and not self._done:
+            octet  = data[offset]
+            kind   = octet_class[octet]
+            offset += 1
+            if kind == _OCTET_EVENT:
+                event_src = octet & ~REPORT_EVENT_MASK
+                if event_src >= len(payload_sizes):
                     raise TraceDecodingError("at byte offset %d: event source out of bounds" %
-                                             self._byte_off)
-                self._event_src = self.event_sources[octet & ~REPORT_EVENT_MASK]
-                if self._event_src.width == 0:
-                    self._pending[self._event_src.name] = None
-                    self._state = "IDLE"
-                else:
-                    self._event_off  = self._event_src.width
-                    self._event_data = 0
-                    self._state = "EVENT"
-
-            elif self._state == "EVENT":
-                self._event_data <<= 8
-                self._event_data  |= octet
-                if self._event_off > 8:
-                    self._event_off -= 8
-                else:
-                    if self._event_src.fields:
-                        offset = 0
-                        for field_name, field_width in self._event_src.fields:
-                            self._pending["%s-%s" % (field_name, self._event_src.name)] = \
-                                (self._event_data >> offset) & ((1 << field_width) - 1)
-                            offset += field_width
-                    else:
-                        self._pending[self._event_src.name] = self._event_data
+                                             (self._byte_off + offset - 1))
+                offset += payload_sizes[event_src]
+            elif kind == _OCTET_SPECIAL:
+                if octet & ~REPORT_SPECIAL_MASK in (SPECIAL_DONE, SPECIAL_OVERRUN):
+                    self._done = True
 
-                    self._state = "IDLE"
+        self._skip      = max(0, offset - length)
+        self._byte_off += length
 
-            elif self._state in "DELAY" and is_special and \
-                        special in (SPECIAL_DONE, SPECIAL_OVERRUN):
-                self._flush_timestamp()
-                if special == SPECIAL_DONE:
-                    self._state = "DONE"
-                elif special == SPECIAL_OVERRUN:
-                    self._state = "OVERRUN"
+    def is_done(self):
+        return self._done
+
+
+class TraceVCDWriter:
+    """
+    Event analyzer trace VCD writer.
 
+    Writes the event timeline produced by a :class:`TraceDecoder` as VCD waveforms, with
+    one variable per event field. Timestamps are converted from cycles of ``sample_freq``.
+    """
+    def __init__(self, file, decoder, sample_freq, comment=""):
+        self.sample_freq = sample_freq
+
+        # Use the coarsest possible timescale to improve performance with sigrok.
+        self._vcd_writer = VCDWriter(file, timescale="10 ns", check_values=False,
+                                     comment=comment)
+        self._signals = {}
+        self._strobes = set()
+        for field_name, field_trigger, field_width in decoder.events():
+            if field_trigger == "throttle":
+                var_type = "wire"
+                var_init = 0
+            elif field_trigger == "change":
+                var_type = "wire"
+                var_init = "x" * field_width
+            elif field_trigger == "strobe":
+                if field_width > 0:
+                    var_type = "tri"
+                    var_init = "z"
+                else:
+                    var_type = "event"
+                    var_init = ""
             else:
-                raise TraceDecodingError("at byte offset %d: invalid byte %#04x for state %s" %
-                                         (self._byte_off, octet, self._state))
+                assert False
+            self._signals[field_name] = self._vcd_writer.register_var(
+                scope="", name=field_name, var_type=var_type,
+                size=field_width, init=var_init)
+            if field_trigger == "strobe":
+                self._strobes.add(field_name)
 
-            self._byte_off += 1
+        self._init = True
+        self._next_timestamp = 0
 
-    def flush(self, pending=False):
+    def write(self, columns):
         """
-        Return the complete event timeline since the start of decoding or the previous flush.
-        If ``pending`` is ``True``, also flushes pending events; this may cause duplicate
-        timestamps if more events arrive after the flush.
+        Write the events from ``columns``, a :class:`TraceColumns`. Returns ``True`` if the trace
+        ends with an overrun (after marking every variable as undefined), ``False`` otherwise.
         """
-        if self._state == "OVERRUN":
-            self._timeline.append((self._timestamp, "overrun"))
-        elif pending and self._pending or self._state == "DONE":
-            self._timeline.append((self._timestamp, self._pending))
-            self._pending = OrderedDict()
+        changes = []
+        for name, (indexes, values) in columns.columns.items():
+            signal = self._signals[name]
+            strobe = name in self._strobes
+            changes.extend(zip(indexes, repeat(signal), repeat(strobe), values))
+        changes.sort(key=itemgetter(0))
+
+        change      = self._vcd_writer.change
+        sample_freq = self.sample_freq
+        timestamps  = columns.timestamps
+        if self._init and timestamps:
+            self._init = False
+            self._vcd_writer._timestamp = int(1e8 * timestamps[0] // sample_freq)
+
+        strobes     = []
+        last_index  = None
+        for index, signal, strobe, value in changes:
+            if index != last_index:
+                for strobe_signal in strobes:
+                    change(strobe_signal, self._next_timestamp, "z")
+                strobes.clear()
+                cycle = timestamps[index]
+                timestamp            = int(1e8 * (cycle + 0) // sample_freq)
+                self._next_timestamp = int(1e8 * (cycle + 1) // sample_freq)
+                last_index = index
+            change(signal, timestamp, value)
+            if strobe:
+                strobes.append(signal)
+        for strobe_signal in strobes:
+            change(strobe_signal, self._next_timestamp, "z")
+        if timestamps and last_index != len(timestamps) - 1:
+            self._next_timestamp = int(1e8 * (timestamps[-1] + 1) // sample_freq)
+
+        if columns.overrun is not None:
+            for signal in self._signals.values():
+                change(signal, self._next_timestamp, "x")
+            self._next_timestamp += 100 # 1us
+            return True
+
+        self._vcd_writer.flush()
+        return False
+
+    def close(self):
+        self._vcd_writer.close(self._next_timestamp)
+
+
+class TraceCaptureError(Exception):
+    pass
 
-        timeline, self._timeline = self._timeline, []
-        return timeline
 
-    def is_done(self):
-        return self._state in ("DONE", "OVERRUN")
+# Description of an event source that is sufficient for decoding its events, used when
+# the gateware is not available.
+TraceEventSource = namedtuple("TraceEventSource", ("name", "kind", "width", "fields"))
+
+
+class TraceCaptureWriter:
+    """
+    Event analyzer trace capture writer.
+
+    Saves an undecoded analyzer trace, which can be written at the full rate of the USB link,
+    for decoding it later with :class:`TraceCaptureReader`. The capture file consists of
+    a magic number, a 32-bit big-endian header length, a JSON header that describes the event
+    sources, the sample frequency, the bitstream ID, and the applet that saved the capture
+    (``None`` for applet analyzer traces), and the raw trace.
+    """
+    MAGIC = b"GLTRACE1"
+
+    def __init__(self, file, event_sources, sample_freq, bitstream_id=None, applet=None):
+        self.file = file
+
+        header = json.dumps({
+            "sample_freq":   sample_freq,
+            "bitstream_id":  None if bitstream_id is None else bitstream_id.hex(),
+            "applet":        applet,
+            "event_sources": [
+                [event_src.name, event_src.kind, event_src.width, list(event_src.fields)]
+                for event_src in event_sources
+            ],
+        }).encode("utf-8")
+        self.file.write(self.MAGIC)
+        self.file.write(struct.pack(">L", len(header)))
+        self.file.write(header)
+
+    def write(self, data):
+        self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+
+class TraceCaptureReader:
+    """
+    Event analyzer trace capture reader.
+
+    Reads a capture file saved by :class:`TraceCaptureWriter`. The ``event_sources`` attribute
+    is suitable for passing to :class:`TraceDecoder`.
+    """
+    def __init__(self, file):
+        self.file = file
+
+        magic = self.file.read(len(TraceCaptureWriter.MAGIC))
+        if magic != TraceCaptureWriter.MAGIC:
+            raise TraceCaptureError("not an analyzer trace capture")
+        header_size_bytes = self.file.read(4)
+        if len(header_size_bytes) != 4:
+            raise TraceCaptureError("truncated capture header")
+        header_size, = struct.unpack(">L", header_size_bytes)
+        try:
+            header = json.loads(self.file.read(header_size).decode("utf-8"))
+            self.sample_freq   = header["sample_freq"]
+            if header["bitstream_id"] is None:
+                self.bitstream_id = None
+            else:
+                self.bitstream_id = bytes.fromhex(header["bitstream_id"])
+            self.applet        = header.get("applet")
+            self.event_sources = [
+                TraceEventSource(name, kind, width, tuple(tuple(field) for field in fields))
+                for name, kind, width, fields in header["event_sources"]
+            ]
+        except (ValueError, KeyError, TypeError) as e:
+            raise TraceCaptureError("malformed capture header: {}".format(e))
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def __iter__(self):
+        while True:
+            data = self.file.read(1 << 20)
+            if not data:
+                break
+            yield data
 
 # -------------------------------------------------------------------------------------------------
 
@@ -861,3 +1393,201 @@ class EventAnalyzerTestCase(unittest.TestCase):
         ], [
             (0x10000, "overrun"),
         ], flush_pending=False)
+
+
+class TraceDecoderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.event_sources = [
+            EventSource("0", "change", 12, (), 16),
+            EventSource("1", "strobe", 0, (), 0),
+            EventSource("2", "change", 3, (("a", 1), ("b", 2)), 16),
+        ]
+        self.data = [
+            REPORT_DELAY|2,
+            REPORT_EVENT|0, 0x0a, 0xbc,
+            REPORT_EVENT|1,
+            REPORT_DELAY|1,
+            REPORT_DELAY|0,
+            REPORT_EVENT|2, 0b110,
+            REPORT_DELAY|3,
+            REPORT_SPECIAL|SPECIAL_THROTTLE,
+            REPORT_DELAY|1,
+            REPORT_SPECIAL|SPECIAL_DETHROTTLE,
+            REPORT_DELAY|1,
+            REPORT_SPECIAL|SPECIAL_DONE,
+        ]
+        self.decoded = [
+            (2,   {"0": 0xabc, "1": None}),
+            (130, {"a-2": 0b0, "b-2": 0b11}),
+            (133, {"throttle": 1}),
+            (134, {"throttle": 0}),
+            (135, {}),
+        ]
+
+    def test_chunk(self):
+        decoder = TraceDecoder(self.event_sources)
+        decoder.process(bytes(self.data))
+        self.assertTrue(decoder.is_done())
+        self.assertEqual(decoder.flush(), self.decoded)
+
+    def test_split(self):
+        for split in range(len(self.data)):
+            decoder = TraceDecoder(self.event_sources)
+            decoder.process(self.data[:split])
+            decoder.process(self.data[split:])
+            self.assertEqual(decoder.flush(), self.decoded)
+
+    def test_octet_at_a_time(self):
+        decoder = TraceDecoder(self.event_sources)
+        for octet in self.data:
+            decoder.process(bytes([octet]))
+        self.assertEqual(decoder.flush(), self.decoded)
+
+    def test_relative_timestamps(self):
+        decoder = TraceDecoder(self.event_sources, absolute_timestamps=False)
+        decoder.process(self.data)
+        self.assertEqual([timestamp for timestamp, _ in decoder.flush()], [2, 128, 3, 1, 1])
+
+    def test_columns(self):
+        decoder = TraceDecoder(self.event_sources)
+        decoder.process(self.data)
+        columns = decoder.flush_columns()
+        self.assertEqual(columns.timestamps, [2, 130, 133, 134, 135])
+        self.assertEqual(columns.columns, {
+            "throttle": ([2, 3], [1, 0]),
+            "0":        ([0], [0xabc]),
+            "1":        ([0], [None]),
+            "a-2":      ([1], [0b0]),
+            "b-2":      ([1], [0b11]),
+        })
+        self.assertIsNone(columns.overrun)
+
+    def test_columns_pending(self):
+        decoder = TraceDecoder(self.event_sources)
+        decoder.process(self.data[:5])
+        columns = decoder.flush_columns()
+        self.assertEqual(columns.timestamps, [])
+        self.assertEqual(columns.columns["0"], ([], []))
+        decoder.process(self.data[5:])
+        columns = decoder.flush_columns()
+        self.assertEqual(columns.timestamps, [2, 130, 133, 134, 135])
+        self.assertEqual(columns.columns["0"], ([0], [0xabc]))
+        self.assertEqual(columns.columns["1"], ([0], [None]))
+
+    def test_run(self):
+        data      = []
+        decoded   = []
+        timestamp = 0
+        for index in range(100):
+            timestamp += index % 3 + 1
+            data      += [REPORT_DELAY|(index % 3 + 1), REPORT_EVENT|0, index >> 8, index & 0xff]
+            decoded   += [(timestamp, {"0": index})]
+        data      += [REPORT_DELAY|0x7f, REPORT_DELAY|0x7f, REPORT_EVENT|2, 0b001,
+                      REPORT_DELAY|1, REPORT_SPECIAL|SPECIAL_DONE]
+        decoded   += [(timestamp + 0x3fff, {"a-2": 0b1, "b-2": 0b00}),
+                      (timestamp + 0x4000, {})]
+        for split in range(0, len(data), 7):
+            decoder = TraceDecoder(self.event_sources)
+            decoder.process(data[:split])
+            decoder.process(data[split:])
+            self.assertEqual(decoder.flush(), decoded)
+
+    def test_specials(self):
+        data = [
+            REPORT_DELAY|1,
+            REPORT_SPECIAL|SPECIAL_THROTTLE,
+            REPORT_SPECIAL|SPECIAL_DETHROTTLE,
+            REPORT_SPECIAL|SPECIAL_DONE,
+        ]
+        for split in range(len(data)):
+            decoder = TraceDecoder(self.event_sources)
+            decoder.process(data[:split])
+            decoder.process(data[split:])
+            self.assertEqual(decoder.flush(), [(1, {"throttle": 0})])
+
+    def test_invalid_byte(self):
+        decoder = TraceDecoder(self.event_sources)
+        with self.assertRaisesRegex(TraceDecodingError,
+                r"at byte offset 1: invalid byte 0x02 for state IDLE"):
+            decoder.process([REPORT_EVENT|1, REPORT_SPECIAL|SPECIAL_THROTTLE])
+
+    def test_source_out_of_bounds(self):
+        decoder = TraceDecoder(self.event_sources)
+        with self.assertRaisesRegex(TraceDecodingError,
+                r"at byte offset 1: event source out of bounds"):
+            decoder.process([REPORT_DELAY|1, REPORT_EVENT|3])
+
+
+class TraceEndDetectorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.event_sources = [
+            EventSource("0", "change", 12, (), 16),
+            EventSource("1", "strobe", 0, (), 0),
+        ]
+        self.data = [
+            REPORT_DELAY|2,
+            REPORT_EVENT|0, REPORT_SPECIAL|SPECIAL_DONE, REPORT_SPECIAL|SPECIAL_DONE,
+            REPORT_EVENT|1,
+            REPORT_DELAY|1,
+            REPORT_SPECIAL|SPECIAL_DONE,
+        ]
+
+    def test_done(self):
+        detector = TraceEndDetector(self.event_sources)
+        detector.process(bytes(self.data[:-1]))
+        self.assertFalse(detector.is_done())
+        detector.process(bytes(self.data[-1:]))
+        self.assertTrue(detector.is_done())
+
+    def test_split(self):
+        for split in range(len(self.data)):
+            detector = TraceEndDetector(self.event_sources)
+            detector.process(bytes(self.data[:split]))
+            self.assertFalse(detector.is_done())
+            detector.process(bytes(self.data[split:]))
+            self.assertTrue(detector.is_done())
+
+    def test_overrun(self):
+        detector = TraceEndDetector(self.event_sources)
+        detector.process(bytes([REPORT_DELAY|0x7f, REPORT_SPECIAL|SPECIAL_OVERRUN]))
+        self.assertTrue(detector.is_done())
+
+    def test_source_out_of_bounds(self):
+        detector = TraceEndDetector(self.event_sources)
+        with self.assertRaisesRegex(TraceDecodingError,
+                r"at byte offset 1: event source out of bounds"):
+            detector.process(bytes([REPORT_DELAY|1, REPORT_EVENT|2]))
+
+
+class TraceCaptureTestCase(unittest.TestCase):
+    def test_roundtrip(self):
+        import io
+        event_sources = [
+            EventSource("0", "change", 12, (), 16),
+            EventSource("2", "change", 3, (("a", 1), ("b", 2)), 16),
+        ]
+        data = bytes([REPORT_DELAY|2, REPORT_EVENT|0, 0x0a, 0xbc])
+
+        file = io.BytesIO()
+        writer = TraceCaptureWriter(file, event_sources, 48e6, b"\x01" * 16, applet="analyzer")
+        writer.write(data)
+
+        file.seek(0)
+        reader = TraceCaptureReader(file)
+        self.assertEqual(reader.sample_freq, 48e6)
+        self.assertEqual(reader.bitstream_id, b"\x01" * 16)
+        self.assertEqual(reader.applet, "analyzer")
+        self.assertEqual(reader.event_sources, [
+            ("0", "change", 12, ()),
+            ("2", "change", 3, (("a", 1), ("b", 2))),
+        ])
+        self.assertEqual(b"".join(reader), data)
+
+        decoder = TraceDecoder(reader.event_sources)
+        decoder.process(data)
+        self.assertEqual(decoder.flush(pending=True), [(2, {"0": 0xabc})])
+
+    def test_bad_magic(self):
+        import io
+        with self.assertRaisesRegex(TraceCaptureError, r"not an analyzer trace capture"):
+            TraceCaptureReader(io.BytesIO(b"$date"))
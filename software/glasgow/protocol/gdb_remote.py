@@ -2,11 +2,93 @@ import re
 import logging
 import asyncio
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
 
 from ..applet import GlasgowAppletError
 
 
-__all__ = ["GDBRemote"]
+__all__ = ["GDBRemote", "GDBRemoteCache"]
+
+
+class GDBRemoteCache:
+    """
+    A cache of target memory and registers, only valid while the target is stopped.
+
+    Memory is cached in ``line_size`` byte lines; a read that misses also fetches up to
+    ``prefetch_lines`` following lines, since debuggers tend to read stack frames and code
+    sequentially. Reads that overlap any of the ``uncacheable`` regions (a list of ``range``
+    objects, e.g. for MMIO) always go to the target.
+    """
+    def __init__(self, *, line_size=256, prefetch_lines=1, max_lines=1024, uncacheable=(),
+                 address_limit=1 << 32):
+        self.line_size      = line_size
+        self.prefetch_lines = prefetch_lines
+        self.max_lines      = max_lines
+        self.uncacheable    = list(uncacheable)
+        self.address_limit  = address_limit
+
+        self.registers = None
+        self._lines    = OrderedDict()
+
+    def invalidate(self):
+        """Discard all cached memory and registers."""
+        self.registers = None
+        self._lines.clear()
+
+    def invalidate_memory(self, address, length):
+        """Discard cached memory overlapping ``length`` bytes at ``address``."""
+        for line in range(address // self.line_size,
+                          (address + max(length, 1) - 1) // self.line_size + 1):
+            self._lines.pop(line, None)
+
+    def is_cacheable(self, address, length):
+        if address + length > self.address_limit:
+            return False
+        for region in self.uncacheable:
+            if address < region.stop and address + length > region.start:
+                return False
+        return True
+
+    def _line_cacheable(self, line):
+        return self.is_cacheable(line * self.line_size, self.line_size)
+
+    async def read_memory(self, address, length, read_memory):
+        """
+        Read ``length`` bytes at ``address``, calling coroutine function ``read_memory`` with
+        an address and a length for any part that is not cached.
+        """
+        if length == 0:
+            return b""
+        first_line = address // self.line_size
+        last_line  = (address + length - 1) // self.line_size
+        if not all(self._line_cacheable(line) for line in range(first_line, last_line + 1)):
+            return await read_memory(address, length)
+
+        missing = [line for line in range(first_line, last_line + 1) if line not in self._lines]
+        if missing:
+            fetch_first, fetch_last = missing[0], missing[-1]
+            for _ in range(self.prefetch_lines):
+                if fetch_last + 1 in self._lines or not self._line_cacheable(fetch_last + 1):
+                    break
+                fetch_last += 1
+            try:
+                data = await read_memory(fetch_first * self.line_size,
+                                         (fetch_last - fetch_first + 1) * self.line_size)
+            except GlasgowAppletError:
+                # The extended range may reach into unmapped memory even if the requested one
+                # does not; let the target decide whether the exact request is valid.
+                return await read_memory(address, length)
+            for index, line in enumerate(range(fetch_first, fetch_last + 1)):
+                self._lines[line] = data[index * self.line_size:(index + 1) * self.line_size]
+            while len(self._lines) > self.max_lines:
+                self._lines.popitem(last=False)
+
+        data = bytearray()
+        for line in range(first_line, last_line + 1):
+            self._lines.move_to_end(line)
+            data += self._lines[line]
+        offset = address - first_line * self.line_size
+        return bytes(data[offset:offset + length])
 
 
 class GDBRemote(metaclass=ABCMeta):
@@ -90,9 +172,16 @@ class GDBRemote(metaclass=ABCMeta):
     async def target_clear_instr_breakpt(self, address):
         pass
 
-    async def gdb_run(self, endpoint):
+    def target_uncacheable_regions(self):
+        """Return a list of address ranges that must not be cached, such as MMIO."""
+        return []
+
+    async def gdb_run(self, endpoint, *, uncacheable_regions=()):
         self.__non_stop = False
         self.__error_strings = False
+        self.__cache = GDBRemoteCache(
+            uncacheable=[*self.target_uncacheable_regions(), *uncacheable_regions],
+            address_limit=1 << (self.target_word_size() * 8))
 
         try:
             no_ack_mode = False
@@ -208,6 +297,7 @@ class GDBRemote(metaclass=ABCMeta):
             #
             # So, we only stop the target when we positively have to have it stopped.
             if self.target_running():
+                self.__cache.invalidate()
                 await self.target_stop()
 
             # "Target caught signal SIGTRAP."
@@ -215,6 +305,7 @@ class GDBRemote(metaclass=ABCMeta):
 
         # "Resume target."
         if command == b"c":
+            self.__cache.invalidate()
             continue_fut  = asyncio.ensure_future(self.target_continue())
             interrupt_fut = asyncio.ensure_future(make_recv_fut())
             await asyncio.wait([continue_fut, interrupt_fut], return_when=asyncio.FIRST_COMPLETED)
@@ -231,18 +322,22 @@ class GDBRemote(metaclass=ABCMeta):
 
         # "Single-step target [but first jump to this address]."
         if command == b"s":
+            self.__cache.invalidate()
             await self.target_single_step()
             return b"S05"
 
         # "Detach from target."
         if command == b"D":
+            self.__cache.invalidate()
             await self.target_detach()
             return b"OK"
 
         # "Get all registers of the target."
         if command == b"g":
+            if self.__cache.registers is None:
+                self.__cache.registers = list(await self.target_get_registers())
             values = bytearray()
-            for register in await self.target_get_registers():
+            for register in self.__cache.registers:
                 if register is None:
                     values += b"xx" * self.target_word_size()
                 else:
@@ -253,7 +348,12 @@ class GDBRemote(metaclass=ABCMeta):
         if command.startswith(b"p"):
             number = int(command[1:], 16)
             if number < len(self.target_register_names()):
-                value  = await self.target_get_register(number)
+                registers = self.__cache.registers
+                if registers is not None and number < len(registers) and \
+                        registers[number] is not None:
+                    value = registers[number]
+                else:
+                    value = await self.target_get_register(number)
                 return b"%.*x" % (self.target_word_size() * 2, value)
             else:
                 return (0, "unrecognized register")
@@ -265,12 +365,14 @@ class GDBRemote(metaclass=ABCMeta):
             while values:
                 registers.append(int(values[:self.target_word_size() * 2]))
                 values = values[self.target_word_size() * 2:]
+            self.__cache.registers = None
             await self.target_set_registers(registers)
 
         # "Set specific register of the target."
         if command.startswith(b"P"):
             number, value = map(lambda x: int(x, 16), command[1:].split(b"="))
             if number < len(self.target_register_names()):
+                self.__cache.registers = None
                 await self.target_set_register(number, value)
                 return b"OK"
             else:
@@ -279,19 +381,22 @@ class GDBRemote(metaclass=ABCMeta):
         # "Read specified memory range of the target."
         if command.startswith(b"m"):
             address, length = map(lambda x: int(x, 16), command[1:].split(b","))
-            data = await self.target_read_memory(address, length)
+            data = await self.__cache.read_memory(address, length, self.target_read_memory)
             return data.hex().encode("ascii")
 
         # "Write specified memory range of the target."
         if command.startswith(b"M"):
             location, data = command[1:].split(b":")
             address, _length = map(lambda x: int(x, 16), location.split(b","))
-            await self.target_write_memory(address, bytes.fromhex(data.decode("ascii")))
+            data = bytes.fromhex(data.decode("ascii"))
+            self.__cache.invalidate_memory(address, len(data))
+            await self.target_write_memory(address, data)
             return b"OK"
 
         # "Set software breakpoint."
         if command.startswith(b"Z0"):
-            address, _kind = map(lambda x: int(x, 16), command[3:].split(b","))
+            address, kind = map(lambda x: int(x, 16), command[3:].split(b","))
+            self.__cache.invalidate_memory(address, kind)
             if await self.target_set_software_breakpt(address):
                 return b"OK"
             else:
@@ -299,7 +404,8 @@ class GDBRemote(metaclass=ABCMeta):
 
         # "Clear software breakpoint."
         if command.startswith(b"z0"):
-            address, _kind = map(lambda x: int(x, 16), command[3:].split(b","))
+            address, kind = map(lambda x: int(x, 16), command[3:].split(b","))
+            self.__cache.invalidate_memory(address, kind)
             if await self.target_clear_software_breakpt(address):
                 return b"OK"
             else:
@@ -322,3 +428,193 @@ class GDBRemote(metaclass=ABCMeta):
                 return (0, "hardware breakpoint not set")
 
         return b""
+
+# -------------------------------------------------------------------------------------------------
+
+import unittest
+
+
+class GDBRemoteCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.memory = bytes(range(256)) * 16
+        self.reads  = []
+        self.cache  = GDBRemoteCache(line_size=16, prefetch_lines=1, max_lines=4,
+                                     uncacheable=[range(0x800, 0x900)], address_limit=0x1000)
+
+    async def read_memory(self, address, length):
+        self.reads.append((address, length))
+        if address + length > len(self.memory):
+            raise GlasgowAppletError("out of range")
+        return self.memory[address:address + length]
+
+    def read(self, address, length):
+        return asyncio.get_event_loop().run_until_complete(
+            self.cache.read_memory(address, length, self.read_memory))
+
+    def test_hit(self):
+        self.assertEqual(self.read(0x14, 8), self.memory[0x14:0x1c])
+        self.assertEqual(self.reads, [(0x10, 0x20)])
+        self.assertEqual(self.read(0x10, 0x20), self.memory[0x10:0x30])
+        self.assertEqual(self.reads, [(0x10, 0x20)])
+
+    def test_prefetch_stops_at_cached(self):
+        self.read(0x20, 4)
+        self.read(0x00, 0x14)
+        self.assertEqual(self.reads, [(0x20, 0x20), (0x00, 0x20)])
+
+    def test_uncacheable(self):
+        self.assertEqual(self.read(0x8f0, 0x20), self.memory[0x8f0:0x910])
+        self.read(0x8f0, 0x20)
+        self.assertEqual(self.reads, [(0x8f0, 0x20), (0x8f0, 0x20)])
+        self.read(0x7f0, 4)
+        self.assertEqual(self.reads[-1], (0x7f0, 0x10))
+
+    def test_address_limit(self):
+        self.assertEqual(self.read(0xffc, 4), self.memory[0xffc:])
+        self.assertEqual(self.reads, [(0xff0, 0x10)])
+
+    def test_fetch_error(self):
+        self.memory = self.memory[:0x18]
+        self.assertEqual(self.read(0x10, 4), self.memory[0x10:0x14])
+        self.assertEqual(self.reads, [(0x10, 0x20), (0x10, 4)])
+
+    def test_invalidate(self):
+        self.read(0x00, 4)
+        self.cache.invalidate_memory(0x1f, 1)
+        self.read(0x00, 4)
+        self.read(0x10, 4)
+        self.assertEqual(self.reads, [(0x00, 0x20), (0x10, 0x20)])
+        self.cache.invalidate()
+        self.read(0x00, 4)
+        self.assertEqual(len(self.reads), 3)
+
+    def test_evict(self):
+        for address in range(0, 0x80, 0x10):
+            self.read(address, 1)
+        self.assertEqual(len(self.cache._lines), 4)
+        self.read(0x00, 1)
+        self.assertEqual(self.reads[-1], (0x00, 0x20))
+
+
+class GDBRemoteTestCase(unittest.TestCase):
+    class MockTarget(GDBRemote):
+        def __init__(self):
+            self.calls = []
+
+        def gdb_log(self, level, message, *args):
+            pass
+
+        def target_word_size(self):
+            return 4
+
+        def target_endianness(self):
+            return "little"
+
+        def target_triple(self):
+            return "mock"
+
+        def target_register_names(self):
+            return ["r0", "r1"]
+
+        def target_running(self):
+            return False
+
+        async def target_stop(self):
+            pass
+
+        async def target_continue(self):
+            self.calls.append("continue")
+
+        async def target_single_step(self):
+            self.calls.append("step")
+
+        async def target_detach(self):
+            pass
+
+        async def target_get_registers(self):
+            self.calls.append("get_registers")
+            return [1, 2]
+
+        async def target_set_registers(self, registers):
+            pass
+
+        async def target_get_register(self, number):
+            self.calls.append("get_register")
+            return number + 1
+
+        async def target_set_register(self, number, value):
+            self.calls.append("set_register")
+
+        async def target_read_memory(self, address, length):
+            self.calls.append(("read", address, length))
+            return bytes(length)
+
+        async def target_write_memory(self, address, data):
+            self.calls.append(("write", address, len(data)))
+
+        async def target_set_software_breakpt(self, address):
+            return True
+
+        async def target_clear_software_breakpt(self, address):
+            return True
+
+        async def target_set_instr_breakpt(self, address):
+            return True
+
+        async def target_clear_instr_breakpt(self, address):
+            return True
+
+        def target_uncacheable_regions(self):
+            return [range(0x1000, 0x2000)]
+
+    class MockEndpoint:
+        def __init__(self, commands):
+            self._input    = bytearray()
+            for command in [b"QStartNoAckMode", *commands]:
+                self._input += b"$%s#%02x" % (command, sum(command) & 0xff)
+            self.responses = []
+
+        async def recv(self, length):
+            if not self._input:
+                raise asyncio.CancelledError
+            data = bytes(self._input[:length])
+            del self._input[:length]
+            return data
+
+        async def recv_until(self, delimiter):
+            data, _, rest = bytes(self._input).partition(delimiter)
+            self._input = bytearray(rest)
+            return data
+
+        async def send(self, data):
+            if data != b"+":
+                self.responses.append(data[1:-3])
+
+        async def recv_wait(self):
+            await asyncio.sleep(1)
+
+    def run_gdb(self, *commands):
+        target   = self.MockTarget()
+        endpoint = self.MockEndpoint(commands)
+        asyncio.get_event_loop().run_until_complete(target.gdb_run(endpoint))
+        return target.calls, endpoint.responses[1:]
+
+    def test_memory_cache(self):
+        calls, responses = self.run_gdb(b"m104,4", b"m108,4", b"M108,1:ff", b"m108,4")
+        self.assertEqual(calls, [("read", 0x100, 0x200), ("write", 0x108, 1),
+                                 ("read", 0x100, 0x100)])
+        self.assertEqual(responses[0], b"00000000")
+
+    def test_memory_uncacheable(self):
+        calls, responses = self.run_gdb(b"m1000,4", b"m1000,4")
+        self.assertEqual(calls, [("read", 0x1000, 4), ("read", 0x1000, 4)])
+
+    def test_invalidate_on_step(self):
+        calls, responses = self.run_gdb(b"m0,4", b"g", b"p1", b"s", b"p1", b"m0,4")
+        self.assertEqual(calls, [("read", 0x000, 0x200), "get_registers", "step",
+                                 "get_register", ("read", 0x000, 0x200)])
+        self.assertEqual(responses[1:3], [b"0000000100000002", b"00000002"])
+
+    def test_register_write(self):
+        calls, responses = self.run_gdb(b"g", b"P0=5", b"g")
+        self.assertEqual(calls, ["get_registers", "set_register", "get_registers"])
@@ -13,6 +13,7 @@ __all__ = ["SVFParser", "SVFEventHandler"]
 
 
 def _hex_to_bits(input_nibbles):
+    # `int` accepts both `str` and `bytes`, and converts hexadecimal digits in linear time.
     return bits(int(input_nibbles, 16))
 
 
@@ -40,6 +41,35 @@ class SVFParsingError(Exception):
     pass
 
 
+def _make_scanner(keywords, text):
+    if text:
+        compile = lambda src: re.compile(src, re.A|re.I|re.M)
+        decode  = lambda value: value
+        strip   = lambda value: re.sub(r"\s+", "", value)
+    else:
+        compile = lambda src: re.compile(src.encode("ascii"), re.A|re.I|re.M)
+        decode  = lambda value: value.decode("latin-1")
+        strip   = lambda value: value.translate(None, b" \t\n\r\v\f")
+    return tuple((compile(src), act) for src, act in (
+        (r"\s+",
+         None),
+        (r"(?:!|//)([^\n]*)(?:\n|\Z)",
+         None),
+        (r"({})(?=\s+|[;()]|\Z)".format("|".join(keywords)),
+         lambda m: decode(m[1])),
+        (r"(\d+)(?=[^0-9\.E])",
+         lambda m: int(m[1])),
+        (r"(\d+(?:\.\d+)?(?:E[+-]?\d+)?)",
+         lambda m: float(m[1])),
+        (r"\(\s*([0-9A-F\s]+)\s*\)",
+         lambda m: _hex_to_bits(strip(m[1]))),
+        (r"\(\s*(.+?)\s*\)",
+         lambda m: (decode(m[1]),)),
+        (r"\Z",
+         lambda m: None),
+    ))
+
+
 class SVFLexer:
     """
     A Serial Vector Format lexer.
@@ -54,38 +84,52 @@ class SVFLexer:
         * Literal (``(HLUDXZHHLL)``, ``(IN FOO)``, ...), returned as Python ``tuple(str,)``;
         * End of file, returned as Python ``None``.
 
-    :type buffer: str
+    The input buffer may be a ``str`` or a bytes-like object, such as an ``mmap.mmap`` of
+    an SVF file; in the latter case, the file is lexed without reading all of it into memory.
+
+    :type buffer: str or bytes-like
     :attr buffer:
         Input buffer.
 
     :type position: int
     :attr position:
         Offset into buffer from which the next token will be read.
+
+    :type token_position: int
+    :attr token_position:
+        Offset into buffer at which the last token returned by :meth:`next` starts.
     """
 
-    _keywords = _commands + _parameters + _trst_modes + _tap_states + (";",)
-    _scanner  = tuple((re.compile(src, re.A|re.I|re.M), act) for src, act in (
-        (r"\s+",
-         None),
-        (r"(?:!|//)([^\n]*)(?:\n|\Z)",
-         None),
-        (r"({})(?=\s+|[;()]|\Z)".format("|".join(_keywords)),
-         lambda m: m[1]),
-        (r"(\d+)(?=[^0-9\.E])",
-         lambda m: int(m[1])),
-        (r"(\d+(?:\.\d+)?(?:E[+-]?\d+)?)",
-         lambda m: float(m[1])),
-        (r"\(\s*([0-9A-F\s]+)\s*\)",
-         lambda m: _hex_to_bits(re.sub(r"\s+", "", m[1]))),
-        (r"\(\s*(.+?)\s*\)",
-         lambda m: (m[1],)),
-        (r"\Z",
-         lambda m: None),
-    ))
+    _keywords       = _commands + _parameters + _trst_modes + _tap_states + (";",)
+    _text_scanner   = _make_scanner(_keywords, text=True)
+    _binary_scanner = _make_scanner(_keywords, text=False)
 
     def __init__(self, buffer):
         self.buffer   = buffer
         self.position = 0
+        self.token_position = 0
+
+        if isinstance(buffer, str):
+            self._scanner = self._text_scanner
+            self._newline = "\n"
+        else:
+            self._scanner = self._binary_scanner
+            self._newline = b"\n"
+        # Line numbers are counted incrementally from the last queried position, so that
+        # querying the line of every command does not take quadratic time.
+        self._line_pos = 0
+        self._line     = 0
+
+    def _count_newlines(self, start, end):
+        if hasattr(self.buffer, "count"):
+            return self.buffer.count(self._newline, start, end)
+        count = 0 # `mmap.mmap` has no `count`
+        while True:
+            start = self.buffer.find(self._newline, start, end)
+            if start == -1:
+                return count
+            count += 1
+            start += 1
 
     def line_column(self, position=None):
         """
@@ -93,12 +137,15 @@ class SVFLexer:
 
         Both the line and the column start at 1.
         """
-        line = len(re.compile(r"\n").findall(self.buffer, endpos=self.position))
-        if line > 1:
-            column = self.position - self.buffer.rindex("\n", 0, self.position)
+        if position is None:
+            position = self.position
+        if position < self._line_pos:
+            self._line -= self._count_newlines(position, self._line_pos)
         else:
-            column = self.position
-        return line + 1, column + 1
+            self._line += self._count_newlines(self._line_pos, position)
+        self._line_pos = position
+        line_start = self.buffer.rfind(self._newline, 0, position) + 1
+        return self._line + 1, position - line_start + 1
 
     def _lex(self):
         while True:
@@ -112,9 +159,11 @@ class SVFLexer:
                     else:
                         return action(match), match.end()
             else:
+                context = self.buffer[self.position:self.position + 16]
+                if not isinstance(context, str):
+                    context = context.decode("latin-1")
                 raise SVFParsingError("unrecognized SVF data at line %d, column %d (%s...)"
-                                    % (*self.line_column(),
-                                       self.buffer[self.position:self.position + 16]))
+                                    % (*self.line_column(), context))
 
     def peek(self):
         """Return the next token without advancing the position."""
@@ -124,6 +173,7 @@ class SVFLexer:
     def next(self):
         """Return the next token and advance the position."""
         token, next_pos = self._lex()
+        self.token_position = self.position
         self.position = next_pos
         return token
 
@@ -143,7 +193,8 @@ class SVFParser:
 
     This parser maintains and allows querying lexical state (e.g. "sticky" ``TDI`` is
     automatically tracked), and invokes the SVF event handler for all commands so that
-    any necessary action may be taken.
+    any necessary action may be taken. The input buffer is parsed one command at a time, and
+    may be anything :class:`SVFLexer` accepts.
     """
     def __init__(self, buffer, handler):
         self._lexer     = SVFLexer(buffer)
@@ -151,6 +202,8 @@ class SVFParser:
         self._position  = 0
         self._token     = None
         self._cmd_pos   = 0
+        self._cmd_start = 0
+        self._trying    = 0
 
         self._param_tdi   = \
             {"HIR": None, "HDR": None, "SIR": None, "SDR": None, "TIR": None, "TDR": None}
@@ -165,18 +218,24 @@ class SVFParser:
     def _try(self, action, *args):
         try:
             old_position = self._lexer.position
+            self._trying += 1
             return action(*args)
         except SVFParsingError as e:
             self._lexer.position = old_position
             return None
+        finally:
+            self._trying -= 1
 
     def _parse_token(self):
-        self._position = self._lexer.position
         self._token    = self._lexer.next()
+        self._position = self._lexer.token_position
         # print("token %s @ %d" % (self._token, self._position))
         return self._token
 
     def _parse_error(self, error):
+        if self._trying:
+            # The error will be discarded; don't spend time locating it.
+            raise SVFParsingError(error)
         raise SVFParsingError("%s at line %d, column %d"
                               % (error, *self._lexer.line_column(self._position)))
 
@@ -256,15 +315,14 @@ class SVFParser:
             self._parse_error("scan data length %d exceeds command length %d"
                               % (len(value), length))
 
-        if length > len(value):
-            return value + bits(0, length - len(value))
-        else:
-            return value[:length]
+        # Padding or truncating in one step avoids copying large scan data twice.
+        return bits(value, length)
 
     def parse_command(self):
         self._cmd_pos = self._lexer.position
 
         command = self._parse_token()
+        self._cmd_start = self._position
         if command is None:
             return False
 
@@ -443,6 +501,11 @@ class SVFParser:
     def last_command(self):
         return self._lexer.buffer[self._cmd_pos:self._lexer.position]
 
+    def last_command_line(self):
+        """Return the line on which the last parsed command starts."""
+        line, _ = self._lexer.line_column(self._cmd_start)
+        return line
+
     def parse_file(self):
         while self.parse_command(): pass
 
@@ -514,6 +577,8 @@ class SVFEventHandler(metaclass=ABCMeta):
 
 # -------------------------------------------------------------------------------------------------
 
+import mmap
+import tempfile
 import unittest
 
 
@@ -521,6 +586,8 @@ class SVFLexerTestCase(unittest.TestCase):
     def assertLexes(self, source, tokens):
         self.lexer = SVFLexer(source)
         self.assertEqual(list(self.lexer), tokens)
+        self.lexer = SVFLexer(source.encode("ascii"))
+        self.assertEqual(list(self.lexer), tokens)
 
     def test_eof(self):
         self.assertLexes("", [])
@@ -574,6 +641,26 @@ class SVFLexerTestCase(unittest.TestCase):
     def test_error(self):
         with self.assertRaises(SVFParsingError):
             SVFLexer("XXX").next()
+        with self.assertRaisesRegex(SVFParsingError, r"at line 2, column 3 \(XXX\.\.\.\)"):
+            lexer = SVFLexer(b"TRST\n  XXX")
+            lexer.next()
+            lexer.next()
+
+    def test_line_column(self):
+        lexer = SVFLexer("A\nBC\n\nD")
+        self.assertEqual(lexer.line_column(0), (1, 1))
+        self.assertEqual(lexer.line_column(3), (2, 2))
+        self.assertEqual(lexer.line_column(6), (4, 1))
+        self.assertEqual(lexer.line_column(2), (2, 1))
+
+    def test_mmap(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(b"TRST OFF;\n// comment\nSIR 8 TDI (a\n5);\n")
+            f.flush()
+            lexer = SVFLexer(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            self.assertEqual(list(lexer), ["TRST", "OFF", ";", "SIR", 8, "TDI",
+                                           bits("10100101"), ";"])
+            self.assertEqual(lexer.line_column(), (5, 1))
 
 
 class SVFMockEventHandler:
@@ -873,6 +960,15 @@ class SVFParserTestCase(unittest.TestCase):
         parser.parse_command()
         self.assertEqual(parser.last_command(), " SIR 8 TDI (aa);")
 
+    def test_last_command_line(self):
+        handler = SVFMockEventHandler()
+        parser = SVFParser(b"TRST OFF;\n! comment\n\nSIR 8\nTDI (aa);", handler)
+        parser.parse_command()
+        self.assertEqual(parser.last_command_line(), 1)
+        parser.parse_command()
+        self.assertEqual(parser.last_command(), b"\n! comment\n\nSIR 8\nTDI (aa);")
+        self.assertEqual(parser.last_command_line(), 4)
+
 # -------------------------------------------------------------------------------------------------
 
 class SVFPrintingEventHandler:
@@ -26,6 +26,9 @@ class VGMStreamPlayer:
     async def wait_seconds(self, delay):
         raise NotImplementedError("VGMStream.wait_seconds not implemented")
 
+    async def wait_samples(self, count):
+        await self.wait_seconds(Fraction(count, SAMPLE_RATE))
+
 
 class VGMStreamReader:
     @classmethod
@@ -159,31 +162,41 @@ class VGMStreamReader:
         return chips
 
     async def parse_data(self, player):
-        while True:
-            command = self._read0("B")
-            if command == 0x54:
-                await player.ym2151_write(*self._read("BB"))
-            elif command == 0x5A:
-                await player.ym3812_write(*self._read("BB"))
-            elif command == 0x5B:
-                await player.ym3526_write(*self._read("BB"))
-            elif command in (0x5E, 0x5F):
-                address, data = self._read("BB")
-                await player.ymf262_write(address|((command & 1) << 8), data)
-            elif command == 0x61:
-                samples = self._read0("<H")
-                await player.wait_seconds(Fraction(samples, SAMPLE_RATE))
-            elif command == 0x62:
-                samples = 735
-                await player.wait_seconds(Fraction(samples, SAMPLE_RATE))
-            elif command == 0x63:
-                samples = 882
-                await player.wait_seconds(Fraction(samples, SAMPLE_RATE))
-            elif command == 0x66:
-                break
-            elif command in range(0x70, 0x80):
-                samples = (command & 0xf) + 1
-                await player.wait_seconds(Fraction(samples, SAMPLE_RATE))
-            else:
-                raise NotImplementedError("Unknown VGM command {:#04x} at stream offset {}"
-                                          .format(command, self._input.tell() - 1))
+        # Reading the command stream all at once is much faster than reading it command by
+        # command, and VGM files are small.
+        start  = self._input.tell()
+        data   = self._input.read()
+        offset = 0
+        try:
+            while True:
+                command = data[offset]
+                offset += 1
+                if command == 0x54:
+                    await player.ym2151_write(data[offset], data[offset + 1])
+                    offset += 2
+                elif command == 0x5A:
+                    await player.ym3812_write(data[offset], data[offset + 1])
+                    offset += 2
+                elif command == 0x5B:
+                    await player.ym3526_write(data[offset], data[offset + 1])
+                    offset += 2
+                elif command in (0x5E, 0x5F):
+                    await player.ymf262_write(data[offset]|((command & 1) << 8), data[offset + 1])
+                    offset += 2
+                elif command == 0x61:
+                    samples, = struct.unpack_from("<H", data, offset)
+                    offset += 2
+                    await player.wait_samples(samples)
+                elif command == 0x62:
+                    await player.wait_samples(735)
+                elif command == 0x63:
+                    await player.wait_samples(882)
+                elif command == 0x66:
+                    break
+                elif command in range(0x70, 0x80):
+                    await player.wait_samples((command & 0xf) + 1)
+                else:
+                    raise NotImplementedError("Unknown VGM command {:#04x} at stream offset {}"
+                                              .format(command, start + offset - 1))
+        except (IndexError, struct.error):
+            raise ValueError("VGM command stream is truncated")
@@ -0,0 +1,243 @@
+import os
+import sys
+import logging
+import tempfile
+
+
+__all__ = ["GlasgowFileCache", "GlasgowBitstreamCache", "default_cache_dir"]
+
+
+logger = logging.getLogger(__name__)
+
+
+def default_cache_dir(name):
+    """
+    Return the per-user directory where Glasgow caches data of kind ``name``.
+    """
+    if sys.platform == "win32" and "LOCALAPPDATA" in os.environ:
+        base_dir = os.environ["LOCALAPPDATA"]
+    elif "XDG_CACHE_HOME" in os.environ:
+        base_dir = os.environ["XDG_CACHE_HOME"]
+    else:
+        base_dir = os.path.expanduser("~/.cache")
+    return os.path.join(base_dir, "glasgow", name)
+
+
+def _default_cache_dir():
+    if "GLASGOW_CACHE_DIR" in os.environ:
+        return os.environ["GLASGOW_CACHE_DIR"]
+    return default_cache_dir("bitstreams")
+
+
+class GlasgowFileCache:
+    """
+    An on-disk content-addressed cache of files.
+
+    Entries are addressed by a string ``key``, normally a hex digest of everything that determines
+    the contents of the entry, so an entry never has to be invalidated. Entries are stored as
+    ``<key><suffix>`` files in ``cache_dir``; the least recently used ones are evicted once
+    the total size of the cache exceeds ``max_size`` bytes.
+    """
+    suffix = ".bin"
+
+    def __init__(self, cache_dir, *, max_size):
+        self.cache_dir = cache_dir
+        self.max_size  = max_size
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return []
+
+        entries = []
+        for name in names:
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue # evicted concurrently
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def __contains__(self, key):
+        return os.path.exists(self._entry_path(key))
+
+    def open(self, key):
+        """
+        Return a file with the contents of the entry ``key``, or ``None`` if it is not cached.
+        """
+        path = self._entry_path(key)
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        # Use modification time to track recency of use; access time is often not updated.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return file
+
+    def get(self, key):
+        """
+        Return the contents of the entry ``key``, or ``None`` if it is not cached.
+        """
+        file = self.open(key)
+        if file is None:
+            return None
+        with file:
+            return file.read()
+
+    def put(self, key, data):
+        """
+        Store ``data`` as the entry ``key``, evicting old entries if necessary. Data larger than
+        the entire cache is not stored.
+        """
+        if len(data) > self.max_size:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temporary file first, so that concurrent processes never observe
+        # a partially written entry.
+        fd, temp_path = tempfile.mkstemp(prefix=".glasgow_", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self._entry_path(key))
+        except:
+            os.unlink(temp_path)
+            raise
+        self.evict()
+
+    def discard(self, key):
+        """
+        Remove the entry ``key`` from the cache, if it is present.
+        """
+        try:
+            os.unlink(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """
+        Remove least recently used entries until the total size of the cache does not exceed
+        ``max_size`` bytes.
+        """
+        entries = sorted(self._entries())
+        total_size = sum(size for _, size, _ in entries)
+        while entries and total_size > self.max_size:
+            _, size, path = entries.pop(0)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            logger.debug("evicted %s from cache %s", os.path.basename(path), self.cache_dir)
+            total_size -= size
+
+
+class GlasgowBitstreamCache(GlasgowFileCache):
+    """
+    An on-disk cache of built bitstreams, addressed by bitstream ID.
+
+    Since the bitstream ID is a digest of the complete build plan, a bitstream with a given ID
+    never has to be built twice. Entries are stored as ``<bitstream-id>.bin`` files.
+    """
+    def __init__(self, cache_dir=None, *, max_size=64 * 1024 * 1024):
+        super().__init__(cache_dir or _default_cache_dir(), max_size=max_size)
+
+    def __contains__(self, bitstream_id):
+        return super().__contains__(bitstream_id.hex())
+
+    def get(self, bitstream_id):
+        """
+        Retrieve the bitstream with ID ``bitstream_id``, or ``None`` if it is not cached.
+        """
+        bitstream = super().get(bitstream_id.hex())
+        if bitstream is None:
+            logger.debug("bitstream cache miss for ID %s", bitstream_id.hex())
+        else:
+            logger.debug("bitstream cache hit for ID %s", bitstream_id.hex())
+        return bitstream
+
+    def put(self, bitstream_id, bitstream):
+        """
+        Store ``bitstream`` with ID ``bitstream_id``, evicting old entries if necessary.
+        """
+        super().put(bitstream_id.hex(), bitstream)
+        logger.debug("bitstream ID %s added to cache", bitstream_id.hex())
+
+    def discard(self, bitstream_id):
+        """
+        Remove the bitstream with ID ``bitstream_id`` from the cache, if it is present.
+        """
+        super().discard(bitstream_id.hex())
+
+# -------------------------------------------------------------------------------------------------
+
+import unittest
+
+
+class GlasgowBitstreamCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = GlasgowBitstreamCache(self.temp_dir.name, max_size=10)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get(b"\x01" * 16))
+        self.assertNotIn(b"\x01" * 16, self.cache)
+
+    def test_hit(self):
+        self.cache.put(b"\x01" * 16, b"abcd")
+        self.assertIn(b"\x01" * 16, self.cache)
+        self.assertEqual(self.cache.get(b"\x01" * 16), b"abcd")
+
+    def test_discard(self):
+        self.cache.put(b"\x01" * 16, b"abcd")
+        self.cache.discard(b"\x01" * 16)
+        self.assertIsNone(self.cache.get(b"\x01" * 16))
+        self.cache.discard(b"\x01" * 16)
+
+    def test_evict_lru(self):
+        self.cache.put(b"\x01" * 16, b"abcd")
+        os.utime(self.cache._entry_path((b"\x01" * 16).hex()), (1, 1))
+        self.cache.put(b"\x02" * 16, b"efgh")
+        os.utime(self.cache._entry_path((b"\x02" * 16).hex()), (2, 2))
+        self.cache.get(b"\x01" * 16)
+        self.cache.put(b"\x03" * 16, b"ijkl")
+        self.assertIn(b"\x01" * 16, self.cache)
+        self.assertNotIn(b"\x02" * 16, self.cache)
+        self.assertIn(b"\x03" * 16, self.cache)
+
+
+class GlasgowFileCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = GlasgowFileCache(self.temp_dir.name, max_size=10)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_open(self):
+        self.assertIsNone(self.cache.open("a"))
+        self.cache.put("a", b"abcd")
+        with self.cache.open("a") as f:
+            self.assertEqual(f.read(), b"abcd")
+
+    def test_suffix(self):
+        self.cache.suffix = ".pcm"
+        self.cache.put("a", b"abcd")
+        self.assertEqual(os.listdir(self.temp_dir.name), ["a.pcm"])
+
+    def test_too_large(self):
+        self.cache.put("a", b"abcd")
+        self.cache.put("b", b"too large to cache")
+        self.assertNotIn("b", self.cache)
+        self.assertIn("a", self.cache)
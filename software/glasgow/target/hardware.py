@@ -111,7 +111,13 @@ class GlasgowBuildPlan:
     def archive(self, filename):
         self.lower.archive(filename)
 
-    def execute(self, build_dir=None, *, debug=False):
+    def execute(self, build_dir=None, *, debug=False, cache=None):
+        if cache is not None:
+            bitstream = cache.get(self.bitstream_id)
+            if bitstream is not None:
+                logger.info("using cached bitstream ID %s", self.bitstream_id.hex())
+                return bitstream
+
         if build_dir is None:
             build_dir = tempfile.mkdtemp(prefix="glasgow_")
         try:
@@ -124,4 +130,6 @@ class GlasgowBuildPlan:
         finally:
             if not debug:
                 shutil.rmtree(build_dir)
+        if cache is not None:
+            cache.put(self.bitstream_id, bitstream)
         return bitstream